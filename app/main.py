@@ -1,10 +1,33 @@
 # app/main.py
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import files
+from app.services import executor, jobs, logs, metrics, storage, warmup
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logs.configurar()
+    await jobs.iniciar()
+    storage.iniciar_limpieza(files.ARTEFACTOS, files.uploads_en_uso)
+    # Opcional (DXF_WARMUP=1): levantar y precargar el pool en segundo plano
+    calentamiento = asyncio.create_task(warmup.calentar_pool()) if warmup.WARMUP else None
+    yield
+    if calentamiento is not None:
+        calentamiento.cancel()
+    # Detener los trabajos y cerrar el pool de procesos al apagar el servidor
+    await storage.detener_limpieza()
+    await jobs.detener()
+    executor.cerrar()
+    logs.detener()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",   # para desarrollo
@@ -20,8 +43,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Mide cada petición y devuelve las etapas en la cabecera Server-Timing."""
+    inicio = time.perf_counter()
+    with metrics.medir() as mediciones:
+        response = await call_next(request)
+        total = time.perf_counter() - inicio
+        response.headers["Server-Timing"] = metrics.server_timing(mediciones, total)
+    # Por plantilla de ruta, para no crear una serie por cada file_id
+    ruta = getattr(request.scope.get("route"), "path", "otras")
+    metrics.observar("dxf_http_segundos", total, ruta=ruta, metodo=request.method)
+    return response
+
+class EstaticosConCache(StaticFiles):
+    """
+    Los archivos de app/static no tienen nombre por contenido: se cachean
+    una hora y después se revalidan con el ETag que ya pone StaticFiles.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", "public, max-age=3600")
+        return response
+
 # Servir archivos generados (PNG/PDF)
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+app.mount("/static", EstaticosConCache(directory="app/static"), name="static")
 
 # Rutas de archivos
 app.include_router(files.router)
@@ -29,3 +76,7 @@ app.include_router(files.router)
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+@app.get("/metrics")
+def metricas():
+    return PlainTextResponse(metrics.exportar(), media_type="text/plain; version=0.0.4")
@@ -1,17 +1,121 @@
 # app/routers/files.py
-from app.services.dxf_processor import process_dxf_file, generate_dxf_plot
+from app.services.dxf_processor import (
+    MODO_NESTING,
+    MODOS_NESTING,
+    Metro_perimetro_corte,
+    analizar_dxf,
+    cotizar_geometria,
+    cotizar_lote,
+    generate_dxf_plot,
+    renderizar_previews,
+)
+from app.services.executor import ejecutar, PoolSaturado, TiempoAgotado
+from app.services import executor, geometry_store, jobs, storage
+from app.services.cache import CacheLRU, SingleFlight
+from app.services.metrics import registrar_colector, span
+from app.services.nesting import (
+    KERF_MM,
+    MATERIALES_SIN_ROTACION,
+    PRESUPUESTO_PEDIDO_S,
+)
+from app.services.sheet_catalog import anidar_pedido_catalogo, imagen_hoja, version_catalogo
+from app.services.preflight import Escaneo, escanear
+from app.schemas import DXFProcessResponse, PedidoNesting, TrabajoAceptado
+from app.services.preview import PREVIEW_PX
+from app.services.storage import MAX_UPLOAD_BYTES, ArchivoDemasiadoGrande, guardar_upload, registrar_acceso
+import asyncio
+import hashlib
+import json
+import logging
 import os
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import FileResponse, JSONResponse
-from fpdf import FPDF
+import re
+import tempfile
+from urllib.parse import quote
+from fastapi import APIRouter, UploadFile, File, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 
 
 STATIC_DIR = "static"
 os.makedirs(STATIC_DIR, exist_ok=True)
+NESTING_DIR = os.path.join(STATIC_DIR, "nesting")
+os.makedirs(NESTING_DIR, exist_ok=True)
+PREVIEW_DIR = os.path.join(STATIC_DIR, "previews")
+os.makedirs(PREVIEW_DIR, exist_ok=True)
+UPLOAD_DIR = os.path.join(STATIC_DIR, "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+PDF_DIR = os.path.join(STATIC_DIR, "pdfs")
+os.makedirs(PDF_DIR, exist_ok=True)
+
+# Directorios con nombres direccionados por contenido que la limpieza
+# periódica mantiene acotados (ver storage.limpiar_artefactos)
+ARTEFACTOS = (UPLOAD_DIR, PREVIEW_DIR, NESTING_DIR, PDF_DIR)
+
+# El contenido de una URL de artefacto nunca cambia: el cliente no revalida
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+# Cambia cuando cambia el diseño del PDF, para no servir versiones viejas
+VERSION_PDF = 2
+
+# Cache de geometría (por archivo), de cotizaciones (archivo + material +
+# cantidad) y de vistas previas renderizadas (archivo + formato)
+CACHE_BYTES = int(float(os.getenv("DXF_CACHE_MB", "64")) * 1024 * 1024)
+geometrias = CacheLRU(CACHE_BYTES // 2)
+cotizaciones = CacheLRU(CACHE_BYTES // 4)
+previews = CacheLRU(CACHE_BYTES // 4)
+vuelos = SingleFlight()
+
+MEDIA_PREVIEW = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Holgura para las cabeceras multipart al comparar con Content-Length
+CHUNK_MARGEN = 64 * 1024
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def _metricas() -> list:
+    """Estado de caches, pool y cola de trabajos para /metrics."""
+    series = []
+    for nombre, cache in (("geometria", geometrias), ("cotizaciones", cotizaciones), ("previews", previews)):
+        s = cache.stats()
+        series += [
+            ("dxf_cache_hits_total", {"cache": nombre}, s["hits"]),
+            ("dxf_cache_misses_total", {"cache": nombre}, s["misses"]),
+            ("dxf_cache_evictions_total", {"cache": nombre}, s["evictions"]),
+            ("dxf_cache_bytes", {"cache": nombre}, s["bytes"]),
+        ]
+    a = storage.stats()
+    series += [
+        ("dxf_artefactos_archivos", {}, a["archivos"]),
+        ("dxf_artefactos_bytes", {}, a["bytes"]),
+        ("dxf_artefactos_borrados_total", {}, a["borrados"]),
+    ]
+    g = geometry_store.stats()
+    if g["activo"]:
+        series += [
+            ("dxf_almacen_geometrias_entradas", {}, g["entradas"]),
+            ("dxf_almacen_geometrias_bytes", {}, g["bytes"]),
+        ]
+    j = jobs.stats()
+    series += [
+        ("dxf_single_flight_compartidas_total", {}, vuelos.stats()["compartidas"]),
+        ("dxf_pool_en_vuelo", {}, executor.en_vuelo()),
+        ("dxf_jobs_en_cola", {}, j["en_cola"]),
+    ]
+    return series
+
+
+registrar_colector(_metricas)
+
+
+@span("pdf")
+def generate_pdf(out_path: str, result: dict, preview_png: bytes | None = None) -> str:
+    """
+    Escribe el PDF de la cotización en `out_path`. La vista previa llega
+    como bytes PNG (del cache de renders), no se lee de static/.
+    """
+    from fpdf import FPDF
 
-def generate_pdf(file_name: str, result: dict) -> str:
     pdf = FPDF()
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
@@ -47,7 +151,8 @@ def generate_pdf(file_name: str, result: dict) -> str:
         f"Material: {result.get('material','N/A')}\n"
         f"Cantidad: {result.get('cantidad',1)}\n"
         f"Dimensiones: {result['ancho']:.0f} x {result['alto']:.0f} mm\n"
-        f"Perímetro: {result['total_perimeter']:.0f} mm"
+        f"Perímetro: {result['total_perimeter']:.0f} mm\n"
+        f"Perforaciones: {result.get('perforaciones', 0)}"
     )
 
     # Columna derecha
@@ -57,7 +162,8 @@ def generate_pdf(file_name: str, result: dict) -> str:
         f"Costo Bruto: {result['costo_bruto']:.0f} COP\n"
         f"Costo Material: {result['costo_material']:.0f} COP\n"
         f"Costo Corte: {result['costo_corte']:.0f} COP\n"
-        f"Costo Doblez: {result['costo_doblez']:.0f} COP"
+        f"Costo Doblez: {result['costo_doblez']:.0f} COP\n"
+        f"Lámina: {result.get('hoja', {}).get('nombre', 'N/A')}"
     )
 
     pdf.ln(5)
@@ -70,41 +176,532 @@ def generate_pdf(file_name: str, result: dict) -> str:
     pdf.ln(10)
 
     # ==== Preview ====
-    if "preview" in result:
-        preview_path = os.path.join("static", result["preview"])
-        if os.path.exists(preview_path):
+    # FPDF 1.7 solo lee imágenes desde un archivo: temporal solo mientras se arma
+    temporal_png = None
+    if preview_png:
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+            f.write(preview_png)
+            temporal_png = f.name
+    try:
+        if temporal_png:
             pdf.set_font("Arial", "B", 12)
             pdf.cell(0, 10, "Vista previa de la pieza:", ln=True)
-            pdf.image(preview_path, x=25, w=160)  # ancho ajustado
+            pdf.image(temporal_png, x=25, w=160)  # ancho ajustado
 
-    # Guardar PDF
-    out_path = os.path.join("static", f"{file_name}.pdf")
-    pdf.output(out_path)
+        # Guardar PDF
+        temporal = f"{out_path}.{os.getpid()}.tmp"
+        pdf.output(temporal)
+        os.replace(temporal, out_path)
+    finally:
+        if temporal_png:
+            os.remove(temporal_png)
     return out_path
 
-@router.post("/files/upload/")
-async def upload_file(file: UploadFile = File(...), material: str = "CR18", cantidad: int = 1):
+def _ruta_preview(file_id: str, formato: str) -> str:
+    return os.path.join(PREVIEW_DIR, f"{file_id}.{formato}")
+
+
+def _guardar_preview(file_id: str, formato: str, contenido: bytes):
+    ruta = _ruta_preview(file_id, formato)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+async def _guardar_previews(file_id: str, resultado: dict):
+    """Las vistas previas van a su propio cache (y a disco), no a la geometría."""
+    for formato in MEDIA_PREVIEW:
+        contenido = resultado.pop(f"preview_{formato}", None)
+        if contenido is not None:
+            previews.put((file_id, formato), contenido)
+            await asyncio.to_thread(_guardar_preview, file_id, formato, contenido)
+
+
+async def _geometria_guardada(file_id: str) -> dict | None:
+    """
+    Análisis de un archivo ya procesado por este worker (cache en memoria)
+    o por cualquier otro proceso, aun antes de un reinicio (geometry_store).
+    """
+    geometria = geometrias.get(file_id)
+    if geometria is None:
+        geometria = await asyncio.to_thread(geometry_store.cargar_resumen, file_id)
+        if geometria is not None:
+            geometrias.put(file_id, geometria)
+    if geometria is not None:
+        registrar_acceso(os.path.join(UPLOAD_DIR, f"{file_id}.dxf"))
+    return geometria
+
+
+def uploads_en_uso() -> set[str]:
+    """
+    Uploads con un análisis o una cotización en memoria: sus PDFs y anidados
+    se pueden pedir todavía, así que la limpieza no los borra.
+    """
+    ids = set(geometrias.claves()) | {clave[0] for clave in cotizaciones.claves()}
+    return {os.path.join(UPLOAD_DIR, f"{file_id}.dxf") for file_id in ids}
+
+
+async def _geometria(file_id: str, file_path: str, avance=None, simplificada: bool = False) -> dict:
+    registrar_acceso(file_path)
+    # Un análisis simplificado no sirve para una cotización completa ni al revés
+    geometria = geometrias.get(file_id)
+    if geometria is not None and geometria.get("simplificada", False) == simplificada:
+        return geometria
+
+    async def calcular():
+        geometria = await asyncio.to_thread(geometry_store.cargar_resumen, file_id)
+        if geometria is None or geometria.get("simplificada", False) != simplificada:
+            geometria = await ejecutar(analizar_dxf, file_path, PREVIEW_PX, avance, simplificada)
+            await _guardar_previews(file_id, geometria)
+            await asyncio.to_thread(geometry_store.guardar_resumen, file_id, geometria)
+        geometrias.put(file_id, geometria)
+        return geometria
+
+    return await vuelos.ejecutar(("geometria", file_id, simplificada), calcular)
+
+
+async def _cotizacion(file_id: str, file_path: str, material: str, cantidad: int,
+                      modo_nesting: str = MODO_NESTING, trabajo=None, simplificada: bool = False) -> dict:
+    registrar_acceso(file_path)
+    clave = (file_id, material, cantidad, modo_nesting, simplificada)
+    result = cotizaciones.get(clave)
+    if result is None:
+        async def calcular():
+            geometria = await _geometria(file_id, file_path, trabajo.reportero() if trabajo else None,
+                                         simplificada)
+            if trabajo:
+                trabajo.avanzar("cotizacion")
+            result = await ejecutar(cotizar_geometria, geometria, material, cantidad, modo_nesting)
+            cotizaciones.put(clave, result)
+            return result
+
+        result = await vuelos.ejecutar(("cotizacion",) + clave, calcular)
+    # Copia: el resultado cacheado no debe modificarse
+    return dict(result)
+
+
+async def _procesar_upload(file_id: str, file_path: str, file_name: str, material: str, cantidad: int,
+                           modo_nesting: str, trabajo=None, simplificada: bool = False) -> dict:
+    """Cotización completa de un archivo ya guardado: geometría, precio y vista previa."""
+    result = await _cotizacion(file_id, file_path, material, cantidad, modo_nesting, trabajo, simplificada)
+    result["file_id"] = file_id
+    # La imagen del anidado y el PDF se generan solo si el cliente los pide
+    result["nesting_png_url"] = (
+        f"/files/nesting/{file_id}.png?material={quote(material, safe='')}"
+        f"&modo_nesting={quote(result['modo_nesting'], safe='')}"
+    )
+    result["pdf_url"] = (
+        f"/files/download_pdf/{quote(file_name, safe='')}?file_id={file_id}"
+        f"&material={quote(material, safe='')}&cantidad={cantidad}&modo_nesting={quote(modo_nesting, safe='')}"
+    )
+    if simplificada:
+        result["pdf_url"] += "&simplificada=true"
+
+    if PREVIEW_PX and not os.path.exists(_ruta_preview(file_id, "png")):
+        # El análisis salió de un cache pero la vista previa ya no está en
+        # disco: se renderiza desde la geometría guardada
+        async def renderizar():
+            await _guardar_previews(file_id, await ejecutar(renderizar_previews, file_path, PREVIEW_PX))
+
+        await vuelos.ejecutar(("preview", file_id), renderizar)
+    if os.path.exists(_ruta_preview(file_id, "png")):
+        result["preview_png_url"] = f"/files/preview/{file_id}.png"
+        result["preview_svg_url"] = f"/files/preview/{file_id}.svg"
+    return result
+
+
+async def _recibir_upload(request: Request, file: UploadFile):
+    """
+    Guarda el upload por bloques con nombre direccionado por contenido
+    (sha256). Devuelve (ruta, file_id) o una respuesta de error.
+    """
+    # Rechazo temprano si el cliente declara un cuerpo demasiado grande
+    declarado = request.headers.get("content-length")
+    if declarado and declarado.isdigit() and int(declarado) > MAX_UPLOAD_BYTES + CHUNK_MARGEN:
+        return JSONResponse(content={"error": "El archivo es demasiado grande."}, status_code=413)
+    try:
+        with span("upload"):
+            file_path, file_id, _ = await guardar_upload(file, UPLOAD_DIR)
+    except ArchivoDemasiadoGrande as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    return file_path, file_id
+
+
+def _prefiere_asincrono(request: Request) -> bool:
+    """El cliente acepta un 202 con un trabajo (`Prefer: respond-async`, RFC 7240)."""
+    preferencias = request.headers.get("prefer", "").split(",")
+    return any(p.split(";")[0].strip().lower() == "respond-async" for p in preferencias)
+
+
+@router.post("/files/upload/", responses={
+    200: {"model": DXFProcessResponse},
+    202: {"model": TrabajoAceptado, "description": "Solo con `Prefer: respond-async` y un archivo pesado."},
+})
+async def upload_file(request: Request, file: UploadFile = File(...), material: str = "CR18", cantidad: int = 1,
+                      modo_nesting: str = MODO_NESTING):
+    """
+    Cotiza el DXF y responde con el resultado. El preflight rechaza con 422
+    los archivos inválidos o fuera de los límites (y el análisis, los que
+    miden más de DXF_MAX_EXTENSION_MM); los pesados se procesan
+    igual en la petición (los más pesados, con la geometría simplificada)
+    salvo que el cliente envíe `Prefer: respond-async`: entonces se
+    encolan y la respuesta es 202 con el trabajo (como /files/jobs).
+    """
     file_name = os.path.splitext(file.filename)[0]
-    file_path = os.path.join(STATIC_DIR, file.filename)
+    recibido = await _recibir_upload(request, file)
+    if isinstance(recibido, JSONResponse):
+        return recibido
+    file_path, file_id = recibido
+
+    escaneo = None
+    try:
+        escaneo, simplificada = await _preflight(file_id, file_path)
+        if escaneo is not None and escaneo.ruta == "rechazado":
+            return JSONResponse(content={"error": escaneo.motivo, "preflight": escaneo.resumen()}, status_code=422)
+        if escaneo is not None and escaneo.ruta != "sincrono" and _prefiere_asincrono(request):
+            # Demasiado pesado para esperar en la petición y el cliente acepta un trabajo
+            respuesta = _encolar(file_id, file_path, file_name, material, cantidad, modo_nesting, escaneo)
+            if respuesta.status_code == 202:
+                respuesta.headers["Preference-Applied"] = "respond-async"
+            return respuesta
+        result = await _procesar_upload(file_id, file_path, file_name, material, cantidad, modo_nesting,
+                                        simplificada=simplificada)
+    except PoolSaturado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except TiempoAgotado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except ValueError as e:
+        # Archivo que no se puede cotizar (p. ej. más grande que DXF_MAX_EXTENSION_MM)
+        contenido = {"status": "failed", "error": str(e)}
+        if escaneo is not None:
+            contenido["preflight"] = escaneo.resumen()
+        return JSONResponse(content=contenido, status_code=422)
+    except Exception as e:
+        logger.exception("Error procesando el upload", extra={"datos": {"file_id": file_id}})
+        return JSONResponse(content={"status": "failed", "error": str(e)})
+
+    if escaneo is not None:
+        result["preflight"] = escaneo.resumen()
+    return JSONResponse(content=result)
+
+
+# Reintentos de un trabajo cuando el pool de procesos está lleno
+REINTENTOS_POOL = 20
+ESPERA_REINTENTO_S = 1.0
+
 
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+async def _preflight(file_id: str, file_path: str) -> tuple[Escaneo | None, bool]:
+    """
+    Escaneo previo del archivo (ver preflight.escanear) y si hay que
+    analizarlo simplificado. Si su análisis ya está en memoria no hay nada
+    pesado que hacer: se devuelve None y el modo con que se analizó.
+    """
+    geometria = geometrias.get(file_id)
+    if geometria is not None:
+        return None, geometria.get("simplificada", False)
+    escaneo = await ejecutar(escanear, file_path)
+    return escaneo, escaneo.ruta == "simplificado"
 
-    # Procesar DXF
-    result = process_dxf_file(file_path, material, cantidad)
 
-    # Añadir referencia al preview
-    result["preview"] = f"{file_name}.png"
+def _encolar(file_id: str, file_path: str, file_name: str, material: str, cantidad: int,
+             modo_nesting: str, escaneo: Escaneo | None = None) -> JSONResponse:
+    """
+    Deja la cotización en la cola de trabajos y responde 202 con su id. Sin
+    `escaneo` el preflight se hace dentro del trabajo; si rechaza el
+    archivo, el trabajo falla con el motivo.
+    """
+    async def procesar(trabajo):
+        for intento in range(REINTENTOS_POOL):
+            try:
+                actual, simplificada = ((escaneo, escaneo.ruta == "simplificado") if escaneo is not None
+                                        else await _preflight(file_id, file_path))
+                if actual is not None and actual.ruta == "rechazado":
+                    raise ValueError(actual.motivo)
+                result = await _procesar_upload(file_id, file_path, file_name, material, cantidad,
+                                                modo_nesting, trabajo, simplificada)
+                if actual is not None:
+                    result["preflight"] = actual.resumen()
+                return result
+            except PoolSaturado:
+                if intento == REINTENTOS_POOL - 1:
+                    raise
+                await asyncio.sleep(ESPERA_REINTENTO_S)
 
-    # Generar PDF
-    generate_pdf(file_name, result)
+    try:
+        trabajo = jobs.encolar(procesar)
+    except jobs.ColaLlena as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
 
+    contenido = trabajo.resumen()
+    contenido["file_id"] = file_id
+    contenido["status_url"] = f"/files/jobs/{trabajo.id}"
+    contenido["events_url"] = f"/files/jobs/{trabajo.id}/events"
+    if escaneo is not None:
+        contenido["preflight"] = escaneo.resumen()
+    return JSONResponse(content=contenido, status_code=202)
+
+
+@router.post("/files/jobs", status_code=202, responses={202: {"model": TrabajoAceptado}})
+async def crear_job(request: Request, file: UploadFile = File(...), material: str = "CR18", cantidad: int = 1,
+                    modo_nesting: str = MODO_NESTING):
+    """
+    Igual que /files/upload/ pero sin esperar el resultado: responde de
+    inmediato con el id del trabajo. El avance se consulta en
+    /files/jobs/{job_id} o se sigue por SSE en /files/jobs/{job_id}/events.
+    """
+    file_name = os.path.splitext(file.filename)[0]
+    recibido = await _recibir_upload(request, file)
+    if isinstance(recibido, JSONResponse):
+        return recibido
+    file_path, file_id = recibido
+    return _encolar(file_id, file_path, file_name, material, cantidad, modo_nesting)
+
+
+@router.get("/files/jobs/{job_id}")
+async def estado_job(job_id: str):
+    trabajo = jobs.obtener(job_id)
+    if trabajo is None:
+        return JSONResponse(content={"error": "Trabajo no encontrado"}, status_code=404)
+    return JSONResponse(content=trabajo.resumen())
+
+
+@router.get("/files/jobs/{job_id}/events")
+async def eventos_job(job_id: str):
+    trabajo = jobs.obtener(job_id)
+    if trabajo is None:
+        return JSONResponse(content={"error": "Trabajo no encontrado"}, status_code=404)
+    return StreamingResponse(
+        trabajo.eventos_sse(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/files/quote/batch")
+async def quote_batch(request: Request, file: UploadFile = File(...), materiales: str | None = None,
+                      cantidades: str = "1,10,100", modo_nesting: str = MODO_NESTING):
+    """
+    Cotiza un DXF para varios materiales y cantidades a la vez. `materiales`
+    y `cantidades` van separados por comas; sin materiales se usan todos.
+    `modo_nesting` es "rect" (rectángulo envolvente) o "forma" (silueta).
+    """
+    lista_materiales = [m.strip() for m in materiales.split(",") if m.strip()] if materiales else list(Metro_perimetro_corte)
+    try:
+        lista_cantidades = [int(c) for c in cantidades.split(",") if c.strip()]
+    except ValueError:
+        return JSONResponse(content={"error": "Cantidades inválidas"}, status_code=422)
+
+    recibido = await _recibir_upload(request, file)
+    if isinstance(recibido, JSONResponse):
+        return recibido
+    file_path, file_id = recibido
+
+    try:
+        # Sin cola de trabajos para el lote: la ruta "trabajo" se procesa aquí
+        escaneo, simplificada = await _preflight(file_id, file_path)
+        if escaneo is not None and escaneo.ruta == "rechazado":
+            return JSONResponse(content={"error": escaneo.motivo, "preflight": escaneo.resumen()}, status_code=422)
+        # Un solo análisis del archivo; el modelo de costos se evalúa en bloque
+        geometria = await _geometria(file_id, file_path, simplificada=simplificada)
+        result = await ejecutar(cotizar_lote, geometria, lista_materiales, lista_cantidades, modo_nesting)
+    except PoolSaturado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except TiempoAgotado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except ValueError as e:
+        return JSONResponse(content={"status": "failed", "error": str(e)}, status_code=422)
+    except Exception as e:
+        return JSONResponse(content={"status": "failed", "error": str(e)})
+
+    result["file_id"] = file_id
+    if escaneo is not None:
+        result["preflight"] = escaneo.resumen()
+    return JSONResponse(content=result)
+
+
+def _artefacto(request: Request, etag: str, media_type: str, ruta: str, contenido: bytes | None = None):
+    """
+    Respuesta para un artefacto inmutable: 304 si el cliente ya lo tiene,
+    si no el contenido en memoria o el archivo en disco.
+    """
+    registrar_acceso(ruta)
+    cabeceras = {"ETag": f'"{etag}"', "Cache-Control": CACHE_INMUTABLE}
+    if _coincide_etag(request, cabeceras["ETag"]):
+        return Response(status_code=304, headers=cabeceras)
+    if contenido is not None:
+        return Response(content=contenido, media_type=media_type, headers=cabeceras)
+    return FileResponse(ruta, media_type=media_type, headers=cabeceras)
+
+
+@router.get("/files/preview/{file_id}.{formato}")
+async def preview(request: Request, file_id: str, formato: str):
+    if formato not in MEDIA_PREVIEW:
+        return JSONResponse(content={"error": "Formato no soportado"}, status_code=404)
+    ruta = _ruta_preview(file_id, formato)
+    contenido = previews.get((file_id, formato))
+    if contenido is None and not os.path.exists(ruta):
+        return JSONResponse(content={"error": "Archivo no encontrado"}, status_code=404)
+    # file_id es el hash del DXF: la vista previa de esta URL no cambia
+    return _artefacto(request, f"{file_id}.{formato}", MEDIA_PREVIEW[formato], ruta, contenido)
+
+
+@router.get("/files/nesting/{file_id}.png")
+async def nesting_png(request: Request, file_id: str, material: str = "CR18", modo_nesting: str = MODO_NESTING):
+    """
+    Imagen del anidado que usa la cotización: misma lámina y mismo modo
+    (con "forma", la silueta de la pieza).
+    """
+    if modo_nesting not in MODOS_NESTING:
+        return JSONResponse(content={"error": f"Modo de anidado '{modo_nesting}' no soportado."}, status_code=422)
+    geometria = await _geometria_guardada(file_id)
+    if geometria is None:
+        return JSONResponse(content={"error": "Archivo no encontrado"}, status_code=404)
+
+    rotacion = material not in MATERIALES_SIN_ROTACION
+    huella = geometria.get("huella") if modo_nesting == "forma" else None
+    modo = "forma" if huella is not None else "rect"
+    # El anidado solo depende de la pieza (y de la versión de su análisis),
+    # de la rotación, del kerf, del modo y de las láminas del material
+    etag = (f"{file_id}-{geometry_store.VERSION}-{int(rotacion)}-{KERF_MM:g}-{modo}-"
+            f"{version_catalogo(material)}")
+    if _coincide_etag(request, f'"{etag}"'):
+        return Response(status_code=304, headers={"ETag": f'"{etag}"', "Cache-Control": CACHE_INMUTABLE})
+    try:
+        ruta = await ejecutar(imagen_hoja, material, geometria["ancho"], geometria["alto"], rotacion, NESTING_DIR,
+                              KERF_MM, huella)
+    except PoolSaturado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except TiempoAgotado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=422)
+    if ruta is None:
+        return JSONResponse(content={"error": "La pieza no cabe en la lámina"}, status_code=422)
+    return _artefacto(request, etag, "image/png", ruta)
+
+
+@router.post("/files/nesting/pedido")
+async def nesting_pedido(pedido: PedidoNesting):
+    """
+    Anida varias piezas ya subidas (por file_id) con sus cantidades en
+    tantas láminas como hagan falta, del tamaño que el catálogo elige para
+    el material (ver sheet_catalog.hoja_pedido).
+    """
+    piezas = []
+    for pieza in pedido.piezas:
+        geometria = await _geometria_guardada(pieza.file_id)
+        if geometria is None:
+            return JSONResponse(content={"error": f"Archivo {pieza.file_id} no encontrado"}, status_code=404)
+        piezas.append((pieza.file_id, geometria["ancho"], geometria["alto"], pieza.cantidad))
+
+    presupuesto = pedido.presupuesto_s or PRESUPUESTO_PEDIDO_S
+    kerf = KERF_MM if pedido.kerf is None else pedido.kerf
+    rotacion = pedido.material not in MATERIALES_SIN_ROTACION
+    try:
+        # Margen sobre el presupuesto para el cierre de la última lámina
+        result = await ejecutar(anidar_pedido_catalogo, pedido.material, piezas, kerf, rotacion, presupuesto,
+                                timeout=presupuesto * 2 + 10)
+    except PoolSaturado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except TiempoAgotado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except ValueError as e:
+        return JSONResponse(content={"status": "failed", "error": str(e)}, status_code=422)
+
+    result["status"] = "success"
+    result["material"] = pedido.material
     return JSONResponse(content=result)
 
 
+@router.get("/files/cache/stats")
+async def cache_stats():
+    return {
+        "geometria": geometrias.stats(),
+        "cotizaciones": cotizaciones.stats(),
+        "previews": previews.stats(),
+        "single_flight": vuelos.stats(),
+        "jobs": jobs.stats(),
+        "artefactos": storage.stats(),
+        "almacen": geometry_store.stats(),
+    }
+
+
+def _hash_cotizacion(file_id: str, result: dict) -> str:
+    """Identifica el contenido del PDF: misma cotización del mismo archivo, mismo PDF."""
+    contenido = json.dumps([VERSION_PDF, file_id, result], sort_keys=True, default=str)
+    return hashlib.sha256(contenido.encode()).hexdigest()[:32]
+
+
+def _leer(ruta: str) -> bytes:
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+async def _preview_png(file_id: str) -> bytes | None:
+    contenido = previews.get((file_id, "png"))
+    if contenido is None and os.path.exists(_ruta_preview(file_id, "png")):
+        # El render salió del cache: queda la copia en disco
+        contenido = await asyncio.to_thread(_leer, _ruta_preview(file_id, "png"))
+    return contenido
+
+
+def _coincide_etag(request: Request, etag: str) -> bool:
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return False
+    etiquetas = [e.strip().removeprefix("W/") for e in cabecera.split(",")]
+    return "*" in etiquetas or etag in etiquetas
+
+
 @router.get("/files/download_pdf/{filename}")
-async def download_pdf(filename: str):
-    pdf_path = os.path.join(STATIC_DIR, f"{filename}.pdf")
-    if not os.path.exists(pdf_path):
+async def download_pdf(request: Request, filename: str, file_id: str | None = None, material: str = "CR18",
+                       cantidad: int = 1, modo_nesting: str = MODO_NESTING, simplificada: bool = False):
+    """
+    PDF de la cotización de un archivo ya subido (`file_id`). Se genera la
+    primera vez que se pide y queda en disco con el hash de su contenido,
+    que también es el ETag. `filename` es solo el nombre de la descarga.
+    Sin `file_id` sirve un PDF ya existente en static/ (enlaces antiguos).
+    """
+    if file_id is None:
+        pdf_path = os.path.join(STATIC_DIR, f"{filename}.pdf")
+        if not os.path.exists(pdf_path):
+            return JSONResponse(content={"error": "Archivo no encontrado"}, status_code=404)
+        return FileResponse(pdf_path, media_type="application/pdf", filename=f"{filename}.pdf")
+
+    file_path = os.path.join(UPLOAD_DIR, f"{file_id}.dxf")
+    if not re.fullmatch(r"[0-9a-f]{64}", file_id) or not os.path.exists(file_path):
         return JSONResponse(content={"error": "Archivo no encontrado"}, status_code=404)
-    return FileResponse(pdf_path, media_type="application/pdf", filename=f"{filename}.pdf")
+
+    try:
+        result = await _cotizacion(file_id, file_path, material, cantidad, modo_nesting,
+                                  simplificada=simplificada)
+    except PoolSaturado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except TiempoAgotado as e:
+        return JSONResponse(content={"error": str(e)}, status_code=504)
+    except ValueError as e:
+        return JSONResponse(content={"status": "failed", "error": str(e)}, status_code=422)
+
+    registrar_acceso(file_path)
+    clave = _hash_cotizacion(file_id, result)
+    pdf_path = os.path.join(PDF_DIR, f"{clave}.pdf")
+    # La URL no identifica el contenido (las tarifas pueden cambiar): revalidar
+    cabeceras = {"ETag": f'"{clave}"', "Cache-Control": "private, no-cache"}
+    if _coincide_etag(request, cabeceras["ETag"]):
+        registrar_acceso(pdf_path)
+        return Response(status_code=304, headers=cabeceras)
+
+    if not os.path.exists(pdf_path):
+        async def generar():
+            if not os.path.exists(pdf_path):
+                await ejecutar(generate_pdf, pdf_path, result, await _preview_png(file_id))
+
+        try:
+            await vuelos.ejecutar(("pdf", clave), generar)
+        except PoolSaturado as e:
+            return JSONResponse(content={"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+        except TiempoAgotado as e:
+            return JSONResponse(content={"error": str(e)}, status_code=504)
+    registrar_acceso(pdf_path)
+    return FileResponse(pdf_path, media_type="application/pdf", filename=f"{filename}.pdf", headers=cabeceras)
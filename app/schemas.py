@@ -1,8 +1,14 @@
 # app/schemas.py
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
 class DXFProcessResponse(BaseModel):
+    """
+    Respuesta 200 de /files/upload/. Siempre es esta, aun para archivos
+    pesados (que pueden venir con `simplificada`), salvo que el cliente
+    pida `Prefer: respond-async`: entonces un archivo pesado responde 202
+    con un `TrabajoAceptado`.
+    """
     status: str
     material: str
     cantidad: int
@@ -25,3 +31,35 @@ class DXFProcessResponse(BaseModel):
     costo_desperdicio: float
     preview_png_url: Optional[str] = None
     pdf_url: Optional[str] = None
+    simplificada: bool = False
+    preflight: Optional[dict] = None
+
+
+class TrabajoAceptado(BaseModel):
+    """
+    Respuesta 202 de /files/jobs (y de /files/upload/ con `Prefer:
+    respond-async` cuando el preflight estima que el archivo es pesado).
+    El resultado, un DXFProcessResponse, queda en `status_url`. Las etapas
+    son parse, geometry, nesting, preview y cotizacion (jobs.ETAPAS); el
+    PDF no es una etapa, se genera al pedir su `pdf_url`.
+    """
+    job_id: str
+    estado: str
+    etapa: Optional[str] = None
+    progreso: float
+    file_id: str
+    status_url: str
+    events_url: str
+    preflight: Optional[dict] = None
+
+
+class PiezaPedido(BaseModel):
+    file_id: str
+    cantidad: int = Field(1, ge=1)
+
+
+class PedidoNesting(BaseModel):
+    material: str = "CR18"
+    piezas: List[PiezaPedido] = Field(..., min_length=1)
+    kerf: Optional[float] = Field(None, ge=0)
+    presupuesto_s: Optional[float] = Field(None, gt=0, le=30)
@@ -0,0 +1,101 @@
+import asyncio
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimar_bytes(obj) -> int:
+    """Tamaño aproximado en memoria de un resultado (dicts, listas, arrays)."""
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + 112  # cabecera del ndarray
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimar_bytes(k) + estimar_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimar_bytes(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class CacheLRU:
+    """
+    Cache LRU acotado por memoria (bytes estimados) en lugar de por número
+    de entradas. Seguro para usar desde varios hilos.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._datos = OrderedDict()  # clave -> (valor, bytes)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return item[0]
+
+    def put(self, clave, valor):
+        tam = estimar_bytes(valor)
+        if tam > self.max_bytes:
+            return  # No cabe: no vale la pena vaciar el cache por una sola entrada
+        with self._lock:
+            anterior = self._datos.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= anterior[1]
+            self._datos[clave] = (valor, tam)
+            self.bytes += tam
+            while self.bytes > self.max_bytes:
+                _, (_, liberado) = self._datos.popitem(last=False)
+                self.bytes -= liberado
+                self.evictions += 1
+
+    def claves(self) -> list:
+        """Copia de las claves guardadas (de la menos a la más usada)."""
+        with self._lock:
+            return list(self._datos)
+
+    def stats(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "entradas": len(self._datos),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / consultas, 4) if consultas else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    Deduplica cálculos concurrentes: si llega una petición con la misma clave
+    mientras otra está en curso, espera el resultado de la primera en lugar
+    de repetir el trabajo.
+    """
+
+    def __init__(self):
+        self._en_curso = {}
+        self.compartidas = 0
+
+    async def ejecutar(self, clave, fabrica):
+        tarea = self._en_curso.get(clave)
+        if tarea is None:
+            tarea = asyncio.ensure_future(fabrica())
+            self._en_curso[clave] = tarea
+            tarea.add_done_callback(lambda _t: self._en_curso.pop(clave, None))
+        else:
+            self.compartidas += 1
+        # shield: si un cliente se desconecta no se cancela el cálculo de los demás
+        return await asyncio.shield(tarea)
+
+    def stats(self) -> dict:
+        return {"en_curso": len(self._en_curso), "compartidas": self.compartidas}
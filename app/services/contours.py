@@ -0,0 +1,353 @@
+import os
+from dataclasses import dataclass, field
+import numpy as np
+from app.services.geometry import (
+    GeometriaDXF,
+    areas_polilineas,
+    teselar_arcos,
+    teselar_circulos,
+)
+
+
+# Distancia máxima (mm) entre dos extremos para considerarlos unidos
+TOLERANCIA_CONTORNO = float(os.getenv("DXF_TOLERANCIA_CONTORNO", "0.05"))
+
+# Segmentos por arco al construir los polígonos de cada contorno (solo se
+# usan para la prueba de contención; áreas y límites son exactos)
+SEGMENTOS_ARCO = 16
+
+# Máximo de pares punto × arista por bloque en la prueba de contención
+_PARES_POR_BLOQUE = 4_000_000
+
+
+@dataclass
+class Contornos:
+    """
+    Contornos cerrados de la pieza y su clasificación.
+
+    - areas:       (L,)   área de cada contorno (mm²)
+    - profundidad: (L,)   contornos que lo encierran (par = exterior, impar = hueco)
+    - limites:     (L, 4) min_x, min_y, max_x, max_y
+    - abiertos:    cadenas que no llegan a cerrarse
+    - limites_pieza: envolvente de toda la geometría (contornos y cadenas
+      abiertas); None si no hay geometría
+    - inicios:     (L, 2) un punto de cada contorno (donde se perfora)
+    - padre:       (L,)   contorno más pequeño que lo encierra (-1 si ninguno)
+    - extremos_abiertos: (A, 4) x0, y0, x1, y1 de cada cadena abierta
+    """
+    areas: np.ndarray
+    profundidad: np.ndarray
+    limites: np.ndarray
+    abiertos: int
+    limites_pieza: tuple | None
+    inicios: np.ndarray = field(default_factory=lambda: np.zeros((0, 2)))
+    padre: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    extremos_abiertos: np.ndarray = field(default_factory=lambda: np.zeros((0, 4)))
+
+    @property
+    def exteriores(self) -> int:
+        return int((self.profundidad % 2 == 0).sum())
+
+    @property
+    def huecos(self) -> int:
+        return int((self.profundidad % 2 == 1).sum())
+
+    @property
+    def area_neta(self) -> float:
+        """Área de material: exteriores menos huecos (las islas dentro de huecos suman)."""
+        signo = np.where(self.profundidad % 2 == 0, 1.0, -1.0)
+        return float((signo * self.areas).sum())
+
+    @property
+    def area_exterior(self) -> float:
+        """Área de la silueta: los contornos exteriores de primer nivel, sin restar huecos."""
+        return float(self.areas[self.profundidad == 0].sum())
+
+    @property
+    def perforaciones(self) -> int:
+        """Una perforación para iniciar cada contorno cerrado y cada cadena abierta."""
+        return len(self.areas) + self.abiertos
+
+
+# ==== Tramos ====
+
+def _limites_arcos(arcos: np.ndarray) -> np.ndarray:
+    """Rectángulo envolvente exacto de cada arco: extremos más los cuadrantes que barre."""
+    cx, cy, r = arcos[:, 0], arcos[:, 1], arcos[:, 2]
+    a0 = np.radians(arcos[:, 3])
+    barrido = np.mod(np.radians(arcos[:, 4]) - a0, 2 * np.pi)
+    barrido[barrido == 0] = 2 * np.pi
+    a1 = a0 + barrido
+    xs = [cx + r * np.cos(a0), cx + r * np.cos(a1)]
+    ys = [cy + r * np.sin(a0), cy + r * np.sin(a1)]
+    for k, (dx, dy) in enumerate(((1, 0), (0, 1), (-1, 0), (0, -1))):
+        barre = np.mod(k * np.pi / 2 - a0, 2 * np.pi) <= barrido
+        xs.append(np.where(barre, cx + dx * r, xs[0]))
+        ys.append(np.where(barre, cy + dy * r, ys[0]))
+    xs, ys = np.stack(xs), np.stack(ys)
+    return np.column_stack([xs.min(axis=0), ys.min(axis=0), xs.max(axis=0), ys.max(axis=0)])
+
+
+def _cruz_arcos(arcos: np.ndarray) -> np.ndarray:
+    """∮ x dy - y dx a lo largo de cada arco (antihorario), exacto."""
+    cx, cy, r = arcos[:, 0], arcos[:, 1], arcos[:, 2]
+    a0 = np.radians(arcos[:, 3])
+    barrido = np.mod(np.radians(arcos[:, 4]) - a0, 2 * np.pi)
+    barrido[barrido == 0] = 2 * np.pi
+    a1 = a0 + barrido
+    return r * cx * (np.sin(a1) - np.sin(a0)) - r * cy * (np.cos(a1) - np.cos(a0)) + r ** 2 * barrido
+
+
+def _tramos(geo: GeometriaDXF):
+    """
+    Tramos abiertos que hay que encadenar: líneas, arcos y polilíneas
+    abiertas. Devuelve (inicio, fin, cruz, límites, puntos, offsets), donde
+    `cruz` es la contribución de cada tramo a 2·área recorrido hacia adelante
+    y `puntos`/`offsets` su trazo para construir polígonos.
+    """
+    l, a = geo.lineas, geo.arcos
+    arcos_pts = teselar_arcos(a, SEGMENTOS_ARCO)
+
+    # Polilíneas abiertas con al menos un tramo
+    conteos = np.diff(geo.poly_offsets)
+    abiertas = ~geo.poly_cerrada & (conteos >= 2)
+    idx = np.repeat(np.arange(len(conteos)), conteos)
+    v = geo.poly_vertices
+    sel = abiertas[idx]
+    pv, pidx = v[sel], idx[sel]
+    p_conteos = conteos[abiertas]
+    p_offsets = np.zeros(len(p_conteos) + 1, dtype=np.int64)
+    np.cumsum(p_conteos, out=p_offsets[1:])
+    if len(pv):
+        mismo = pidx[1:] == pidx[:-1]
+        cruz_v = np.where(mismo, pv[:-1, 0] * pv[1:, 1] - pv[1:, 0] * pv[:-1, 1], 0.0)
+        cruz_p = np.bincount(pidx[:-1], weights=cruz_v, minlength=len(conteos))[abiertas]
+        p_min = np.minimum.reduceat(pv, p_offsets[:-1]) if len(p_conteos) else np.zeros((0, 2))
+        p_max = np.maximum.reduceat(pv, p_offsets[:-1]) if len(p_conteos) else np.zeros((0, 2))
+    else:
+        cruz_p, p_min, p_max = np.zeros(0), np.zeros((0, 2)), np.zeros((0, 2))
+
+    inicio = np.concatenate([l[:, 0:2], arcos_pts[:, 0], pv[p_offsets[:-1]]])
+    fin = np.concatenate([l[:, 2:4], arcos_pts[:, -1], pv[p_offsets[1:] - 1]])
+    cruz = np.concatenate([l[:, 0] * l[:, 3] - l[:, 2] * l[:, 1], _cruz_arcos(a), cruz_p])
+    limites = np.concatenate([
+        np.column_stack([np.minimum(l[:, 0], l[:, 2]), np.minimum(l[:, 1], l[:, 3]),
+                         np.maximum(l[:, 0], l[:, 2]), np.maximum(l[:, 1], l[:, 3])]),
+        _limites_arcos(a),
+        np.hstack([p_min, p_max]),
+    ])
+    puntos = np.concatenate([l.reshape(-1, 2), arcos_pts.reshape(-1, 2), pv])
+    conteos_tramo = np.concatenate([
+        np.full(len(l), 2), np.full(len(a), SEGMENTOS_ARCO + 1), p_conteos,
+    ]).astype(np.int64)
+    offsets = np.zeros(len(conteos_tramo) + 1, dtype=np.int64)
+    np.cumsum(conteos_tramo, out=offsets[1:])
+    return inicio, fin, cruz, limites, puntos, offsets
+
+
+# ==== Nodos (hash espacial) ====
+
+def agrupar_extremos(extremos: np.ndarray, tol: float) -> np.ndarray:
+    """
+    Agrupa extremos a menos de `tol` en un mismo nodo. Primero por celda de
+    una rejilla de lado `tol`; después los extremos que quedaron sueltos se
+    buscan en las celdas vecinas, por si cayeron a ambos lados de un borde.
+    """
+    celdas = np.floor(extremos / tol).astype(np.int64)
+    _, nodo = np.unique(celdas, axis=0, return_inverse=True)
+    nodo = nodo.ravel()
+    grado = np.bincount(nodo)
+    sueltos = np.flatnonzero(grado[nodo] == 1)
+    if len(sueltos) < 2:
+        return nodo
+
+    padre = list(range(int(nodo.max()) + 1))
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
+
+    por_celda = {}
+    for i in sueltos.tolist():
+        por_celda.setdefault(tuple(celdas[i].tolist()), []).append(i)
+    for i in sueltos.tolist():
+        cx, cy = celdas[i].tolist()
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in por_celda.get((cx + dx, cy + dy), ()):
+                    if j != i and np.hypot(*(extremos[i] - extremos[j])) <= tol:
+                        padre[raiz(nodo[i])] = raiz(nodo[j])
+    raices = np.array([raiz(i) for i in range(len(padre))])
+    return np.unique(raices, return_inverse=True)[1].ravel()[nodo]
+
+
+# ==== Encadenado ====
+
+def _encadenar(u: np.ndarray, v: np.ndarray):
+    """
+    Recorre el grafo tramo a tramo. Devuelve la lista de contornos cerrados
+    (cada uno como lista de (tramo, sentido)) y los nodos extremos de cada
+    cadena abierta.
+    """
+    n_nodos = int(max(u.max(), v.max())) + 1
+    extremos = np.concatenate([u, v])
+    orden = np.argsort(extremos, kind="stable")
+    tramo_de = (orden % len(u)).tolist()
+    inicio = np.zeros(n_nodos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(extremos, minlength=n_nodos), out=inicio[1:])
+    inicio = inicio.tolist()
+    cursor = inicio[:-1]
+    u_l, v_l = u.tolist(), v.tolist()
+    visitado = bytearray(len(u))
+
+    def siguiente(nodo):
+        k = cursor[nodo]
+        fin = inicio[nodo + 1]
+        while k < fin and visitado[tramo_de[k]]:
+            k += 1
+        cursor[nodo] = k
+        return tramo_de[k] if k < fin else -1
+
+    def avanzar(nodo, tope, cadena):
+        while nodo != tope:
+            t = siguiente(nodo)
+            if t < 0:
+                return nodo
+            visitado[t] = 1
+            adelante = u_l[t] == nodo
+            cadena.append((t, adelante))
+            nodo = v_l[t] if adelante else u_l[t]
+        return nodo
+
+    cerrados, abiertos = [], []
+    for t0 in range(len(u)):
+        if visitado[t0]:
+            continue
+        visitado[t0] = 1
+        cadena = [(t0, True)]
+        final = avanzar(v_l[t0], u_l[t0], cadena)
+        if final == u_l[t0]:
+            cerrados.append(cadena)
+        else:
+            # Cadena abierta: se completa hacia atrás para contarla una vez
+            abiertos.append((avanzar(u_l[t0], -1, []), final))
+    return cerrados, abiertos
+
+
+def _dentro(puntos: np.ndarray, poligono: np.ndarray) -> np.ndarray:
+    """Prueba par-impar (rayo horizontal) de varios puntos contra un polígono."""
+    x0, y0 = poligono[:, 0], poligono[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    dy = np.where(y1 == y0, 1e-300, y1 - y0)
+    resultado = np.zeros(len(puntos), dtype=bool)
+    paso = max(1, _PARES_POR_BLOQUE // max(len(poligono), 1))
+    for k in range(0, len(puntos), paso):
+        x = puntos[k:k + paso, 0:1]
+        y = puntos[k:k + paso, 1:2]
+        cruza = ((y0 > y) != (y1 > y)) & (x < (x1 - x0) * (y - y0) / dy + x0)
+        resultado[k:k + paso] = cruza.sum(axis=1) % 2 == 1
+    return resultado
+
+
+def construir_contornos(geo: GeometriaDXF, tol: float = TOLERANCIA_CONTORNO) -> Contornos:
+    """
+    Encadena líneas, arcos y polilíneas abiertas por sus extremos para
+    formar contornos cerrados (los círculos y polilíneas cerradas ya lo
+    son), y los clasifica en exteriores y huecos según cuántos otros
+    contornos los encierran.
+    """
+    inicio, fin, cruz, limites_t, puntos_t, offsets_t = _tramos(geo)
+
+    # Descartar tramos degenerados (más cortos que la tolerancia y sin curva)
+    largo = np.hypot(*(fin - inicio).T)
+    cerrado_solo = np.zeros(len(inicio), dtype=bool)
+    n_l = len(geo.lineas)
+    cerrado_solo[n_l:n_l + len(geo.arcos)] = True  # un arco de 360° se cierra sobre sí mismo
+    validos = (largo > tol) | cerrado_solo
+
+    areas, limites, poligonos = [], [], []
+    extremos_abiertos = np.zeros((0, 4))
+    if validos.any():
+        ids = np.flatnonzero(validos)
+        extremos = np.concatenate([inicio[ids], fin[ids]])
+        nodo = agrupar_extremos(extremos, tol)
+        cerrados, abiertos = _encadenar(nodo[:len(ids)], nodo[len(ids):])
+        if abiertos:
+            # Coordenadas de cada nodo: cualquiera de sus extremos sirve
+            coordenadas = np.zeros((int(nodo.max()) + 1, 2))
+            coordenadas[nodo] = extremos
+            extremos_abiertos = coordenadas[np.array(abiertos)].reshape(-1, 4)
+        for cadena in cerrados:
+            tramos = ids[[t for t, _ in cadena]]
+            sentido = np.array([1.0 if adelante else -1.0 for _, adelante in cadena])
+            areas.append(0.5 * abs(float((cruz[tramos] * sentido).sum())))
+            lim = limites_t[tramos]
+            limites.append((lim[:, 0].min(), lim[:, 1].min(), lim[:, 2].max(), lim[:, 3].max()))
+            poligonos.append(np.concatenate([
+                puntos_t[offsets_t[t]:offsets_t[t + 1]][::1 if adelante else -1]
+                for t, adelante in zip(tramos.tolist(), sentido > 0)
+            ]))
+
+    # Círculos y polilíneas cerradas
+    c = geo.circulos
+    areas.extend((np.pi * c[:, 2] ** 2).tolist())
+    limites.extend(np.column_stack([c[:, 0] - c[:, 2], c[:, 1] - c[:, 2], c[:, 0] + c[:, 2], c[:, 1] + c[:, 2]]).tolist())
+    poligonos.extend(teselar_circulos(c, 2 * SEGMENTOS_ARCO))
+    cerradas = np.flatnonzero(geo.poly_cerrada & (np.diff(geo.poly_offsets) >= 3))
+    if len(cerradas):
+        areas.extend(areas_polilineas(geo)[cerradas].tolist())
+        for i in cerradas.tolist():
+            pts = geo.poly_vertices[geo.poly_offsets[i]:geo.poly_offsets[i + 1]]
+            limites.append((*pts.min(axis=0), *pts.max(axis=0)))
+            poligonos.append(pts)
+
+    areas = np.array(areas, dtype=np.float64)
+    limites = np.array(limites, dtype=np.float64).reshape(-1, 4)
+    profundidad = np.zeros(len(areas), dtype=np.int64)
+    padre = np.full(len(areas), -1, dtype=np.int64)
+    muestra = np.array([p[0] for p in poligonos], dtype=np.float64).reshape(-1, 2)
+
+    # Contención: solo contra contornos menores cuyo rectángulo queda dentro
+    # del de j. Ordenados por min_x, esos están en el tramo con min_x entre
+    # los x de j (barrido), y solo ese tramo se filtra; así una rejilla de
+    # perforaciones no cuesta L² comparaciones. De mayor a menor área, el
+    # último que encierra a un contorno es su padre
+    if len(areas) > 1:
+        por_x = np.argsort(limites[:, 0], kind="stable")
+        x_min = limites[por_x, 0]
+        for j in np.argsort(-areas).tolist():
+            lj = limites[j]
+            desde = int(np.searchsorted(x_min, lj[0], "left"))
+            hasta = int(np.searchsorted(x_min, lj[2], "right"))
+            if hasta - desde <= 1:
+                continue
+            tramo = por_x[desde:hasta]
+            lt = limites[tramo]
+            candidatos = tramo[
+                (areas[tramo] < areas[j])
+                & (lt[:, 1] >= lj[1]) & (lt[:, 2] <= lj[2]) & (lt[:, 3] <= lj[3])
+            ]
+            if len(candidatos):
+                dentro = candidatos[_dentro(muestra[candidatos], poligonos[j])]
+                profundidad[dentro] += 1
+                padre[dentro] = j
+
+    # Envolvente de la pieza
+    todos = np.concatenate([limites, limites_t])
+    limites_pieza = None
+    if len(todos):
+        limites_pieza = (float(todos[:, 0].min()), float(todos[:, 1].min()),
+                         float(todos[:, 2].max()), float(todos[:, 3].max()))
+
+    return Contornos(
+        areas=areas,
+        profundidad=profundidad,
+        limites=limites,
+        abiertos=len(extremos_abiertos),
+        limites_pieza=limites_pieza,
+        inicios=muestra,
+        padre=padre,
+        extremos_abiertos=extremos_abiertos,
+    )
@@ -0,0 +1,319 @@
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+import numpy as np
+from app.services.contours import Contornos
+
+
+# Pasadas de 2-opt después del vecino más cercano y máximo de tramos
+# invertidos en total; con 0 pasadas se queda con la secuencia inicial.
+# Se limita por trabajo y no por tiempo: el recorrido entra en el precio y
+# el mismo archivo tiene que dar siempre la misma cotización
+PASADAS_2OPT = int(os.getenv("DXF_PASADAS_2OPT", "4"))
+MOVIDAS_2OPT = int(os.getenv("DXF_MOVIDAS_2OPT", "50000"))
+
+# Tope de seguridad (s) para 2-opt: si se pasa se corta ahí y queda la
+# mejor secuencia encontrada. Con los límites de arriba no debería
+# alcanzarse; si se alcanza, el recorrido ya puede depender de la carga
+LIMITE_2OPT_S = float(os.getenv("DXF_LIMITE_2OPT_S", "30"))
+
+# Elementos candidatos por elemento en 2-opt (los más cercanos)
+VECINOS_2OPT = 8
+
+# Elementos por celda, en promedio, de la rejilla del vecino más cercano
+_POR_CELDA = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Secuencia:
+    """
+    Orden de corte de una pieza. Los elementos son los contornos cerrados
+    (índices 0..L-1 de `Contornos`) seguidos de las cadenas abiertas.
+
+    - orden:      (E,) elementos en el orden en que se cortan
+    - invertido:  (E,) la cadena abierta se corta desde su segundo extremo
+    - recorrido_vacio: mm de desplazamiento sin cortar, desde el origen
+      hasta la última perforación
+    - recorrido_inicial: lo mismo para la secuencia del vecino más cercano
+      (antes de 2-opt)
+    """
+    orden: np.ndarray
+    invertido: np.ndarray
+    recorrido_vacio: float
+    recorrido_inicial: float
+
+
+class _Rejilla:
+    """
+    Índice espacial de puntos sobre una rejilla uniforme (como
+    `agrupar_extremos` en contours) que admite quitar puntos y buscar el más
+    cercano por anillos.
+    """
+
+    def __init__(self, minimo, lado: float):
+        self.x0, self.y0 = minimo
+        self.lado = lado
+        self.celdas = {}
+
+    def _celda(self, x: float, y: float) -> tuple:
+        return int((x - self.x0) // self.lado), int((y - self.y0) // self.lado)
+
+    def agregar(self, clave, x: float, y: float):
+        self.celdas.setdefault(self._celda(x, y), []).append((x, y, clave))
+
+    def quitar(self, clave, x: float, y: float):
+        celda = self._celda(x, y)
+        puntos = self.celdas[celda]
+        puntos.remove((x, y, clave))
+        if not puntos:
+            del self.celdas[celda]
+
+    def mas_cercano(self, x: float, y: float):
+        """(clave, distancia) del punto más cercano; None si está vacía."""
+        if not self.celdas:
+            return None
+        cx, cy = self._celda(x, y)
+        mejor, mejor_d = None, math.inf
+        k = 0
+        while True:
+            # Con pocas celdas ocupadas es más barato revisarlas todas
+            if (2 * k + 1) ** 2 > 4 * len(self.celdas):
+                celdas = self.celdas.values()
+            elif k == 0:
+                celdas = [self.celdas.get((cx, cy), ())]
+            else:
+                celdas = [
+                    self.celdas.get((cx + i, cy + j), ())
+                    for i in range(-k, k + 1)
+                    for j in ((-k, k) if abs(i) < k else range(-k, k + 1))
+                ]
+            for puntos in celdas:
+                for px, py, clave in puntos:
+                    d = math.hypot(px - x, py - y)
+                    if d < mejor_d:
+                        mejor, mejor_d = clave, d
+            if (2 * k + 1) ** 2 > 4 * len(self.celdas):
+                return mejor, mejor_d
+            # Las celdas del anillo k + 1 quedan a más de k * lado
+            if mejor is not None and mejor_d <= k * self.lado:
+                return mejor, mejor_d
+            k += 1
+
+
+def _elementos(contornos: Contornos):
+    """Entrada, salida y padre de cada elemento (-1 si no tiene)."""
+    abiertos = contornos.extremos_abiertos
+    entrada = np.concatenate([contornos.inicios, abiertos[:, :2]])
+    salida = np.concatenate([contornos.inicios, abiertos[:, 2:]])
+    padre = np.concatenate([contornos.padre, np.full(len(abiertos), -1, dtype=np.int64)])
+    return entrada, salida, padre
+
+
+def _vecino_mas_cercano(entrada, salida, padre, origen, lado):
+    """
+    Secuencia inicial: desde la posición actual, el elemento disponible más
+    cercano. Un contorno está disponible cuando ya se cortaron todos los
+    que encierra (los huecos antes que el exterior); las cadenas abiertas
+    pueden empezar por cualquiera de sus extremos.
+    """
+    n = len(entrada)
+    cerrados = np.all(entrada == salida, axis=1).tolist()
+    ent, sal = entrada.tolist(), salida.tolist()
+    pendientes = np.bincount(padre[padre >= 0], minlength=n).tolist()
+    padre_l = padre.tolist()
+
+    rejilla = _Rejilla(np.minimum(entrada.min(axis=0), salida.min(axis=0)), lado)
+
+    def habilitar(e):
+        rejilla.agregar((e, False), *ent[e])
+        if not cerrados[e]:
+            rejilla.agregar((e, True), *sal[e])
+
+    for e in range(n):
+        if pendientes[e] == 0:
+            habilitar(e)
+
+    orden, invertido = [], []
+    x, y = origen
+    while rejilla.celdas:
+        (e, inv), _ = rejilla.mas_cercano(x, y)
+        rejilla.quitar((e, False), *ent[e])
+        if not cerrados[e]:
+            rejilla.quitar((e, True), *sal[e])
+        orden.append(e)
+        invertido.append(inv)
+        x, y = ent[e] if inv else sal[e]
+        p = padre_l[e]
+        if p >= 0:
+            pendientes[p] -= 1
+            if pendientes[p] == 0:
+                habilitar(p)
+    return np.array(orden, dtype=np.int64), np.array(invertido, dtype=bool)
+
+
+def _recorrido(orden, invertido, entrada, salida, origen) -> float:
+    """Desplazamiento en vacío (mm) de una secuencia."""
+    if len(orden) == 0:
+        return 0.0
+    ent = np.where(invertido[:, None], salida[orden], entrada[orden])
+    sal = np.where(invertido[:, None], entrada[orden], salida[orden])
+    desde = np.vstack([np.asarray(origen, dtype=np.float64)[None, :], sal[:-1]])
+    return float(np.hypot(*(ent - desde).T).sum())
+
+
+def _vecinos(puntos: np.ndarray, dueno: np.ndarray, lado: float, k: int) -> list[list[int]]:
+    """
+    Hasta k elementos más cercanos a cada elemento, por cualquiera de sus
+    puntos, buscando en las 3 × 3 celdas vecinas de la rejilla.
+    """
+    celda = np.floor((puntos - puntos.min(axis=0)) / lado).astype(np.int64) + 1
+    ancho = int(celda[:, 0].max()) + 2
+    clave = celda[:, 1] * ancho + celda[:, 0]
+    por_clave = np.argsort(clave, kind="stable")
+    claves = clave[por_clave]
+
+    # Pares (punto, punto de una celda vecina), sin bucles por punto
+    pares_a, pares_b = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            vecina = clave + dy * ancho + dx
+            desde = np.searchsorted(claves, vecina, "left")
+            cuantos = np.searchsorted(claves, vecina, "right") - desde
+            total = int(cuantos.sum())
+            inicio = np.repeat(desde - (np.cumsum(cuantos) - cuantos), cuantos)
+            pares_a.append(np.repeat(np.arange(len(puntos)), cuantos))
+            pares_b.append(por_clave[inicio + np.arange(total)])
+    a, b = np.concatenate(pares_a), np.concatenate(pares_b)
+    d = np.hypot(*(puntos[a] - puntos[b]).T)
+    a, b = dueno[a], dueno[b]
+    distintos = a != b
+    a, b, d = a[distintos], b[distintos], d[distintos]
+
+    # Por elemento, cada vecino una vez (su punto más cercano) y los k primeros
+    orden = np.lexsort((d, b, a))
+    a, b, d = a[orden], b[orden], d[orden]
+    primero = np.ones(len(a), dtype=bool)
+    primero[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    a, b, d = a[primero], b[primero], d[primero]
+    orden = np.lexsort((d, a))
+    a, b = a[orden], b[orden]
+    inicio_grupo = np.searchsorted(a, a, "left")
+    cercanos = np.arange(len(a)) - inicio_grupo < k
+    a, b = a[cercanos], b[cercanos]
+
+    n = int(dueno.max()) + 1
+    cortes = np.searchsorted(a, np.arange(1, n))
+    return [v.tolist() for v in np.split(b, cortes)]
+
+
+def _dos_opt(orden, invertido, entrada, salida, padre, origen, lado, pasadas: int):
+    """
+    Mejora la secuencia invirtiendo tramos (2-opt) mientras haya ganancia,
+    hasta `pasadas` pasadas o MOVIDAS_2OPT tramos invertidos. Solo se
+    prueban los tramos que acercan cada elemento a uno de sus vecinos y se
+    descartan los que cortarían un contorno antes que alguno de sus huecos.
+    Cada inversión acorta el recorrido: si se pasa de LIMITE_2OPT_S se
+    devuelve la secuencia que haya en ese momento.
+    """
+    n = len(orden)
+    orden, invertido = orden.tolist(), invertido.tolist()
+    ent, sal, padre_l = entrada.tolist(), salida.tolist(), padre.tolist()
+    posicion = [0] * n
+    for i, e in enumerate(orden):
+        posicion[e] = i
+    # Los contornos cerrados tienen un solo punto; las cadenas abiertas, dos
+    abiertas = np.flatnonzero(np.any(entrada != salida, axis=1))
+    vecinos = _vecinos(
+        np.concatenate([entrada, salida[abiertas]]),
+        np.concatenate([np.arange(n), abiertas]),
+        lado, VECINOS_2OPT,
+    )
+
+    def entra(i):
+        e = orden[i]
+        return sal[e] if invertido[i] else ent[e]
+
+    def sale(i):
+        if i < 0:
+            return origen
+        e = orden[i]
+        return ent[e] if invertido[i] else sal[e]
+
+    def d(p, q):
+        return math.hypot(p[0] - q[0], p[1] - q[1])
+
+    def ganancia(i, j):
+        """
+        Lo que se ahorra invirtiendo el tramo i+1..j: cada elemento pasa a
+        entrar por donde salía, así que los desplazamientos a -> b y c -> d
+        se cambian por a -> c y b -> d.
+        """
+        a, b, c = sale(i), entra(i + 1), sale(j)
+        g = d(a, b) - d(a, c)
+        if j + 1 < n:
+            siguiente = entra(j + 1)
+            g += d(c, siguiente) - d(b, siguiente)
+        return g
+
+    limite = time.perf_counter() + LIMITE_2OPT_S
+    movidas = 0
+    mejora = True
+    while mejora and pasadas > 0 and movidas < MOVIDAS_2OPT:
+        mejora = False
+        pasadas -= 1
+        for i in range(-1, n - 2):
+            if i % 64 == 0 and time.perf_counter() >= limite:
+                logger.warning("2-opt cortado por tiempo", extra={"datos": {"elementos": n, "movidas": movidas}})
+                mejora = False
+                break
+            if movidas >= MOVIDAS_2OPT:
+                break
+            # Tramos que acercan a -> c (c vecino de a) o b -> d (d vecino de b)
+            candidatos = [posicion[c] for c in vecinos[orden[i]]] if i >= 0 else []
+            candidatos += [posicion[c] - 1 for c in vecinos[orden[i + 1]]]
+            for j in candidatos:
+                if j <= i + 1 or ganancia(i, j) <= 1e-9:
+                    continue
+                if any(i + 1 <= posicion[padre_l[e]] <= j for e in orden[i + 1:j + 1] if padre_l[e] >= 0):
+                    continue
+                orden[i + 1:j + 1] = orden[i + 1:j + 1][::-1]
+                invertido[i + 1:j + 1] = [not v for v in invertido[i + 1:j + 1][::-1]]
+                for k in range(i + 1, j + 1):
+                    posicion[orden[k]] = k
+                movidas += 1
+                mejora = True
+                break
+    return np.array(orden, dtype=np.int64), np.array(invertido, dtype=bool)
+
+
+def secuenciar(contornos: Contornos, origen=None, pasadas: int = PASADAS_2OPT) -> Secuencia:
+    """
+    Orden de corte de los contornos y cadenas abiertas de una pieza: vecino
+    más cercano (sobre una rejilla) respetando que los huecos se corten
+    antes que el contorno que los encierra, y luego hasta `pasadas` de
+    2-opt. El resultado depende solo de la pieza. El origen por defecto es
+    la esquina inferior izquierda de la pieza.
+    """
+    entrada, salida, padre = _elementos(contornos)
+    if len(entrada) == 0:
+        vacio = np.zeros(0, dtype=np.int64)
+        return Secuencia(vacio, vacio.astype(bool), 0.0, 0.0)
+    if origen is None:
+        origen = contornos.limites_pieza[:2] if contornos.limites_pieza else (0.0, 0.0)
+    origen = (float(origen[0]), float(origen[1]))
+
+    # Lado de celda para ~_POR_CELDA puntos por celda
+    puntos = np.concatenate([entrada, salida])
+    extension = np.ptp(puntos, axis=0)
+    area = max(float(extension[0] * extension[1]), float(extension.max()) ** 2 / len(entrada), 1e-6)
+    lado = max(math.sqrt(area * _POR_CELDA / len(entrada)), 1e-3)
+
+    orden, invertido = _vecino_mas_cercano(entrada, salida, padre, origen, lado)
+    inicial = _recorrido(orden, invertido, entrada, salida, origen)
+    if len(orden) > 3 and pasadas > 0:
+        orden, invertido = _dos_opt(orden, invertido, entrada, salida, padre, origen, lado, pasadas)
+    return Secuencia(orden, invertido, _recorrido(orden, invertido, entrada, salida, origen), inicial)
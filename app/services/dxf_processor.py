@@ -1,67 +1,119 @@
-import ezdxf
+import logging
 import math
-import matplotlib
-matplotlib.use("Agg")  # Headless backend for Render
-from matplotlib import pyplot as plt
-from matplotlib.patches import Arc, Circle
 import os
-from rectpack import newPacker
-import random
-import matplotlib.patches as patches
 import numpy as np
+from app.services.geometry import (
+    GeometriaDXF,
+    areas_polilineas,
+    extraer_geometria,
+    longitud_pliegue,
+    perimetro_total,
+)
+from app.services.nesting import (
+    HOJA_ALTO,
+    HOJA_ANCHO,
+    KERF_MM,
+    MATERIALES_SIN_ROTACION,
+    anidar_rectangulos,
+    renderizar_nesting,
+)
+from app.services.contours import construir_contornos
+from app.services.cut_path import secuenciar
+from app.services.geometry_cleanup import LIMPIEZA, TOLERANCIA_SIMPLIFICADA, limpiar_geometria
+from app.services.preflight import MAX_EXTENSION_MM, escanear
+from app.services import geometry_store
+from app.services.dxf_reader import LECTOR_RAPIDO, leer_geometria
+from app.services.metrics import contar, span
+from app.services.preview import renderizar_png, renderizar_svg
+from app.services.shape_nesting import huella_pieza
+from app.services.sheet_catalog import elegir_hoja
+
+
+logger = logging.getLogger(__name__)
+
+
+def cargar_geometria(file_path) -> GeometriaDXF:
+    """
+    Geometría del modelspace. Si el archivo ya se leyó (en este proceso,
+    en otro worker o antes de un reinicio) sale del almacén en disco sin
+    parsear (ver geometry_store). Si no, prueba primero el lector de la
+    sección ENTITIES (ver `leer_geometria`) y si el archivo tiene bloques,
+    curvas u otra cosa que no entiende lo carga completo con ezdxf.
+    """
+    clave = None
+    if geometry_store.ACTIVO:
+        with span("store"):
+            clave = geometry_store.clave_archivo(file_path)
+            geometria = geometry_store.cargar(clave)
+        if geometria is not None:
+            contar("dxf_lecturas_total", lector="almacen")
+            return geometria
+
+    with span("parse"):
+        geometria = leer_geometria(file_path) if LECTOR_RAPIDO else None
+        if geometria is None:
+            # ezdxf tarda en importarse; solo lo carga el proceso que lo necesita
+            import ezdxf
+            doc = ezdxf.readfile(file_path)
+    contar("dxf_lecturas_total", lector="ezdxf" if geometria is None else "rapido")
+    if geometria is None:
+        with span("entities"):
+            geometria = extraer_geometria(doc.modelspace())
+    if clave:
+        with span("store"):
+            geometry_store.guardar(clave, geometria)
+    return geometria
+
+
+def cargar_geometria_limpia(file_path, simplificada: bool = False) -> tuple[GeometriaDXF, dict | None]:
+    """
+    Geometría del archivo sin entidades duplicadas, solapadas ni de largo
+    cero (ver geometry_cleanup), y el resumen de lo quitado. En el almacén
+    queda la geometría tal como se leyó; la limpieza se repite en cada uso.
+    Con `simplificada` se limpia con TOLERANCIA_SIMPLIFICADA aunque la
+    limpieza esté desactivada.
+    """
+    geometria = cargar_geometria(file_path)
+    if not LIMPIEZA and not simplificada:
+        return geometria, None
+    with span("cleanup"):
+        if simplificada:
+            geometria, reporte = limpiar_geometria(geometria, TOLERANCIA_SIMPLIFICADA)
+        else:
+            geometria, reporte = limpiar_geometria(geometria)
+    if reporte["entidades_eliminadas"]:
+        contar("dxf_entidades_eliminadas_total", reporte["entidades_eliminadas"])
+        logger.info("Geometría limpiada", extra={"datos": {"archivo": os.path.basename(file_path), **reporte}})
+    return geometria, reporte
+
+
+def renderizar_previews(file_path, preview_px: int) -> dict:
+    """Vistas previas PNG y SVG de un archivo (las mismas claves que agrega analizar_dxf)."""
+    geometria, _ = cargar_geometria_limpia(file_path)
+    with span("render"):
+        return {
+            "preview_png": renderizar_png(geometria, preview_px),
+            "preview_svg": renderizar_svg(geometria),
+        }
 
 
-def generate_dxf_plot(file_path, output_image_path):
+def generate_dxf_plot(file_path, output_image_path, geometria=None):
     try:
-        # Leer el archivo DXF
-        doc = ezdxf.readfile(file_path)
-        modelspace = doc.modelspace()
-
-        # Crear la figura
-        fig, ax = plt.subplots(figsize=(5, 5))
-
-        # Copiar entidades en una lista para evitar problemas de iteración
-        entities = list(modelspace)
-
-        # Graficar entidades del DXF
-        for entity in entities:
-            if entity.dxftype() == "LINE":
-                start = entity.dxf.start
-                end = entity.dxf.end
-                ax.plot([start.x, end.x], [start.y, end.y], color="blue", linewidth=1)
-            elif entity.dxftype() == "CIRCLE":
-                center = entity.dxf.center
-                radius = entity.dxf.radius
-                circle = Circle((center.x, center.y), radius, edgecolor="green", fill=False)
-                ax.add_patch(circle)
-            elif entity.dxftype() == "ARC":
-                center = entity.dxf.center
-                radius = entity.dxf.radius
-                start_angle = entity.dxf.start_angle
-                end_angle = entity.dxf.end_angle
-                arc = Arc((center.x, center.y), 2*radius, 2*radius, angle=0,
-                          theta1=start_angle, theta2=end_angle, edgecolor="orange", linewidth=1)
-                ax.add_patch(arc)
-
-            elif entity.dxftype() in ["LWPOLYLINE", "POLYLINE"]:
-                segments = entity.explode()
-                for segment in segments:
-                    if segment.dxftype() == 'LINE':
-                        start = segment.dxf.start
-                        end = segment.dxf.end
-                        ax.plot([start.x, end.x], [start.y, end.y], color="red", linewidth=1)
-
-        # Ajustar los límites del gráfico
-        ax.set_aspect('equal', adjustable='datalim')
-        ax.autoscale_view()
-
-        # Título y etiquetas
-        file_name = os.path.basename(file_path)
-        ax.set_title(f"Visualización del archivo {file_name}")
+        if geometria is None:
+            # Leer el archivo DXF
+            geometria, _ = cargar_geometria_limpia(file_path)
+
+        # PNG o SVG según la extensión pedida
+        if output_image_path.lower().endswith(".svg"):
+            contenido = renderizar_svg(geometria)
+        else:
+            contenido = renderizar_png(geometria)
+        if contenido is None:
+            raise ValueError("el archivo no contiene geometría para dibujar")
 
         # Guardar la imagen en la ruta especificada
-        plt.savefig(output_image_path, dpi=150, bbox_inches="tight")
-        plt.close(fig)
+        with open(output_image_path, "wb") as f:
+            f.write(contenido)
         return output_image_path
     except Exception as e:
         raise RuntimeError(f"Error al procesar el archivo DXF: {e}")
@@ -191,179 +243,521 @@ Valor_pliegue_ml = {
 }
 
 
+# Costo por perforación (inicio de cada contorno de corte), COP
+Costo_perforacion = {
+    "CR18": 50,
+    "CR16": 75,
+    "CR14": 125,
+    "HR14": 150,
+    "HR12": 175,
+    "HR1/8": 225,
+    "HR3/16": 375,
+    "HR1/4": 600,
+    "HR5/16": 800,
+    "HR3/8": 1000,
+    "HR1/2": 1250,
+    "INOX20": 200,
+    "INOX18": 250,
+    "INOX16": 300,
+    "INOX14": 400,
+    "INOX12": 500,
+    "INOX1/8": 600,
+    "INOX3/16": 800,
+    "ALUM1": 100,
+    "ALUM1,5": 125,
+    "ALUM2,5": 175,
+    "ALUM3": 200,
+    "ALUM4": 250,
+    "ALUM5": 350,
+    "ALUM6": 450,
+    "ACR1": 50,
+    "ACR2": 100,
+    "ACR3": 150,
+    "ACR4": 200,
+    "ACR5": 250,
+    "ACR6": 300,
+    "MDF1": 50,
+    "MDF2": 100,
+    "MDF3": 150,
+    "MDF4": 200,
+    "MDF5": 250,
+    "MDF6": 300,
+    "CARTON1": 50
+}
+
+
+# Velocidad de corte por material (mm/min), para estimar el tiempo de máquina
+Velocidad_corte_mm_min = {
+    "CR18": 9000,
+    "CR16": 8000,
+    "CR14": 6500,
+    "HR14": 6000,
+    "HR12": 4500,
+    "HR1/8": 3800,
+    "HR3/16": 2600,
+    "HR1/4": 1900,
+    "HR5/16": 1500,
+    "HR3/8": 1200,
+    "HR1/2": 800,
+    "INOX20": 9000,
+    "INOX18": 8000,
+    "INOX16": 6500,
+    "INOX14": 5000,
+    "INOX12": 3500,
+    "INOX1/8": 3000,
+    "INOX3/16": 1800,
+    "ALUM1": 12000,
+    "ALUM1,5": 10000,
+    "ALUM2,5": 7000,
+    "ALUM3": 6000,
+    "ALUM4": 4500,
+    "ALUM5": 3500,
+    "ALUM6": 2800,
+    "ACR1": 3000,
+    "ACR2": 2200,
+    "ACR3": 1600,
+    "ACR4": 1200,
+    "ACR5": 900,
+    "ACR6": 700,
+    "MDF1": 3500,
+    "MDF2": 2500,
+    "MDF3": 1800,
+    "MDF4": 1400,
+    "MDF5": 1100,
+    "MDF6": 900,
+    "CARTON1": 6000
+}
+
+# Tiempo de cada perforación por material (s)
+Tiempo_perforacion_s = {
+    "CR18": 0.2,
+    "CR16": 0.3,
+    "CR14": 0.4,
+    "HR14": 0.4,
+    "HR12": 0.5,
+    "HR1/8": 0.6,
+    "HR3/16": 1.0,
+    "HR1/4": 1.5,
+    "HR5/16": 2.0,
+    "HR3/8": 2.5,
+    "HR1/2": 3.5,
+    "INOX20": 0.2,
+    "INOX18": 0.3,
+    "INOX16": 0.4,
+    "INOX14": 0.5,
+    "INOX12": 0.7,
+    "INOX1/8": 0.9,
+    "INOX3/16": 1.3,
+    "ALUM1": 0.2,
+    "ALUM1,5": 0.3,
+    "ALUM2,5": 0.4,
+    "ALUM3": 0.5,
+    "ALUM4": 0.7,
+    "ALUM5": 0.9,
+    "ALUM6": 1.2,
+    "ACR1": 0.1,
+    "ACR2": 0.2,
+    "ACR3": 0.3,
+    "ACR4": 0.4,
+    "ACR5": 0.5,
+    "ACR6": 0.6,
+    "MDF1": 0.1,
+    "MDF2": 0.2,
+    "MDF3": 0.3,
+    "MDF4": 0.4,
+    "MDF5": 0.5,
+    "MDF6": 0.6,
+    "CARTON1": 0.1
+}
+
+# Velocidad de los desplazamientos en vacío entre contornos (mm/min) y
+# costo del minuto de máquina (COP) con el que se cobran
+VELOCIDAD_VACIO_MM_MIN = float(os.getenv("DXF_VELOCIDAD_VACIO_MM_MIN", "20000"))
+COSTO_MINUTO_MAQUINA = float(os.getenv("DXF_COSTO_MINUTO_MAQUINA", "1500"))
+
+
+# Modos de anidado para estimar el desperdicio: "rect" usa el rectángulo
+# envolvente de la pieza, "forma" su silueta real (ver shape_nesting)
+MODOS_NESTING = ("rect", "forma")
+MODO_NESTING = os.getenv("DXF_NESTING_MODO", "rect")
+
+
+# (cantidad mínima, % de descuento), de mayor a menor
+TRAMOS_DESCUENTO = (
+    (500, 40),
+    (250, 30),
+    (100, 25),
+    (50, 20),
+    (10, 15),
+    (5, 10),
+    (2, 5),
+)
+
+
 def calcular_descuento(cantidad):
     """
     Retorna el porcentaje de descuento según la cantidad de piezas.
     """
-    if cantidad >= 500:
-        return 40  # 40% de descuento
-    elif cantidad >= 250:
-        return 30  # 30% de descuento
-    elif cantidad >= 100:
-        return 25  # 25% de descuento
-    elif cantidad >= 50:
-        return 20  # 20% de descuento
-    elif cantidad >= 10:
-        return 15  # 15% de descuento
-    elif cantidad >= 5:
-        return 10  # 10% de descuento
-    elif cantidad >= 2:
-        return 5  # 5% de descuento
+    for minimo, descuento in TRAMOS_DESCUENTO:
+        if cantidad >= minimo:
+            return descuento
+    return 0  # Sin descuento para una sola pieza
 
-    else:
-        return 0  # Sin descuento para menos de 1 pieza
 
+def calcular_descuento_vec(cantidades):
+    """Versión vectorizada de `calcular_descuento` para un array de cantidades."""
+    minimos = np.array([m for m, _ in reversed(TRAMOS_DESCUENTO)])
+    descuentos = np.array([0] + [d for _, d in reversed(TRAMOS_DESCUENTO)])
+    return descuentos[np.searchsorted(minimos, np.asarray(cantidades), side="right")]
 
-def process_dxf_file(file_path, material, cantidad):
-    try:
-        # Validar material
+
+def analizar_dxf(file_path, preview_px: int = 0, avance=None, simplificada: bool = False):
+    """
+    Lee el DXF y extrae las magnitudes geométricas de la pieza. No depende
+    del material ni de la cantidad, así que puede cachearse por archivo.
+    Con `preview_px` > 0 incluye también la vista previa (bytes PNG y SVG).
+    `avance(etapa)`, si se da, se llama al empezar cada etapa.
+    Con `simplificada` (archivos muy pesados, ver preflight) la geometría
+    se limpia con una tolerancia más gruesa y el orden de corte queda en
+    el vecino más cercano, sin 2-opt.
+    Lanza ValueError si la pieza mide más de DXF_MAX_EXTENSION_MM.
+    """
+    if avance:
+        avance("parse")
+    geometria, limpieza = cargar_geometria_limpia(file_path, simplificada)
+    if avance:
+        avance("geometry")
+    contar("dxf_entidades_procesadas_total", geometria.total_entities)
+
+    largest_area = 0.0
+    ancho, alto = 0, 0  # Definir valores predeterminados
+
+    # Contornos cerrados (líneas y arcos encadenados incluidos): área,
+    # huecos, perforaciones y bounding box de toda la pieza
+    with span("bounds"):
+        contornos = construir_contornos(geometria)
+    if len(contornos.areas):
+        largest_area = contornos.areas.max()
+    if contornos.limites_pieza:
+        min_x, min_y, max_x, max_y = contornos.limites_pieza
+        ancho = max_x - min_x
+        alto = max_y - min_y
+    # Con la geometría real: la extensión del header no es confiable
+    if max(ancho, alto) > MAX_EXTENSION_MM:
+        raise ValueError(f"El dibujo mide más de {MAX_EXTENSION_MM:g} mm.")
+
+    # Orden de corte (huecos antes que exteriores) y desplazamiento en vacío
+    with span("sequence"):
+        secuencia = secuenciar(contornos, pasadas=0) if simplificada else secuenciar(contornos)
+
+    # Silueta para el anidado por forma (se calcula una vez por archivo). Su
+    # área sale de los contornos si todos cierran; si no, del raster
+    if avance:
+        avance("nesting")
+    with span("nesting"):
+        area_exterior = contornos.area_exterior if not contornos.abiertos else None
+        huella = huella_pieza(geometria, area_exterior=area_exterior)
+
+    resumen = {
+        "total_perimeter": perimetro_total(geometria),
+        "longitud_lineas": longitud_pliegue(geometria),
+        "total_entities": geometria.total_entities,
+        "largest_area": float(largest_area),
+        "ancho": float(ancho),
+        "alto": float(alto),
+        "area_neta": contornos.area_neta,
+        "contornos": len(contornos.areas),
+        "huecos": contornos.huecos,
+        "perforaciones": contornos.perforaciones,
+        "recorrido_vacio_mm": secuencia.recorrido_vacio,
+        "huella": huella,
+        "limpieza": limpieza,
+        "simplificada": simplificada,
+    }
+    if preview_px:
+        if avance:
+            avance("preview")
+        with span("render"):
+            resumen["preview_png"] = renderizar_png(geometria, preview_px)
+            resumen["preview_svg"] = renderizar_svg(geometria)
+    return resumen
+
+
+def cotizar_matriz(geometria, materiales, cantidades, modo_nesting=MODO_NESTING):
+    """
+    Evalúa el modelo de costos para todas las combinaciones material × cantidad
+    con operaciones sobre arrays. Los costos por pieza tienen forma (M,), el
+    descuento (C,) y los precios (M, C).
+    Con `modo_nesting="forma"` el material y el desperdicio salen de la
+    silueta de la pieza en vez de su rectángulo envolvente.
+    """
+    # Validar material
+    for material in materiales:
         if material not in Metro_perimetro_corte or material not in Valor_lamina_m2:
             raise ValueError(f"Material '{material}' no encontrado.")
+    q = np.asarray(cantidades, dtype=np.int64)
+    if len(q) == 0 or np.any(q < 1):
+        raise ValueError("Las cantidades deben ser enteros mayores o iguales a 1.")
+    if modo_nesting not in MODOS_NESTING:
+        raise ValueError(f"Modo de anidado '{modo_nesting}' no soportado.")
+    huella = geometria.get("huella") if modo_nesting == "forma" else None
+
+    ancho = geometria["ancho"]
+    alto = geometria["alto"]
+
+    # Costo por pliegue/metro lineal estimado
+    pliegue = np.array([Valor_pliegue_ml.get(m, 0) for m in materiales], dtype=np.float64)
+    costo_lineas = pliegue * (geometria["longitud_lineas"]/1000.0)
+
+    # Costos base (Colombia)
+    # Perímetro en metros (DXF suele estar en mm; ajustar según tu origen)
+    perimetro_m = geometria["total_perimeter"] / 1000.0
+    costo_corte = np.array([Metro_perimetro_corte[m] for m in materiales], dtype=np.float64) * perimetro_m
+
+    # Cada contorno empieza con una perforación
+    perforaciones = geometria.get("perforaciones", 0)
+    costo_perforaciones = np.array([Costo_perforacion.get(m, 0) for m in materiales], dtype=np.float64) * perforaciones
+
+    # Tiempo de máquina por pieza (min): corte, perforaciones y desplazamientos
+    # en vacío según la secuencia de corte. El corte y las perforaciones ya
+    # se cobran arriba; el vacío se cobra por minuto de máquina
+    recorrido_vacio_mm = geometria.get("recorrido_vacio_mm", 0.0)
+    tiempo_corte_min = geometria["total_perimeter"] / np.array(
+        [Velocidad_corte_mm_min[m] for m in materiales], dtype=np.float64)
+    tiempo_perforacion_min = np.array(
+        [Tiempo_perforacion_s.get(m, 0) for m in materiales], dtype=np.float64) * perforaciones / 60.0
+    tiempo_vacio_min = recorrido_vacio_mm / VELOCIDAD_VACIO_MM_MIN
+    tiempo_maquina_min = tiempo_corte_min + tiempo_perforacion_min + tiempo_vacio_min
+    costo_recorrido = np.full(len(materiales), tiempo_vacio_min * COSTO_MINUTO_MAQUINA)
+
+    # Lámina de cada material: la del catálogo con menor costo por pieza
+    # (ver sheet_catalog). Los anidados están memoizados por pieza y lámina
+    with span("nesting"):
+        elecciones = [
+            elegir_hoja(m, ancho, alto, huella, rotacion=m not in MATERIALES_SIN_ROTACION)
+            for m in materiales
+        ]
+    desperdicio_porcentaje = np.array([e.desperdicio for e in elecciones], dtype=np.float64)
+    factor_hoja = np.array([e.hoja.factor_precio for e in elecciones], dtype=np.float64)
+
+    # Costo de material (área m2 a partir de ancho x alto, en mm -> m)
+    area_m2 = (ancho/1000.0) * (alto/1000.0)
+    if huella is not None:
+        area_m2 = huella.area / 1e6
+    costo_lamina = np.array([Valor_lamina_m2[m] for m in materiales], dtype=np.float64) * max(area_m2, 0.0001)  # piso mínimo
+    # El precio de la lámina elegida (retal) afecta al material y a todo lo
+    # que se calcula sobre él
+    costo_material = costo_lamina * factor_hoja
+
+    # Gastos adicionales (heurísticos)
+    desperdicio_mat = costo_material * (desperdicio_porcentaje/100.0)
+    transporte_mat = costo_material * 0.05
+    almacenaje_mat = costo_material * 0.03
+    alistamiento = np.full(len(materiales), 15000.0)
+
+    costo_bruto = (
+        costo_corte
+        + costo_perforaciones
+        + costo_recorrido
+        + costo_material
+        + costo_lineas
+        + desperdicio_mat
+        + transporte_mat
+        + almacenaje_mat
+        + alistamiento
+    )
+
+    # Utilidad variable
+    utilidad = calcular_utilidad_vec(costo_bruto)
+    precio_total = costo_bruto * utilidad  # sin IVA
+
+    # IVA 19% (CO)
+    precio_total *= 1.19
+
+    # Aplicar descuento por cantidad
+    descuento_porcentaje = calcular_descuento_vec(q)
+    descuento_valor = (precio_total[:, None] * descuento_porcentaje[None, :]) / 100
+    precio_final = precio_total[:, None] - descuento_valor
 
-        # Leer el archivo DXF
-        doc = ezdxf.readfile(file_path)
-        modelspace = doc.modelspace()
-
-        total_perimeter = 0.0
-        largest_area = 0.0
-        costo_lineas = 0.0  # Costo acumulado de las líneas
-        total_entities = 0
-        ancho, alto = 0, 0  # Definir valores predeterminados
-
-        # Recorrer entidades
-        for entity in modelspace:
-            total_entities += 1
-            if entity.dxftype() == "LINE":
-                start = entity.dxf.start
-                end = entity.dxf.end
-                total_perimeter += math.dist((start.x, start.y), (end.x, end.y))
-                # Costo por pliegue/metro lineal estimado
-                costo_lineas += Valor_pliegue_ml.get(material, 0) * (math.dist((start.x, start.y), (end.x, end.y))/1000.0)
-
-            elif entity.dxftype() == "CIRCLE":
-                radius = entity.dxf.radius
-                total_perimeter += 2 * math.pi * radius
-
-            elif entity.dxftype() == "ARC":
-                radius = entity.dxf.radius
-                start_angle = math.radians(entity.dxf.start_angle)
-                end_angle = math.radians(entity.dxf.end_angle)
-                angle_diff = (end_angle - start_angle) % (2 * math.pi)
-                total_perimeter += radius * angle_diff
-
-            elif entity.dxftype() in ["LWPOLYLINE", "POLYLINE"]:
-                # Perímetro aproximado (suma de segmentos)
-                try:
-                    points = np.array([ (p[0], p[1]) for p in entity.get_points() ])
-                    segs = np.sqrt(np.sum(np.diff(points, axis=0)**2, axis=1)).sum()
-                    # cerrar si es cerrada
-                    if entity.closed:
-                        segs += math.dist(tuple(points[-1]), tuple(points[0]))
-                    total_perimeter += segs
-                    costo_lineas += Valor_pliegue_ml.get(material, 0) * (segs/1000.0)
-                except Exception:
-                    pass
-
-        # Área y bounding box (mayor entidad cerrada)
-        area_bounds = calculate_area_and_bounds(modelspace)
-        if area_bounds:
-            largest_area = area_bounds["area"]
-            bounds = area_bounds["bounds"]
-            ancho = abs(bounds["max_x"] - bounds["min_x"])
-            alto = abs(bounds["max_y"] - bounds["min_y"])
-
-        # Costos base (Colombia)
-        # Perímetro en metros (DXF suele estar en mm; ajustar según tu origen)
-        perimetro_m = total_perimeter / 1000.0
-        costo_corte = Metro_perimetro_corte[material] * perimetro_m
-
-        # Costo de material (área m2 a partir de ancho x alto, en mm -> m)
-        area_m2 = (ancho/1000.0) * (alto/1000.0)
-        costo_material = Valor_lamina_m2[material] * max(area_m2, 0.0001)  # piso mínimo
-
-        # Gastos adicionales (heurísticos)
-        desperdicio_porcentaje = calcular_desperdicio(ancho, alto)  # porcentaje
-        desperdicio_mat = costo_material * (desperdicio_porcentaje/100.0)
-        transporte_mat = costo_material * 0.05
-        almacenaje_mat = costo_material * 0.03
-        alistamiento = 15000
-
-        costo_bruto = (
-            costo_corte
-            + costo_material
-            + costo_lineas
-            + desperdicio_mat
-            + transporte_mat
-            + almacenaje_mat
-            + alistamiento
-        )
-
-        # Utilidad variable
-        utilidad = calcular_utilidad(costo_bruto)
-        precio_total = costo_bruto * utilidad  # sin IVA
-
-        # IVA 19% (CO)
-        precio_total *= 1.19
-
-        print(f"Entidades procesadas: {total_entities}")
-        print(f"Perímetro total: {round(total_perimeter)} mm")
-        print(f"Utilidad aplicada: {utilidad}")
-        print(f"Costo de corte: {round(costo_corte):,} COP")
-        print(f"Costo doblez: {round(costo_lineas):,} COP")
-        print(f"Costo de material: {round(costo_material):,} COP")
-        print(f"Costo desperdicio: {round(desperdicio_mat):,} COP")
-        print(f"Costo de transporte: {round(transporte_mat):,} COP")
-        print(f"Costo de almacenaje: {round(almacenaje_mat):,} COP")
-        print(f"Costo de alistamiento: {round(alistamiento):,} COP")
-        print(f"Costo bruto: {round(costo_bruto):,} COP")
-        print(f"Costo total: {round(precio_total):,} COP")
-
-        # Aplicar descuento por cantidad
-        descuento_porcentaje = calcular_descuento(cantidad)
-        descuento_valor = (precio_total * descuento_porcentaje) / 100
-        precio_final = precio_total - descuento_valor
-        precio_unitario_descuento = precio_final / cantidad
-        precio_unitario_sin_descuento = precio_total / cantidad
-        return {
-            "status": "success",  # <-- clave para que el router no lance 422
-            "precio_unitario_con_descuento": precio_unitario_descuento,
-            "precio_unitario_sin_descuento": precio_unitario_sin_descuento,
-            "descuento_porcentaje": descuento_porcentaje,
-            "descuento_valor": descuento_valor,
-            "precio_final": precio_final,
-            "costo_bruto": costo_bruto,
-            "total_perimeter": total_perimeter,
-            "total_entities": total_entities,
-            "costo_material": costo_material * cantidad,
-            "costo_corte": costo_corte * cantidad,
-            "costo_doblez": costo_lineas,
-            "costo_transporte": transporte_mat * cantidad,
-            "alistamiento": alistamiento * cantidad,
-            "costo_almacenamiento": almacenaje_mat * cantidad,
-            "ancho" : ancho,
-            "alto" : alto,
-            "Porcentaje_desperdicio": desperdicio_porcentaje,
-            "costo_desperdicio": desperdicio_mat * cantidad
-        }
+    return {
+        "modo_nesting": modo_nesting if huella is not None else "rect",
+        "cantidades": q,
+        "utilidad": utilidad,
+        "costo_lineas": costo_lineas,
+        "costo_corte": costo_corte,
+        "costo_perforaciones": costo_perforaciones,
+        "costo_recorrido": costo_recorrido,
+        "tiempo_maquina_min": tiempo_maquina_min,
+        "costo_material": costo_material,
+        "hojas": elecciones,
+        "Porcentaje_desperdicio": desperdicio_porcentaje,
+        "desperdicio_mat": desperdicio_mat,
+        "transporte_mat": transporte_mat,
+        "almacenaje_mat": almacenaje_mat,
+        "alistamiento": alistamiento,
+        "costo_bruto": costo_bruto,
+        "precio_total": precio_total,
+        "descuento_porcentaje": descuento_porcentaje,
+        "descuento_valor": descuento_valor,
+        "precio_final": precio_final,
+        "precio_unitario_con_descuento": precio_final / q[None, :],
+        "precio_unitario_sin_descuento": precio_total[:, None] / q[None, :],
+    }
+
+
+def cotizar_geometria(geometria, material, cantidad, modo_nesting=MODO_NESTING):
+    """
+    Calcula los costos y el precio a partir de la geometría devuelta por
+    `analizar_dxf` (una celda de `cotizar_matriz`).
+    """
+    m = cotizar_matriz(geometria, [material], [cantidad], modo_nesting)
+    total_perimeter = geometria["total_perimeter"]
+    total_entities = geometria["total_entities"]
+
+    costo_corte = float(m["costo_corte"][0])
+    costo_perforaciones = float(m["costo_perforaciones"][0])
+    costo_recorrido = float(m["costo_recorrido"][0])
+    tiempo_maquina_min = float(m["tiempo_maquina_min"][0])
+    costo_material = float(m["costo_material"][0])
+    costo_lineas = float(m["costo_lineas"][0])
+    desperdicio_mat = float(m["desperdicio_mat"][0])
+    transporte_mat = float(m["transporte_mat"][0])
+    almacenaje_mat = float(m["almacenaje_mat"][0])
+    alistamiento = float(m["alistamiento"][0])
+    costo_bruto = float(m["costo_bruto"][0])
+    precio_total = float(m["precio_total"][0])
+    eleccion = m["hojas"][0]
+
+    # Detalle del cálculo en una sola línea estructurada (ver app.services.logs)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Cotización calculada", extra={"datos": {
+            "material": material,
+            "cantidad": cantidad,
+            "entidades": total_entities,
+            "perimetro_mm": round(total_perimeter),
+            "utilidad": float(m["utilidad"][0]),
+            "costo_corte": round(costo_corte),
+            "costo_perforaciones": round(costo_perforaciones),
+            "costo_recorrido": round(costo_recorrido),
+            "tiempo_maquina_min": round(tiempo_maquina_min, 2),
+            "costo_doblez": round(costo_lineas),
+            "costo_material": round(costo_material),
+            "hoja": eleccion.hoja.nombre,
+            "costo_desperdicio": round(desperdicio_mat),
+            "costo_transporte": round(transporte_mat),
+            "costo_almacenaje": round(almacenaje_mat),
+            "costo_alistamiento": round(alistamiento),
+            "costo_bruto": round(costo_bruto),
+            "costo_total": round(precio_total),
+        }})
+
+    return {
+        "status": "success",  # <-- clave para que el router no lance 422
+        "material": material,
+        "cantidad": cantidad,
+        "precio_unitario_con_descuento": float(m["precio_unitario_con_descuento"][0, 0]),
+        "precio_unitario_sin_descuento": float(m["precio_unitario_sin_descuento"][0, 0]),
+        "descuento_porcentaje": int(m["descuento_porcentaje"][0]),
+        "descuento_valor": float(m["descuento_valor"][0, 0]),
+        "precio_final": float(m["precio_final"][0, 0]),
+        "costo_bruto": costo_bruto,
+        "total_perimeter": total_perimeter,
+        "total_entities": total_entities,
+        "costo_material": costo_material * cantidad,
+        "costo_corte": costo_corte * cantidad,
+        "perforaciones": geometria.get("perforaciones", 0),
+        "costo_perforaciones": costo_perforaciones * cantidad,
+        "recorrido_vacio_mm": geometria.get("recorrido_vacio_mm", 0.0),
+        "costo_recorrido": costo_recorrido * cantidad,
+        "tiempo_maquina_min": tiempo_maquina_min * cantidad,
+        "area_neta": geometria.get("area_neta", 0.0),
+        "limpieza": geometria.get("limpieza"),
+        "simplificada": geometria.get("simplificada", False),
+        "costo_doblez": costo_lineas,
+        "costo_transporte": transporte_mat * cantidad,
+        "alistamiento": alistamiento * cantidad,
+        "costo_almacenamiento": almacenaje_mat * cantidad,
+        "ancho" : geometria["ancho"],
+        "alto" : geometria["alto"],
+        "Porcentaje_desperdicio": float(m["Porcentaje_desperdicio"][0]),
+        "costo_desperdicio": desperdicio_mat * cantidad,
+        "hoja": {
+            "nombre": eleccion.hoja.nombre,
+            "ancho": eleccion.hoja.ancho,
+            "alto": eleccion.hoja.alto,
+            "retal": eleccion.hoja.retal,
+            "piezas_por_hoja": eleccion.piezas,
+            "evaluadas": eleccion.evaluadas,
+            "candidatas": eleccion.candidatas,
+        },
+        "modo_nesting": m["modo_nesting"],
+    }
+
+
+def cotizar_lote(geometria, materiales, cantidades, modo_nesting=MODO_NESTING):
+    """Matriz de precios serializable (listas) para el endpoint de lote."""
+    m = cotizar_matriz(geometria, materiales, cantidades, modo_nesting)
+    return {
+        "status": "success",
+        "modo_nesting": m["modo_nesting"],
+        "materiales": list(materiales),
+        "cantidades": m["cantidades"].tolist(),
+        "ancho": geometria["ancho"],
+        "alto": geometria["alto"],
+        "total_perimeter": geometria["total_perimeter"],
+        "perforaciones": geometria.get("perforaciones", 0),
+        "recorrido_vacio_mm": geometria.get("recorrido_vacio_mm", 0.0),
+        "tiempo_maquina_min": m["tiempo_maquina_min"].tolist(),
+        "limpieza": geometria.get("limpieza"),
+        "simplificada": geometria.get("simplificada", False),
+        "descuento_porcentaje": m["descuento_porcentaje"].tolist(),
+        "costo_bruto": m["costo_bruto"].tolist(),
+        "Porcentaje_desperdicio": m["Porcentaje_desperdicio"].tolist(),
+        "hojas": [e.hoja.nombre for e in m["hojas"]],
+        "precio_final": m["precio_final"].tolist(),
+        "precio_unitario_con_descuento": m["precio_unitario_con_descuento"].tolist(),
+        "precio_unitario_sin_descuento": m["precio_unitario_sin_descuento"].tolist(),
+        "descuento_valor": m["descuento_valor"].tolist(),
+    }
 
+
+def process_dxf_file(file_path, material, cantidad):
+    try:
+        escaneo = escanear(file_path)
+        if escaneo.ruta == "rechazado":
+            return {"status": "failed", "error": escaneo.motivo, "preflight": escaneo.resumen()}
+        geometria = analizar_dxf(file_path, simplificada=escaneo.ruta == "simplificado")
+        return cotizar_geometria(geometria, material, cantidad)
     except Exception as e:
         return {"status": "failed", "error": str(e)}
 
 
+UTILIDAD_MAXIMA = 1.6
+UTILIDAD_MINIMA = 1.2
+COSTO_UTILIDAD_MINIMA = 100000
+
+
 def calcular_utilidad(costo_bruto):
     """
     Calcula la utilidad en función del costo bruto.
     Si el costo es de $1, la utilidad es del 60% (1.6).
-    Si el costo es de $500,000 o más, la utilidad es del 20% (1.2).
+    Si el costo es de $100,000 o más, la utilidad es del 20% (1.2).
     """
-    if costo_bruto < 100000:
-        # Utilidad decreciente linealmente desde 1.6 a 1.2 entre $1 y $500,000
-        utilidad = 1.6 - ((1.6 - 1.2) * (costo_bruto - 1) / (100000 - 1))
+    if costo_bruto < COSTO_UTILIDAD_MINIMA:
+        # Utilidad decreciente linealmente desde 1.6 a 1.2 entre $1 y $100,000
+        utilidad = UTILIDAD_MAXIMA - ((UTILIDAD_MAXIMA - UTILIDAD_MINIMA) * (costo_bruto - 1) / (COSTO_UTILIDAD_MINIMA - 1))
     else:
-        utilidad = 1.2
+        utilidad = UTILIDAD_MINIMA
     return utilidad
 
 
+def calcular_utilidad_vec(costos_brutos):
+    """Versión vectorizada de `calcular_utilidad`."""
+    c = np.asarray(costos_brutos, dtype=np.float64)
+    decreciente = UTILIDAD_MAXIMA - ((UTILIDAD_MAXIMA - UTILIDAD_MINIMA) * (c - 1) / (COSTO_UTILIDAD_MINIMA - 1))
+    return np.where(c < COSTO_UTILIDAD_MINIMA, decreciente, UTILIDAD_MINIMA)
+
+
 def calculate_perimeter(entity):
     # Implementación original aquí (perímetros de LINE, CIRCLE, ARC, LWPOLYLINE/POLYLINE)
     # Si tu implementación previa ya funcionaba, consérvala.
@@ -384,140 +778,64 @@ def calculate_perimeter(entity):
     return 0.0
 
 
-def calculate_area_and_bounds(modelspace):
+def calculate_area_and_bounds(geometria):
     """
     Busca una entidad cerrada para estimar área y bounding box. Si no encuentra,
     intenta con una envolvente a partir de las entidades presentes.
+    Acepta una GeometriaDXF (o un modelspace, que se extrae primero).
     """
-    min_x = float("inf")
-    min_y = float("inf")
-    max_x = float("-inf")
-    max_y = float("-inf")
-    area = 0.0
-
-    for e in modelspace:
-        try:
-            if e.dxftype() == "CIRCLE":
-                c = e.dxf.center
-                r = e.dxf.radius
-                min_x = min(min_x, c.x - r)
-                min_y = min(min_y, c.y - r)
-                max_x = max(max_x, c.x + r)
-                max_y = max(max_y, c.y + r)
-                area = max(area, math.pi * r * r)
-            elif e.dxftype() == "LWPOLYLINE" and e.closed:
-                pts = np.array([(p[0], p[1]) for p in e.get_points()])
-                min_x = min(min_x, float(np.min(pts[:, 0])))
-                min_y = min(min_y, float(np.min(pts[:, 1])))
-                max_x = max(max_x, float(np.max(pts[:, 0])))
-                max_y = max(max_y, float(np.max(pts[:, 1])))
-                # Área por fórmula del polígono
-                x = pts[:, 0]
-                y = pts[:, 1]
-                poly_area = 0.5 * np.abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
-                area = max(area, float(poly_area))
-        except Exception:
-            continue
-
-    if min_x == float("inf"):
-        return None  # Si no es polilínea cerrada ni círculo, retornar None
+    if not isinstance(geometria, GeometriaDXF):
+        geometria = extraer_geometria(geometria)
+
+    # Candidatos: círculos y LWPOLYLINE cerradas
+    c = geometria.circulos
+    cerradas = geometria.poly_cerrada & geometria.poly_lw
+    idx = np.repeat(cerradas, np.diff(geometria.poly_offsets))
+    pts = geometria.poly_vertices[idx]
+
+    if len(c) == 0 and len(pts) == 0:
+        # Sin entidades cerradas: contornos encadenados a partir de líneas,
+        # arcos y polilíneas abiertas (None si no hay geometría)
+        contornos = construir_contornos(geometria)
+        if contornos.limites_pieza is None:
+            return None
+        min_x, min_y, max_x, max_y = contornos.limites_pieza
+        return {
+            "area": float(contornos.areas.max()) if len(contornos.areas) else 0.0,
+            "bounds": {"min_x": min_x, "max_x": max_x, "min_y": min_y, "max_y": max_y},
+        }
+
+    xs = np.concatenate([c[:, 0] - c[:, 2], c[:, 0] + c[:, 2], pts[:, 0]])
+    ys = np.concatenate([c[:, 1] - c[:, 2], c[:, 1] + c[:, 2], pts[:, 1]])
+    # Área por fórmula del polígono
+    areas = np.concatenate([np.pi * c[:, 2] ** 2, areas_polilineas(geometria)[cerradas]])
 
     return {
-        "area": area,
+        "area": float(areas.max()) if len(areas) else 0.0,
         "bounds": {
-            "min_x": min_x,
-            "max_x": max_x,
-            "min_y": min_y,
-            "max_y": max_y
+            "min_x": float(xs.min()),
+            "max_x": float(xs.max()),
+            "min_y": float(ys.min()),
+            "max_y": float(ys.max())
         }
     }
 
 
-def calcular_desperdicio(ancho, alto, save_best_png_path: str | None = None):
-   
-    # Dimensiones de la lámina
-    sheet_width = 2440
-    sheet_height = 1220
-    total_area = sheet_width * sheet_height
-    rect_area = (ancho) * (alto)  
-
-    # Si la figura es más grande que la lámina, no cabe ninguna y el desperdicio es la lámina completa.
-    if rect_area > total_area:
-        return total_area
-
-    # Cota superior teórica: máximo número de figuras que caben por área
-    max_possible = int(total_area // rect_area)
-    low, high = 0, max_possible
-    best = 0
-    best_packing = None  # Aquí guardaremos la mejor configuración
-    rects_to_pack = []
-
-    # Búsqueda binaria sobre cuántas figuras intentar empacar
-    while low <= high:
-        mid = (low + high) // 2
-
-        # Re-inicializamos el packer para cada intento
-        packer = newPacker(rotation=False)  # Permitir rotación si no es prohibido por material
-
-        # Intentamos empacar 'mid' rectángulos
-        rects_to_pack = [(ancho, alto, i + 1) for i in range(mid)]
-        for w, h, rid in rects_to_pack:
-            packer.add_rect(w, h, rid)
-
-        packer.add_bin(sheet_width, sheet_height)  # Una sola lámina
-
-        # Ejecutamos el packing
-        packer.pack()
-
-        # Obtenemos resultado
-        all_rects = packer[0].rect_list() if len(packer) else []
-
-        # Verificamos si se pudieron empacar todos los rectángulos
-        packed_ids = set(r[5] for r in all_rects)  # r = (x, y, w, h, rid?, id)
-        if len(packed_ids) == mid:
-            # Actualizamos el mejor resultado encontrado
-            best = mid
-            best_packing = all_rects.copy()  # Guardamos la configuración actual
-            low = mid + 1
-        else:
-            # Si no se pudieron empaquetar todos, reducimos el número a probar
-            high = mid - 1
-
-    # Calculamos el área utilizada y el desperdicio (en porcentaje)
-    used_area = best * rect_area
-    desperdicio = (1 - used_area / total_area) * 100
-
-    print("Máximo teórico de piezas (por área):", max_possible)
-    print("Rectángulos empaquetados:", best)
-
-    # Generar imagen con matplotlib de la configuración empacada
-    if best_packing:
-        fig, ax = plt.subplots(figsize=(10, 5))
-
-        # Dibujar la lámina
-        sheet = patches.Rectangle((0, 0), sheet_width, sheet_height, edgecolor='black', facecolor='lightgrey', alpha=0.3)
-        ax.add_patch(sheet)
-
-        # Dibujar cada rectángulo
-        colors = ['blue', 'red', 'green', 'purple', 'orange', 'cyan', 'magenta', 'yellow']  # Colores diferentes para cada rectángulo
-        for i, r in enumerate(best_packing):
-            x, y, w, h, _, rid = r  # x, y, width, height, rid?, id
-            # Dibujar un rectángulo con un color de borde y una cara transparente
-            color = colors[i % len(colors)]
-            rect = patches.Rectangle((x, y), w, h, linewidth=1, edgecolor=color, facecolor='none')
-            ax.add_patch(rect)
-            # Añadir el ID del rectángulo dentro
-            ax.text(x + w/2, y + h/2, str(rid), color='white', ha='center', va='center', fontsize=8)
-        
-        ax.set_xlim(0, sheet_width)
-        ax.set_ylim(0, sheet_height)
-        ax.set_aspect('equal')
-        plt.title("Anidado de rectángulos")
-        plt.xlabel("X")
-        plt.ylabel("Y")
-        if save_best_png_path:
-            plt.tight_layout()
-            plt.gcf().savefig(save_best_png_path, dpi=150, bbox_inches="tight")
-        plt.close()
+def calcular_desperdicio(ancho, alto, save_best_png_path: str | None = None,
+                         rotacion: bool = True, kerf: float = KERF_MM):
+    """
+    Porcentaje de la lámina que se desperdicia al anidar la mayor cantidad
+    posible de piezas ancho×alto (ver `anidar_rectangulos`).
+    """
+    resultado = anidar_rectangulos(float(ancho), float(alto), HOJA_ANCHO, HOJA_ALTO, kerf, rotacion)
+
+    # Calculamos el área utilizada y el desperdicio (en porcentaje).
+    # Si la figura no cabe en la lámina el desperdicio es la lámina completa.
+    desperdicio = (1 - resultado.aprovechamiento) * 100
+
+    # La imagen del anidado es una etapa aparte (ver `renderizar_nesting`)
+    if save_best_png_path:
+        renderizar_nesting(resultado, save_best_png_path)
 
     return desperdicio
+
@@ -0,0 +1,159 @@
+import mmap
+import os
+import re
+import numpy as np
+from app.services.geometry import TOLERANCIA_CURVAS, GeometriaDXF, armar_geometria
+
+
+# DXF_LECTOR_RAPIDO=0 desactiva el lector y siempre carga con ezdxf
+LECTOR_RAPIDO = os.getenv("DXF_LECTOR_RAPIDO", "1") != "0"
+
+# Entidades que el lector convierte; las de TIPOS_EZDXF necesitan el
+# documento completo (bloques, vértices, curvas) y el archivo se carga con
+# ezdxf. El resto no aporta geometría y solo se cuenta.
+TIPOS = {b"LINE": 1, b"CIRCLE": 2, b"ARC": 3, b"LWPOLYLINE": 4}
+TIPOS_EZDXF = frozenset({b"POLYLINE", b"SPLINE", b"ELLIPSE", b"INSERT"})
+
+# Un par (código 0, valor) solo puede empezar en una línea de código, así que
+# estos patrones no confunden un texto "ENTITIES" con el inicio de la sección
+_INICIO = re.compile(rb"^[ \t]*0\r?\nSECTION\r?\n[ \t]*2\r?\nENTITIES\r?\n", re.M)
+_FIN = re.compile(rb"^[ \t]*0\r?\nENDSEC\r?$", re.M)
+
+
+def _seccion_entidades(ruta: str) -> bytes | None:
+    """Bytes de la sección ENTITIES, buscada sobre el archivo mapeado en memoria."""
+    with open(ruta, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if mm[:18] == b"AutoCAD Binary DXF":
+                return None
+            inicio = _INICIO.search(mm)
+            if inicio is None:
+                return None
+            fin = _FIN.search(mm, inicio.end())
+            if fin is None:
+                return None
+            return mm[inicio.end():fin.start()]
+
+
+# Líneas de código que se decodifican a la vez (acota la memoria temporal)
+_BLOQUE_CODIGOS = 16384
+_POTENCIAS = 10 ** np.arange(9, dtype=np.int32)
+
+
+def _codigos(buf: np.ndarray, ini: np.ndarray, fin: np.ndarray) -> np.ndarray | None:
+    """Enteros de las líneas de código, sin crear un objeto por línea."""
+    codigos = np.zeros(len(ini), dtype=np.int32)
+    if len(ini) == 0:
+        return codigos
+    ancho = int((fin - ini).max())
+    if ancho > 8:
+        return None
+    for desde in range(0, len(ini), _BLOQUE_CODIGOS):
+        a, b = ini[desde:desde + _BLOQUE_CODIGOS], fin[desde:desde + _BLOQUE_CODIGOS]
+        pos = a[:, None] + np.arange(ancho, dtype=a.dtype)
+        car = np.where(pos < b[:, None], buf[np.minimum(pos, len(buf) - 1)], np.uint8(32))
+        digito = (car >= 48) & (car <= 57)
+        if not np.all(digito | (car == 32) | (car == 13) | (car == 9)) or not digito.any(axis=1).all():
+            return None  # códigos negativos o basura: que lo resuelva ezdxf
+        # Peso de cada dígito: 10 ** (dígitos a su derecha)
+        exponente = np.cumsum(digito[:, ::-1], axis=1, dtype=np.int8)[:, ::-1] - 1
+        valor = (car - 48).astype(np.int32) * _POTENCIAS[np.maximum(exponente, 0)]
+        codigos[desde:desde + len(a)] = (valor * digito).sum(axis=1, dtype=np.int32)
+    return codigos
+
+
+def leer_geometria(ruta: str, tol: float = TOLERANCIA_CURVAS) -> GeometriaDXF | None:
+    """
+    Lee la geometría del modelspace recorriendo los pares código/valor de
+    la sección ENTITIES, sin construir el documento de ezdxf. Devuelve None
+    si el archivo tiene algo que el lector no entiende (DXF binario,
+    bloques, curvas, POLYLINE...) y hay que cargarlo con ezdxf.
+    El resultado es el mismo que `extraer_geometria(doc.modelspace())`.
+    """
+    seccion = _seccion_entidades(ruta)
+    if seccion is None:
+        return None
+    # Límites de cada línea; los pares son (línea par, línea impar)
+    buf = np.frombuffer(seccion, dtype=np.uint8)
+    fin = np.flatnonzero(buf == 0x0A).astype(np.int32 if len(buf) < 2**31 else np.int64)
+    if len(fin) % 2:
+        return None
+    ini = np.empty_like(fin)
+    ini[0], ini[1:] = 0, fin[:-1] + 1
+    codigos = _codigos(buf, ini[0::2], fin[0::2])
+    if codigos is None:
+        return None
+    ini_valor, fin_valor = ini[1::2], fin[1::2]
+
+    def textos(pares: np.ndarray):
+        return (seccion[a:b] for a, b in zip(ini_valor[pares].tolist(), fin_valor[pares].tolist()))
+
+    def numeros(pares: np.ndarray) -> np.ndarray:
+        return np.fromiter(map(float, textos(pares)), np.float64, len(pares))
+
+    nuevas = codigos == 0
+    if len(codigos) and not nuevas[0]:
+        return None
+    entidad = np.cumsum(nuevas) - 1  # entidad de cada par
+    nombres = [n.strip() for n in textos(np.flatnonzero(nuevas))]
+
+    try:
+        # Las entidades con 67=1 son del paperspace y ezdxf no las incluye
+        en_papel = np.zeros(len(nombres), dtype=bool)
+        pares_67 = np.flatnonzero(codigos == 67)
+        en_papel[entidad[pares_67[numeros(pares_67) == 1]]] = True
+        tipo = np.array([TIPOS.get(n, 0) for n in nombres], dtype=np.int8)
+        if any(n in TIPOS_EZDXF for n, papel in zip(nombres, en_papel.tolist()) if not papel):
+            return None
+        tipo[en_papel] = -1
+        tipo_par = tipo[entidad]
+
+        def campos(t: int, *grupos) -> np.ndarray:
+            """(E, len(grupos)) con el primer valor de cada código por entidad del tipo t (0 si falta)."""
+            ids = np.flatnonzero(tipo == t)
+            posicion = np.full(len(tipo), -1, dtype=np.int64)
+            posicion[ids] = np.arange(len(ids))
+            salida = np.zeros((len(ids), len(grupos)))
+            for j, codigo in enumerate(grupos):
+                pares = np.flatnonzero((codigos == codigo) & (tipo_par == t))
+                ents, primero = np.unique(entidad[pares], return_index=True)
+                salida[posicion[ents], j] = numeros(pares[primero])
+            return salida
+
+        lineas = campos(1, 10, 20, 11, 21)
+        circulos = campos(2, 10, 20, 40)
+        arcos = campos(3, 10, 20, 40, 50, 51)
+
+        # LWPOLYLINE: cada 10/20 es un vértice y un 42 es el bulge del
+        # último vértice leído
+        es_lw = tipo_par == 4
+        pares_x = np.flatnonzero((codigos == 10) & es_lw)
+        pares_y = np.flatnonzero((codigos == 20) & es_lw)
+        if len(pares_x) != len(pares_y) or np.any(entidad[pares_x] != entidad[pares_y]):
+            return None
+        vertices = np.column_stack([numeros(pares_x), numeros(pares_y)])
+        bulges = np.zeros(len(pares_x))
+        pares_b = np.flatnonzero((codigos == 42) & es_lw)
+        vertice_b = np.cumsum((codigos == 10) & es_lw)[pares_b] - 1
+        propios = vertice_b >= 0
+        propios[propios] = entidad[pares_x[vertice_b[propios]]] == entidad[pares_b[propios]]
+        bulges[vertice_b[propios]] = numeros(pares_b[propios])
+
+        ids_lw = np.flatnonzero(tipo == 4)
+        posicion_lw = np.full(len(tipo), -1, dtype=np.int64)
+        posicion_lw[ids_lw] = np.arange(len(ids_lw))
+        conteos = np.bincount(posicion_lw[entidad[pares_x]], minlength=len(ids_lw))
+        cerradas = (campos(4, 70)[:, 0].astype(np.int64) & 1).astype(bool)
+    except (ValueError, IndexError):
+        return None
+
+    # Como en extraer_geometria, las LWPOLYLINE sin vértices no cuentan como polilínea
+    con_vertices = conteos > 0
+    conteos, cerradas = conteos[con_vertices], cerradas[con_vertices]
+    return armar_geometria(
+        lineas, circulos, arcos, vertices, bulges, conteos, cerradas,
+        np.ones(len(conteos), dtype=bool), np.zeros(len(conteos), dtype=bool),
+        int(np.count_nonzero(tipo >= 0)), tol,
+    )
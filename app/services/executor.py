@@ -0,0 +1,106 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.services import metrics, warmup
+
+
+# Configuración del pool (variables de entorno)
+# DXF_POOL_WORKERS=0 ejecuta en un hilo del mismo proceso (útil en desarrollo)
+POOL_WORKERS = int(os.getenv("DXF_POOL_WORKERS", str(os.cpu_count() or 1)))
+POOL_MAX_PENDIENTES = int(os.getenv("DXF_POOL_MAX_PENDING", str(max(POOL_WORKERS, 1) * 4)))
+POOL_TIMEOUT = float(os.getenv("DXF_POOL_TIMEOUT", "120"))
+
+
+class PoolSaturado(RuntimeError):
+    """La cola del pool está llena; el cliente debe reintentar más tarde."""
+
+
+class TiempoAgotado(RuntimeError):
+    """El trabajo superó el tiempo máximo permitido."""
+
+
+_executor = None
+_lock = threading.Lock()
+_en_vuelo = 0
+
+
+def _crear_executor():
+    if POOL_WORKERS <= 0:
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="dxf", initializer=warmup.iniciar_worker)
+    # "spawn" evita heredar hilos/locks del proceso de uvicorn
+    ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=ctx, initializer=warmup.iniciar_worker)
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = _crear_executor()
+        return _executor
+
+
+def _liberar(_future):
+    global _en_vuelo
+    with _lock:
+        _en_vuelo -= 1
+
+
+def capacidad():
+    """Trabajos que pueden estar ejecutándose o en cola al mismo tiempo."""
+    return max(POOL_WORKERS, 1) + POOL_MAX_PENDIENTES
+
+
+def en_vuelo():
+    return _en_vuelo
+
+
+async def ejecutar(func, *args, timeout: float | None = None):
+    """
+    Ejecuta `func(*args)` en el pool sin bloquear el event loop.
+    Lanza PoolSaturado si la cola está llena y TiempoAgotado si el trabajo
+    no termina en `timeout` segundos (por defecto DXF_POOL_TIMEOUT).
+    Los spans medidos dentro del pool se suman a la petición en curso.
+    """
+    global _executor, _en_vuelo
+    executor = get_executor()
+    with _lock:
+        if _en_vuelo >= capacidad():
+            raise PoolSaturado("Servidor ocupado, intenta de nuevo en unos segundos.")
+        _en_vuelo += 1
+
+    try:
+        future = executor.submit(metrics.en_worker, func, *args)
+    except BrokenProcessPool:
+        # Un worker murió (p. ej. por memoria): recrear el pool para la próxima petición
+        with _lock:
+            _en_vuelo -= 1
+            if _executor is executor:
+                _executor = None
+        raise
+    # El contador se libera cuando el proceso realmente termina, no cuando
+    # el cliente deja de esperar, para que la cota refleje la ocupación real.
+    future.add_done_callback(_liberar)
+
+    try:
+        resultado, tiempos, contadores = await asyncio.wait_for(asyncio.wrap_future(future), timeout or POOL_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise TiempoAgotado("El procesamiento del archivo tardó demasiado.")
+    except BrokenProcessPool:
+        with _lock:
+            if _executor is executor:
+                _executor = None
+        raise
+    metrics.fusionar(tiempos, contadores)
+    return resultado
+
+
+def cerrar():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
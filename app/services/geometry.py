@@ -0,0 +1,468 @@
+import os
+from dataclasses import dataclass, field
+import numpy as np
+
+
+# Desviación máxima (mm) entre una curva y los segmentos que la aproximan
+TOLERANCIA_CURVAS = float(os.getenv("DXF_TOLERANCIA_CURVAS", "0.05"))
+MAX_SEGMENTOS_CURVA = 512
+
+
+def _vacio(columnas):
+    return np.zeros((0, columnas), dtype=np.float64)
+
+
+@dataclass
+class GeometriaDXF:
+    """
+    Geometría del modelspace en arrays columnares (mm).
+
+    - lineas:        (N, 4)  x0, y0, x1, y1
+    - circulos:      (M, 3)  cx, cy, r
+    - arcos:         (K, 5)  cx, cy, r, ángulo inicial, ángulo final (grados)
+    - poly_vertices: (P, 2)  vértices de todas las polilíneas concatenados
+    - poly_offsets:  (Q+1,)  inicio de cada polilínea dentro de poly_vertices
+    - poly_cerrada:  (Q,)    polilínea cerrada
+    - poly_lw:       (Q,)    viene de una LWPOLYLINE (las POLYLINE 2D/3D no)
+    - poly_curva:    (Q,)    aproxima una curva (SPLINE, ELLIPSE o un arco/círculo
+                             de un bloque con escala no uniforme)
+    """
+    lineas: np.ndarray = field(default_factory=lambda: _vacio(4))
+    circulos: np.ndarray = field(default_factory=lambda: _vacio(3))
+    arcos: np.ndarray = field(default_factory=lambda: _vacio(5))
+    poly_vertices: np.ndarray = field(default_factory=lambda: _vacio(2))
+    poly_offsets: np.ndarray = field(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    poly_cerrada: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=bool))
+    poly_lw: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=bool))
+    poly_curva: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=bool))
+    total_entities: int = 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (
+            self.lineas, self.circulos, self.arcos, self.poly_vertices,
+            self.poly_offsets, self.poly_cerrada, self.poly_lw, self.poly_curva,
+        ))
+
+
+def _offsets(conteos) -> np.ndarray:
+    offsets = np.zeros(len(conteos) + 1, dtype=np.int64)
+    np.cumsum(conteos, out=offsets[1:])
+    return offsets
+
+
+def concatenar(geos) -> GeometriaDXF:
+    """Une varias geometrías en una sola (los offsets se desplazan)."""
+    geos = list(geos)
+    if len(geos) == 1:
+        return geos[0]
+    conteos = np.concatenate([np.diff(g.poly_offsets) for g in geos])
+    return GeometriaDXF(
+        lineas=np.concatenate([g.lineas for g in geos]),
+        circulos=np.concatenate([g.circulos for g in geos]),
+        arcos=np.concatenate([g.arcos for g in geos]),
+        poly_vertices=np.concatenate([g.poly_vertices for g in geos]),
+        poly_offsets=_offsets(conteos),
+        poly_cerrada=np.concatenate([g.poly_cerrada for g in geos]),
+        poly_lw=np.concatenate([g.poly_lw for g in geos]),
+        poly_curva=np.concatenate([g.poly_curva for g in geos]),
+        total_entities=sum(g.total_entities for g in geos),
+    )
+
+
+# ==== Curvas ====
+
+def segmentos_por_tolerancia(radios, barridos, tol: float = TOLERANCIA_CURVAS) -> np.ndarray:
+    """Segmentos necesarios para que la cuerda no se aparte más de `tol` del arco."""
+    radios = np.abs(np.asarray(radios, dtype=np.float64))
+    paso = 2 * np.arccos(np.clip(1 - tol / np.maximum(radios, 1e-12), -1.0, 1.0))
+    n = np.ceil(np.abs(barridos) / np.maximum(paso, 1e-9))
+    return np.clip(n, 1, MAX_SEGMENTOS_CURVA).astype(np.int64)
+
+
+def _parametros(inicio, barrido, n) -> tuple[np.ndarray, np.ndarray]:
+    """Parámetros t de n+1 muestras por curva, concatenados, y la curva de cada una."""
+    idx = np.repeat(np.arange(len(n)), n + 1)
+    k = np.arange(int((n + 1).sum())) - np.repeat(_offsets(n + 1)[:-1], n + 1)
+    return inicio[idx] + barrido[idx] * k / n[idx], idx
+
+
+def _aplanar_bulges(vertices, bulges, offsets, cerradas, tol) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sustituye cada tramo con bulge (arco entre dos vértices) por los vértices
+    intermedios del arco. Devuelve (vértices, offsets) nuevos.
+    """
+    conteos = np.diff(offsets)
+    idx = np.repeat(np.arange(len(conteos)), conteos)
+    siguiente = np.arange(1, len(vertices) + 1)
+    ultimo = offsets[1:] - 1
+    siguiente[ultimo] = offsets[:-1]
+    # El último vértice solo tiene tramo (de cierre) si la polilínea es cerrada
+    con_tramo = np.ones(len(vertices), dtype=bool)
+    con_tramo[ultimo] = cerradas
+    curvos = np.flatnonzero(con_tramo & (np.abs(bulges) > 1e-12))
+    if len(curvos) == 0:
+        return vertices, offsets
+
+    p0, p1, b = vertices[curvos], vertices[siguiente[curvos]], bulges[curvos]
+    cuerda = np.hypot(*(p1 - p0).T)
+    validos = cuerda > 1e-12
+    curvos, p0, p1, b, cuerda = curvos[validos], p0[validos], p1[validos], b[validos], cuerda[validos]
+    theta = 4 * np.arctan(b)
+    radio = cuerda / (2 * np.abs(np.sin(theta / 2)))
+    normal = np.column_stack([-(p1 - p0)[:, 1], (p1 - p0)[:, 0]]) / cuerda[:, None]
+    centro = (p0 + p1) / 2 + normal * (cuerda * (1 - b ** 2) / (4 * b))[:, None]
+    a0 = np.arctan2(p0[:, 1] - centro[:, 1], p0[:, 0] - centro[:, 0])
+    n = segmentos_por_tolerancia(radio, theta, tol)
+
+    # Puntos interiores de cada arco (sin los extremos, que ya son vértices)
+    t, arco = _parametros(a0, theta, n)
+    interior = np.ones(len(t), dtype=bool)
+    fin_arco = _offsets(n + 1)
+    interior[fin_arco[:-1]] = False
+    interior[fin_arco[1:] - 1] = False
+    t, arco = t[interior], arco[interior]
+    puntos = centro[arco] + radio[arco, None] * np.column_stack([np.cos(t), np.sin(t)])
+
+    # Cada vértice va seguido de los puntos interiores de su tramo
+    extra = np.zeros(len(vertices), dtype=np.int64)
+    extra[curvos] = n - 1
+    por_vertice = 1 + extra
+    destino = _offsets(por_vertice)[:-1]
+    salida = np.empty((int(por_vertice.sum()), 2))
+    salida[destino] = vertices
+    origen = np.repeat(destino[curvos] + 1, n - 1) + (
+        np.arange(int((n - 1).sum())) - np.repeat(_offsets(n - 1)[:-1], n - 1)
+    )
+    salida[origen] = puntos
+    nuevos_conteos = np.bincount(idx, weights=por_vertice, minlength=len(conteos)).astype(np.int64)
+    return salida, _offsets(nuevos_conteos)
+
+
+def _aplanar_elipses(elipses: np.ndarray, tol) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (E, 8): cx, cy, eje mayor (x, y), eje menor (x, y), parámetro inicial y
+    final. Devuelve (vértices, conteos, cerradas).
+    """
+    c, mayor, menor = elipses[:, 0:2], elipses[:, 2:4], elipses[:, 4:6]
+    inicio = elipses[:, 6]
+    barrido = np.mod(elipses[:, 7] - inicio, 2 * np.pi)
+    cerradas = barrido < 1e-9
+    barrido[cerradas] = 2 * np.pi
+    # Con el parámetro en pasos iguales la elipse es el círculo de radio a
+    # comprimido sobre el eje menor: la flecha no pasa la de ese círculo
+    radio = np.maximum(np.hypot(*mayor.T), np.hypot(*menor.T))
+    n = segmentos_por_tolerancia(radio, barrido, tol)
+    t, idx = _parametros(inicio, barrido, n)
+    puntos = c[idx] + np.cos(t)[:, None] * mayor[idx] + np.sin(t)[:, None] * menor[idx]
+    conteos = n + 1
+    # En las cerradas el último punto repite el primero
+    if cerradas.any():
+        fin = _offsets(conteos)[1:] - 1
+        puntos = np.delete(puntos, fin[cerradas], axis=0)
+        conteos = conteos - cerradas
+    return puntos, conteos, cerradas
+
+
+# ==== Bloques ====
+
+def _matriz_2d(insert) -> np.ndarray:
+    """Transformación afín 2D (3, 2) de un INSERT: filas ux, uy y traslación."""
+    m = insert.matrix44()
+    return np.array([[m[0, 0], m[0, 1]], [m[1, 0], m[1, 1]], [m[3, 0], m[3, 1]]], dtype=np.float64)
+
+
+def _transformar_puntos(puntos: np.ndarray, matrices: np.ndarray) -> np.ndarray:
+    """(P, 2) × (k, 3, 2) -> (k·P, 2)"""
+    return (np.einsum("pi,kij->kpj", puntos, matrices[:, :2]) + matrices[:, None, 2]).reshape(-1, 2)
+
+
+def transformar(geo: GeometriaDXF, matrices: np.ndarray) -> GeometriaDXF:
+    """
+    Copias de la geometría de un bloque, una por matriz (k, 3, 2). Los
+    círculos y arcos siguen siéndolo si la escala es uniforme; si no, pasan
+    a polilíneas.
+    """
+    k = len(matrices)
+    if k == 0:
+        return GeometriaDXF()
+    lineas = _transformar_puntos(geo.lineas.reshape(-1, 2), matrices).reshape(-1, 4)
+
+    ux, uy = matrices[:, 0], matrices[:, 1]
+    escala_x, escala_y = np.hypot(*ux.T), np.hypot(*uy.T)
+    uniforme = np.isclose(escala_x, escala_y, rtol=1e-9) & np.isclose((ux * uy).sum(axis=1), 0, atol=1e-9 * escala_x ** 2)
+    det = ux[:, 0] * uy[:, 1] - ux[:, 1] * uy[:, 0]
+
+    partes = [GeometriaDXF(lineas=lineas)]
+    mu = matrices[uniforme]
+    if len(mu):
+        c = geo.circulos
+        centros = _transformar_puntos(c[:, :2], mu)
+        radios = (escala_x[uniforme][:, None] * c[None, :, 2]).ravel()
+        circulos = np.column_stack([centros, radios])
+
+        a = geo.arcos
+        a0, a1 = np.radians(a[:, 3]), np.radians(a[:, 4])
+        extremos = np.column_stack([a[:, 0] + a[:, 2] * np.cos(a0), a[:, 1] + a[:, 2] * np.sin(a0),
+                                    a[:, 0] + a[:, 2] * np.cos(a1), a[:, 1] + a[:, 2] * np.sin(a1)])
+        c_t = _transformar_puntos(a[:, :2], mu)
+        ini = _transformar_puntos(extremos[:, 0:2], mu) - c_t
+        fin = _transformar_puntos(extremos[:, 2:4], mu) - c_t
+        ang_ini = np.degrees(np.arctan2(ini[:, 1], ini[:, 0]))
+        ang_fin = np.degrees(np.arctan2(fin[:, 1], fin[:, 0]))
+        # Una simetría invierte el sentido: se intercambian inicio y fin
+        espejo = np.repeat(det[uniforme] < 0, len(a))
+        # Los arcos completos (360°) conservan su barrido
+        completo = np.tile(np.isclose(np.mod(a[:, 4] - a[:, 3], 360), 0), len(mu))
+        ang_ini, ang_fin = np.where(espejo, ang_fin, ang_ini), np.where(espejo, ang_ini, ang_fin)
+        ang_fin = np.where(completo, ang_ini + 360, ang_fin)
+        radios_a = (escala_x[uniforme][:, None] * a[None, :, 2]).ravel()
+        arcos = np.column_stack([c_t, radios_a, ang_ini, ang_fin])
+        partes.append(GeometriaDXF(circulos=circulos, arcos=arcos))
+
+    # Polilíneas propias del bloque, y curvas donde la escala no es uniforme
+    poligonos = [(geo.poly_vertices, np.diff(geo.poly_offsets), geo.poly_cerrada, geo.poly_lw, geo.poly_curva, matrices)]
+    mn = matrices[~uniforme]
+    if len(mn) and (len(geo.circulos) or len(geo.arcos)):
+        circ = teselar_circulos(geo.circulos)[:, :-1]
+        arc = teselar_arcos(geo.arcos)
+        vertices = np.concatenate([circ.reshape(-1, 2), arc.reshape(-1, 2)])
+        conteos = np.concatenate([np.full(len(circ), circ.shape[1]), np.full(len(arc), arc.shape[1])]).astype(np.int64)
+        cerradas = np.arange(len(conteos)) < len(circ)
+        falso = np.zeros(len(conteos), dtype=bool)
+        poligonos.append((vertices, conteos, cerradas, falso, ~falso, mn))
+    for vertices, conteos, cerradas, lw, curva, mats in poligonos:
+        if len(conteos) == 0:
+            continue
+        partes.append(GeometriaDXF(
+            poly_vertices=_transformar_puntos(vertices, mats),
+            poly_offsets=_offsets(np.tile(conteos, len(mats))),
+            poly_cerrada=np.tile(cerradas, len(mats)),
+            poly_lw=np.tile(lw, len(mats)),
+            poly_curva=np.tile(curva, len(mats)),
+        ))
+    return concatenar(partes)
+
+
+def _geometria_bloque(insert, tol, bloques, pila) -> GeometriaDXF:
+    """Geometría de la definición del bloque, aplanada una sola vez por archivo."""
+    nombre = insert.dxf.name
+    if nombre not in bloques:
+        bloque = insert.block()
+        if bloque is None or nombre in pila:
+            return GeometriaDXF()
+        bloques[nombre] = _extraer(bloque, tol, bloques, pila + (nombre,))
+    return bloques[nombre]
+
+
+# ==== Extracción ====
+
+def armar_geometria(lineas, circulos, arcos, vertices, bulges, conteos, cerradas, lw, curva,
+                    total_entities: int, tol: float = TOLERANCIA_CURVAS) -> GeometriaDXF:
+    """
+    GeometriaDXF a partir de las entidades ya leídas (listas o arrays). Los
+    tramos con bulge de las polilíneas se aproximan con tolerancia `tol`.
+    """
+    offsets = _offsets(conteos)
+    poly_vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 2)
+    poly_cerrada = np.asarray(cerradas, dtype=bool)
+    poly_vertices, offsets = _aplanar_bulges(
+        poly_vertices, np.asarray(bulges, dtype=np.float64), offsets, poly_cerrada, tol,
+    )
+    return GeometriaDXF(
+        lineas=np.asarray(lineas, dtype=np.float64).reshape(-1, 4),
+        circulos=np.asarray(circulos, dtype=np.float64).reshape(-1, 3),
+        arcos=np.asarray(arcos, dtype=np.float64).reshape(-1, 5),
+        poly_vertices=poly_vertices,
+        poly_offsets=offsets,
+        poly_cerrada=poly_cerrada,
+        poly_lw=np.asarray(lw, dtype=bool),
+        poly_curva=np.asarray(curva, dtype=bool),
+        total_entities=total_entities,
+    )
+
+
+def extraer_geometria(modelspace, tol: float = TOLERANCIA_CURVAS) -> GeometriaDXF:
+    """
+    Recorre el modelspace una sola vez y vuelca la geometría a arrays.
+    SPLINE, ELLIPSE y los tramos con bulge se aproximan con tolerancia `tol`;
+    cada bloque se aplana una vez y se copia en cada INSERT.
+    """
+    return _extraer(modelspace, tol, {}, ())
+
+
+def _extraer(entidades, tol, bloques, pila) -> GeometriaDXF:
+    lineas, circulos, arcos, elipses = [], [], [], []
+    vertices, bulges, conteos, cerradas, lw, curva = [], [], [], [], [], []
+    inserts = {}  # nombre del bloque -> [matrices]
+    primer_insert = {}
+    total_entities = 0
+
+    def polilinea(puntos, bulge, cerrada, es_lw, es_curva):
+        vertices.extend(puntos)
+        bulges.extend(bulge)
+        conteos.append(len(puntos))
+        cerradas.append(cerrada)
+        lw.append(es_lw)
+        curva.append(es_curva)
+
+    for entity in entidades:
+        total_entities += 1
+        tipo = entity.dxftype()
+        if tipo == "LINE":
+            s, e = entity.dxf.start, entity.dxf.end
+            lineas.append((s.x, s.y, e.x, e.y))
+        elif tipo == "CIRCLE":
+            c = entity.dxf.center
+            circulos.append((c.x, c.y, entity.dxf.radius))
+        elif tipo == "ARC":
+            c = entity.dxf.center
+            arcos.append((c.x, c.y, entity.dxf.radius, entity.dxf.start_angle, entity.dxf.end_angle))
+        elif tipo in ("LWPOLYLINE", "POLYLINE"):
+            try:
+                if tipo == "LWPOLYLINE":
+                    puntos = [(p[0], p[1], p[2]) for p in entity.get_points("xyb")]
+                elif entity.is_2d_polyline:
+                    puntos = [(v.dxf.location.x, v.dxf.location.y, v.dxf.bulge) for v in entity.vertices]
+                else:
+                    puntos = [(p.x, p.y, 0.0) for p in entity.points()]
+            except Exception:
+                continue
+            if not puntos:
+                continue
+            polilinea([p[:2] for p in puntos], [p[2] for p in puntos], bool(entity.is_closed),
+                      tipo == "LWPOLYLINE", False)
+        elif tipo == "SPLINE":
+            try:
+                puntos = [(p.x, p.y) for p in entity.flattening(tol)]
+            except Exception:
+                continue
+            cerrada = len(puntos) > 2 and np.allclose(puntos[0], puntos[-1])
+            if cerrada:
+                puntos.pop()
+            if len(puntos) >= 2:
+                polilinea(puntos, [0.0] * len(puntos), cerrada, False, True)
+        elif tipo == "ELLIPSE":
+            c, mayor, menor = entity.dxf.center, entity.dxf.major_axis, entity.minor_axis
+            elipses.append((c.x, c.y, mayor.x, mayor.y, menor.x, menor.y,
+                            entity.dxf.start_param, entity.dxf.end_param))
+        elif tipo == "INSERT":
+            try:
+                copias = entity.multi_insert() if entity.mcount > 1 else (entity,)
+                nombre = entity.dxf.name
+                primer_insert.setdefault(nombre, entity)
+                inserts.setdefault(nombre, []).extend(_matriz_2d(ins) for ins in copias)
+            except Exception:
+                continue
+
+    partes = [armar_geometria(lineas, circulos, arcos, vertices, bulges, conteos, cerradas, lw, curva,
+                              total_entities, tol)]
+    if elipses:
+        puntos, conteos_e, cerradas_e = _aplanar_elipses(np.array(elipses, dtype=np.float64), tol)
+        partes.append(GeometriaDXF(
+            poly_vertices=puntos,
+            poly_offsets=_offsets(conteos_e),
+            poly_cerrada=cerradas_e,
+            poly_lw=np.zeros(len(conteos_e), dtype=bool),
+            poly_curva=np.ones(len(conteos_e), dtype=bool),
+        ))
+    for nombre, matrices in inserts.items():
+        bloque = _geometria_bloque(primer_insert[nombre], tol, bloques, pila)
+        partes.append(transformar(bloque, np.array(matrices)))
+    return concatenar(partes)
+
+
+# ==== Kernels vectorizados ====
+
+def _indice_polilinea(geo: GeometriaDXF) -> np.ndarray:
+    """Para cada vértice, el índice de la polilínea a la que pertenece."""
+    return np.repeat(np.arange(len(geo.poly_cerrada)), np.diff(geo.poly_offsets))
+
+
+def _indice_siguiente(geo: GeometriaDXF) -> np.ndarray:
+    """Índice del vértice siguiente dentro de su polilínea (el último vuelve al primero)."""
+    siguiente = np.arange(1, len(geo.poly_vertices) + 1)
+    if len(siguiente):
+        siguiente[geo.poly_offsets[1:] - 1] = geo.poly_offsets[:-1]
+    return siguiente
+
+
+def longitudes_lineas(geo: GeometriaDXF) -> np.ndarray:
+    l = geo.lineas
+    return np.hypot(l[:, 2] - l[:, 0], l[:, 3] - l[:, 1])
+
+
+def longitudes_arcos(geo: GeometriaDXF) -> np.ndarray:
+    a = geo.arcos
+    barrido = np.mod(np.radians(a[:, 4]) - np.radians(a[:, 3]), 2 * np.pi)
+    return a[:, 2] * barrido
+
+
+def longitudes_polilineas(geo: GeometriaDXF) -> np.ndarray:
+    """Longitud de cada polilínea, incluyendo el tramo de cierre si es cerrada."""
+    n = len(geo.poly_cerrada)
+    if n == 0:
+        return np.zeros(0)
+    v = geo.poly_vertices
+    idx = _indice_polilinea(geo)
+    siguiente = _indice_siguiente(geo)
+    tramos = np.hypot(*(v[siguiente] - v).T)
+    # El tramo último -> primero solo cuenta en las cerradas
+    ultimo = np.zeros(len(v), dtype=bool)
+    ultimo[geo.poly_offsets[1:] - 1] = True
+    validos = ~ultimo | geo.poly_cerrada[idx]
+    return np.bincount(idx[validos], weights=tramos[validos], minlength=n)
+
+
+def areas_polilineas(geo: GeometriaDXF) -> np.ndarray:
+    """Área (fórmula del polígono) de cada polilínea tomada como cerrada."""
+    n = len(geo.poly_cerrada)
+    if n == 0:
+        return np.zeros(0)
+    v = geo.poly_vertices
+    siguiente = _indice_siguiente(geo)
+    cruz = v[:, 0] * v[siguiente, 1] - v[siguiente, 0] * v[:, 1]
+    return 0.5 * np.abs(np.bincount(_indice_polilinea(geo), weights=cruz, minlength=n))
+
+
+def perimetro_total(geo: GeometriaDXF) -> float:
+    return float(
+        longitudes_lineas(geo).sum()
+        + (2 * np.pi * geo.circulos[:, 2]).sum()
+        + longitudes_arcos(geo).sum()
+        + longitudes_polilineas(geo).sum()
+    )
+
+
+def longitud_pliegue(geo: GeometriaDXF) -> float:
+    """Longitud de líneas y polilíneas (base del costo de doblez); las curvas no cuentan."""
+    return float(longitudes_lineas(geo).sum() + longitudes_polilineas(geo)[~geo.poly_curva].sum())
+
+
+def teselar_arcos(arcos: np.ndarray, segmentos: int = 32) -> np.ndarray:
+    """Aproxima arcos (cx, cy, r, a0, a1) por polilíneas: devuelve (K, segmentos+1, 2)."""
+    a0 = np.radians(arcos[:, 3])
+    barrido = np.mod(np.radians(arcos[:, 4]) - a0, 2 * np.pi)
+    barrido[barrido == 0] = 2 * np.pi
+    t = a0[:, None] + barrido[:, None] * np.linspace(0.0, 1.0, segmentos + 1)[None, :]
+    x = arcos[:, 0:1] + arcos[:, 2:3] * np.cos(t)
+    y = arcos[:, 1:2] + arcos[:, 2:3] * np.sin(t)
+    return np.stack([x, y], axis=-1)
+
+
+def teselar_circulos(circulos: np.ndarray, segmentos: int = 64) -> np.ndarray:
+    completos = np.column_stack([circulos, np.zeros(len(circulos)), np.full(len(circulos), 360.0)])
+    return teselar_arcos(completos, segmentos)
+
+
+def segmentos_polilineas(geo: GeometriaDXF) -> np.ndarray:
+    """Tramos rectos (S, 4) de todas las polilíneas, con el cierre de las cerradas."""
+    v = geo.poly_vertices
+    if len(v) == 0:
+        return _vacio(4)
+    idx = _indice_polilinea(geo)
+    siguiente = _indice_siguiente(geo)
+    ultimo = np.zeros(len(v), dtype=bool)
+    ultimo[geo.poly_offsets[1:] - 1] = True
+    validos = (~ultimo | geo.poly_cerrada[idx]) & (siguiente != np.arange(len(v)))
+    return np.hstack([v[validos], v[siguiente[validos]]])
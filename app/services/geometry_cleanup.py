@@ -0,0 +1,303 @@
+import os
+import numpy as np
+from app.services.contours import agrupar_extremos
+from app.services.geometry import GeometriaDXF, perimetro_total
+
+
+# Distancia (mm) por debajo de la cual dos elementos se consideran el mismo
+# y una entidad se considera de largo cero
+TOLERANCIA_LIMPIEZA = float(os.getenv("DXF_TOLERANCIA_LIMPIEZA", "0.01"))
+
+# DXF_LIMPIEZA=0 cotiza y dibuja la geometría tal como viene en el archivo
+LIMPIEZA = os.getenv("DXF_LIMPIEZA", "1") != "0"
+
+# Tolerancia de la geometría simplificada (archivos que el preflight manda
+# por esa ruta): une vértices y quita tramos más cortos que esto
+TOLERANCIA_SIMPLIFICADA = float(os.getenv("DXF_TOLERANCIA_SIMPLIFICADA", "0.2"))
+
+
+def _extremos_arcos(arcos: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    a0, a1 = np.radians(arcos[:, 3]), np.radians(arcos[:, 4])
+    centro, r = arcos[:, :2], arcos[:, 2:3]
+    return (centro + r * np.column_stack([np.cos(a0), np.sin(a0)]),
+            centro + r * np.column_stack([np.cos(a1), np.sin(a1)]))
+
+
+def _repetidos(claves: list, valor: np.ndarray, tol: float) -> np.ndarray:
+    """
+    Marca los elementos iguales a otro anterior: mismas `claves` enteras y
+    `valor` a menos de `tol` (ordenados por valor dentro de cada clave).
+    """
+    repetido = np.zeros(len(valor), dtype=bool)
+    if len(valor) < 2:
+        return repetido
+    orden = np.lexsort([valor] + claves[::-1])
+    igual = np.abs(np.diff(valor[orden])) <= tol
+    for clave in claves:
+        igual &= np.diff(clave[orden]) == 0
+    repetido[orden[1:]] = igual
+    return repetido
+
+
+# ==== Polilíneas ====
+
+def _compactar_polilineas(geo: GeometriaDXF, tol: float):
+    """
+    Quita los vértices repetidos consecutivos (tramos de largo cero), incluido
+    el de cierre de las cerradas. Devuelve (vértices, conteos, vértices
+    quitados).
+    """
+    v, offsets = geo.poly_vertices, geo.poly_offsets
+    conteos = np.diff(offsets)
+    if len(v) == 0:
+        return v, conteos, 0
+    idx = np.repeat(np.arange(len(conteos)), conteos)
+    anterior = np.arange(-1, len(v) - 1)
+    primeros = offsets[:-1][conteos > 0]
+    anterior[primeros] = offsets[1:][conteos > 0] - 1
+    conserva = np.hypot(*(v - v[anterior]).T) > tol
+    # El primer vértice de una abierta no tiene anterior
+    conserva[primeros] |= ~geo.poly_cerrada[idx[primeros]]
+    quitados = int(len(v) - conserva.sum())
+    if not quitados:
+        return v, conteos, 0
+    return v[conserva], np.bincount(idx[conserva], minlength=len(conteos)), quitados
+
+
+def _polilineas_repetidas(vertices: np.ndarray, conteos: np.ndarray, cerradas: np.ndarray,
+                          tol: float) -> np.ndarray:
+    """
+    Polilíneas que pasan por los mismos puntos (a menos de `tol`) que otra
+    anterior, en el mismo orden o al revés; las cerradas, empezando por
+    cualquier vértice.
+    """
+    q = len(conteos)
+    repetida = np.zeros(q, dtype=bool)
+    if q < 2:
+        return repetida
+    offsets = np.zeros(q + 1, dtype=np.int64)
+    np.cumsum(conteos, out=offsets[1:])
+    idx = np.repeat(np.arange(q), conteos)
+
+    # Solo pueden repetirse las que tienen tantos vértices como otra y el
+    # centroide en el mismo punto: el resto no pasa por la rejilla
+    centroide = np.column_stack([np.bincount(idx, weights=vertices[:, 0], minlength=q),
+                                 np.bincount(idx, weights=vertices[:, 1], minlength=q)]) / conteos[:, None]
+    firma = np.column_stack([conteos, cerradas, agrupar_extremos(centroide, tol)])
+    _, grupo, cuantas = np.unique(firma, axis=0, return_inverse=True, return_counts=True)
+    candidatas = np.flatnonzero(cuantas[grupo.ravel()] > 1)
+    if not len(candidatas):
+        return repetida
+
+    propios = np.concatenate([np.arange(offsets[p], offsets[p + 1]) for p in candidatas.tolist()])
+    nodos = agrupar_extremos(vertices[propios], tol).tolist()
+    vistas, k = set(), 0
+    for p in candidatas.tolist():
+        seq = nodos[k:k + conteos[p]]
+        k += conteos[p]
+        if cerradas[p]:
+            m = seq.index(min(seq))
+            adelante = seq[m:] + seq[:m]
+            atras = [adelante[0]] + adelante[1:][::-1]
+            clave = (True, min(tuple(adelante), tuple(atras)))
+        else:
+            clave = (False, min(tuple(seq), tuple(seq[::-1])))
+        if clave in vistas:
+            repetida[p] = True
+        else:
+            vistas.add(clave)
+    return repetida
+
+
+# ==== Líneas ====
+
+def _fusionar_colineales(lineas: np.ndarray, nodo_a: np.ndarray, nodo_b: np.ndarray,
+                         uso: np.ndarray, tol: float) -> tuple[np.ndarray, int]:
+    """
+    Une las líneas colineales que se solapan o se tocan (incluidas las
+    duplicadas) en una sola. Se mantienen como extremos los puntos donde
+    llega otra entidad, para no romper los contornos; las coordenadas de
+    cada extremo son las originales. Devuelve las líneas y cuántas se
+    absorbieron en otra (el número de líneas puede incluso crecer, porque
+    la unión se parte en esos puntos).
+    """
+    n = len(lineas)
+    if n < 2:
+        return lineas, 0
+    p0, p1 = lineas[:, :2], lineas[:, 2:]
+    d = p1 - p0
+    largo = np.hypot(d[:, 0], d[:, 1])
+
+    # Dirección: ángulos en [0, pi) encadenados a menos de tol_ang
+    tol_ang = tol / max(float(largo.max()), tol)
+    theta = np.mod(np.arctan2(d[:, 1], d[:, 0]), np.pi)
+    theta[theta > np.pi - tol_ang] -= np.pi
+    orden = np.argsort(theta, kind="stable")
+    direccion = np.empty(n, dtype=np.int64)
+    direccion[orden] = np.cumsum(np.r_[True, np.diff(theta[orden]) > tol_ang]) - 1
+    theta_g = np.bincount(direccion, weights=theta) / np.bincount(direccion)
+    u = np.column_stack([np.cos(theta_g), np.sin(theta_g)])[direccion]
+    normal = np.column_stack([-u[:, 1], u[:, 0]])
+
+    # Recta: distancia al origen, encadenada a menos de tol dentro de cada dirección
+    d0, d1 = (p0 * normal).sum(axis=1), (p1 * normal).sum(axis=1)
+    distancia = 0.5 * (d0 + d1)
+    orden = np.lexsort((distancia, direccion))
+    nueva = np.r_[True, (np.diff(direccion[orden]) != 0) | (np.diff(distancia[orden]) > tol)]
+    recta = np.empty(n, dtype=np.int64)
+    recta[orden] = np.cumsum(nueva) - 1
+    # Las cadenas pueden derivar: la que se aparta de la primera de su recta va sola
+    referencia = np.full(recta.max() + 1, np.inf)
+    np.minimum.at(referencia, recta, distancia)
+    fuera = (np.abs(d0 - referencia[recta]) > tol) | (np.abs(d1 - referencia[recta]) > tol)
+    recta[fuera] = recta.max() + 1 + np.arange(int(fuera.sum()))
+
+    por_recta = np.bincount(recta)
+    multiples = por_recta[recta] > 1
+    if not multiples.any():
+        return lineas, 0
+    sueltas = lineas[~multiples]
+    ids = np.flatnonzero(multiples)
+    _, grupo = np.unique(recta[ids], return_inverse=True)
+    grupo = grupo.ravel()
+
+    # Extremos ordenados a lo largo de la recta: a antes que b
+    ta, tb = (p0[ids] * u[ids]).sum(axis=1), (p1[ids] * u[ids]).sum(axis=1)
+    invertida = ta > tb
+    ta, tb = np.where(invertida, tb, ta), np.where(invertida, ta, tb)
+    xy_a = np.where(invertida[:, None], p1[ids], p0[ids])
+    xy_b = np.where(invertida[:, None], p0[ids], p1[ids])
+    na = np.where(invertida, nodo_b[ids], nodo_a[ids])
+    nb = np.where(invertida, nodo_a[ids], nodo_b[ids])
+
+    # Un extremo hace falta si en su nodo termina algo que no es de su recta
+    grupos2, nodos2 = np.r_[grupo, grupo], np.r_[na, nb]
+    _, inversa, propios = np.unique(np.column_stack([grupos2, nodos2]), axis=0,
+                                    return_inverse=True, return_counts=True)
+    externo = uso[nodos2] > propios[inversa.ravel()]
+
+    # Cada recta en su propio tramo del eje t, separado del siguiente
+    minimo = np.full(grupo.max() + 1, np.inf)
+    np.minimum.at(minimo, grupo, ta)
+    base = np.arange(len(minimo)) * (float((tb - minimo[grupo]).max()) + 10 * tol + 1.0)
+    ta, tb = ta - minimo[grupo] + base[grupo], tb - minimo[grupo] + base[grupo]
+
+    # Unión de intervalos: uno nuevo empieza donde no llega la cobertura anterior
+    orden = np.argsort(ta, kind="stable")
+    cobertura = np.maximum.accumulate(tb[orden])
+    empieza = np.r_[True, ta[orden][1:] > cobertura[:-1] + tol]
+    intervalo = np.empty(len(ids), dtype=np.int64)
+    intervalo[orden] = np.cumsum(empieza) - 1
+    primero = orden[empieza]
+    por_fin = np.lexsort((tb, intervalo))
+    ultimo = por_fin[np.r_[intervalo[por_fin][1:] != intervalo[por_fin][:-1], True]]
+    # Se absorbe la que se solapa con la cobertura anterior o la continúa por
+    # un punto al que no llega nada más; partir un tramo en un nodo no cuenta
+    solapa = ta[orden][1:] < cobertura[:-1] - tol
+    continua = ~empieza[1:] & ~externo[:len(ids)][orden[1:]]
+    fusionadas = int((solapa | continua).sum())
+    if not fusionadas:
+        return lineas, 0
+    inicio_t, fin_t = ta[primero], tb[ultimo]
+
+    # Cortes: inicio, extremos necesarios que caen adentro, fin
+    t2, xy2, iv2 = np.r_[ta, tb], np.vstack([xy_a, xy_b]), np.r_[intervalo, intervalo]
+    adentro = externo & (t2 > inicio_t[iv2] + tol) & (t2 < fin_t[iv2] - tol)
+    cortes_t = np.r_[inicio_t, t2[adentro], fin_t]
+    cortes_xy = np.vstack([xy_a[primero], xy2[adentro], xy_b[ultimo]])
+    cortes_iv = np.r_[np.arange(len(primero)), iv2[adentro], np.arange(len(ultimo))]
+    orden = np.lexsort((cortes_t, cortes_iv))
+    cortes_t, cortes_xy, cortes_iv = cortes_t[orden], cortes_xy[orden], cortes_iv[orden]
+    unico = np.r_[True, (np.diff(cortes_iv) != 0) | (np.diff(cortes_t) > tol)]
+    cortes_xy, cortes_iv = cortes_xy[unico], cortes_iv[unico]
+
+    tramo = cortes_iv[1:] == cortes_iv[:-1]
+    piezas = np.hstack([cortes_xy[:-1][tramo], cortes_xy[1:][tramo]])
+    return np.vstack([sueltas, piezas]), fusionadas
+
+
+def limpiar_geometria(geo: GeometriaDXF, tol: float = TOLERANCIA_LIMPIEZA) -> tuple[GeometriaDXF, dict]:
+    """
+    Quita lo que no se corta dos veces: entidades de largo cero, vértices
+    repetidos, círculos, arcos y polilíneas duplicados (o a menos de `tol`)
+    y líneas colineales solapadas, que se unen en una sola. Los elementos
+    cercanos se encuentran con la misma rejilla que usa el armado de
+    contornos. Devuelve la geometría limpia (la misma si no hay nada que
+    quitar) y un resumen de lo quitado.
+    """
+    lineas, circulos, arcos = geo.lineas, geo.circulos, geo.arcos
+    degeneradas = duplicadas = 0
+
+    # Entidades de largo cero
+    largo = np.hypot(lineas[:, 2] - lineas[:, 0], lineas[:, 3] - lineas[:, 1])
+    barrido = np.mod(np.radians(arcos[:, 4]) - np.radians(arcos[:, 3]), 2 * np.pi)
+    lineas_ok = largo > tol
+    circulos_ok = circulos[:, 2] > tol
+    # Un arco con barrido 0 se dibuja como círculo completo: no es de largo cero
+    arcos_ok = (arcos[:, 2] > tol) & ((barrido == 0) | (arcos[:, 2] * barrido > tol))
+    vertices, conteos, vertices_repetidos = _compactar_polilineas(geo, tol)
+    polilineas_ok = conteos >= 2
+    degeneradas += int((~lineas_ok).sum() + (~circulos_ok).sum() + (~arcos_ok).sum() + (~polilineas_ok).sum())
+    lineas, circulos, arcos = lineas[lineas_ok], circulos[circulos_ok], arcos[arcos_ok]
+
+    # Nodos: extremos de líneas, arcos y polilíneas abiertas a menos de tol
+    # son el mismo punto (los mismos nodos que usa el armado de contornos)
+    inicio_arco, fin_arco = _extremos_arcos(arcos)
+    offsets = np.zeros(len(conteos) + 1, dtype=np.int64)
+    np.cumsum(conteos, out=offsets[1:])
+    abiertas = polilineas_ok & ~geo.poly_cerrada
+    puntas = vertices[np.r_[offsets[:-1][abiertas], offsets[1:][abiertas] - 1]]
+    puntos = np.vstack([lineas[:, :2], lineas[:, 2:], inicio_arco, fin_arco, puntas])
+    nodos = agrupar_extremos(puntos, tol) if len(puntos) else np.zeros(0, dtype=np.int64)
+    n, k = len(lineas), len(arcos)
+    nodo_a, nodo_b = nodos[:n], nodos[n:2 * n]
+    nodo_ini, nodo_fin = nodos[2 * n:2 * n + k], nodos[2 * n + k:2 * n + 2 * k]
+
+    # Círculos y arcos: mismo centro, mismo radio (y mismos extremos)
+    centros = np.vstack([circulos[:, :2], arcos[:, :2]])
+    centro = agrupar_extremos(centros, tol) if len(centros) else np.zeros(0, dtype=np.int64)
+    circulos_rep = _repetidos([centro[:len(circulos)]], circulos[:, 2], tol)
+    arcos_rep = _repetidos([centro[len(circulos):], nodo_ini, nodo_fin], arcos[:, 2], tol)
+    duplicadas += int(circulos_rep.sum() + arcos_rep.sum())
+    circulos, arcos = circulos[~circulos_rep], arcos[~arcos_rep]
+
+    # Polilíneas: las degeneradas fuera, luego las repetidas
+    idx = np.repeat(np.arange(len(conteos)), conteos)
+    polilineas_rep = np.zeros(len(conteos), dtype=bool)
+    polilineas_rep[polilineas_ok] = _polilineas_repetidas(
+        vertices[polilineas_ok[idx]], conteos[polilineas_ok], geo.poly_cerrada[polilineas_ok], tol)
+    duplicadas += int(polilineas_rep.sum())
+    quedan = polilineas_ok & ~polilineas_rep
+    if not quedan.all():
+        vertices, conteos = vertices[quedan[idx]], conteos[quedan]
+
+    # Líneas: las colineales solapadas (y las duplicadas) se unen
+    uso = np.bincount(nodos) if len(nodos) else np.zeros(0, dtype=np.int64)
+    lineas, fusionadas = _fusionar_colineales(lineas, nodo_a, nodo_b, uso, tol)
+
+    eliminadas = degeneradas + duplicadas + fusionadas
+    if not eliminadas and not vertices_repetidos:
+        return geo, {"entidades_eliminadas": 0, "degeneradas": 0, "duplicadas": 0, "solapes_fusionados": 0,
+                     "vertices_repetidos": 0, "longitud_eliminada_mm": 0.0}
+
+    offsets = np.zeros(len(conteos) + 1, dtype=np.int64)
+    np.cumsum(conteos, out=offsets[1:])
+    limpia = GeometriaDXF(
+        lineas=lineas,
+        circulos=circulos,
+        arcos=arcos,
+        poly_vertices=vertices,
+        poly_offsets=offsets,
+        poly_cerrada=geo.poly_cerrada[quedan],
+        poly_lw=geo.poly_lw[quedan],
+        poly_curva=geo.poly_curva[quedan],
+        total_entities=geo.total_entities,
+    )
+    return limpia, {
+        "entidades_eliminadas": eliminadas,
+        "degeneradas": degeneradas,
+        "duplicadas": duplicadas,
+        "solapes_fusionados": fusionadas,
+        "vertices_repetidos": vertices_repetidos,
+        "longitud_eliminada_mm": round(max(perimetro_total(geo) - perimetro_total(limpia), 0.0), 3),
+    }
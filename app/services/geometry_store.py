@@ -0,0 +1,270 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from app.services.geometry import TOLERANCIA_CURVAS, GeometriaDXF
+from app.services.geometry_cleanup import LIMPIEZA, TOLERANCIA_LIMPIEZA
+from app.services.shape_nesting import Huella
+
+
+# Almacén en disco de la geometría y del análisis de cada DXF, compartido
+# por todos los workers de uvicorn y del pool y persistente entre reinicios.
+# DXF_ALMACEN_GEOMETRIAS=0 lo desactiva.
+ACTIVO = os.getenv("DXF_ALMACEN_GEOMETRIAS", "1") != "0"
+DIRECTORIO = os.getenv("DXF_GEOMETRIAS_DIR", os.path.join("data", "geometrias"))
+MAX_BYTES = int(float(os.getenv("DXF_GEOMETRIAS_MAX_MB", "512")) * 1024 * 1024)
+
+# Al pasar del máximo se borran las entradas menos usadas hasta esta fracción
+FRACCION_OBJETIVO = 0.9
+
+# Cambia cuando cambian los campos de GeometriaDXF o el resumen de
+# analizar_dxf (o la limpieza que lo precede): las entradas de otra versión
+# se ignoran y se recalculan
+VERSION = f"6-{TOLERANCIA_CURVAS:g}-{TOLERANCIA_LIMPIEZA if LIMPIEZA else 0:g}"
+
+# Segundos entre actualizaciones de la fecha de uso de una entrada (evita
+# escribir en la base en cada lectura)
+_INTERVALO_ACCESO_S = 60
+
+# Cada arreglo empieza alineado a 64 bytes dentro del archivo
+_ALINEACION = 64
+
+_CAMPOS = ("lineas", "circulos", "arcos", "poly_vertices", "poly_offsets", "poly_cerrada", "poly_lw", "poly_curva")
+_CLAVE = re.compile(r"[0-9a-f]{64}")
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+_contadores = {"hits": 0, "misses": 0, "escrituras": 0, "borrados": 0}
+_lock_contadores = threading.Lock()
+
+
+def _contar(nombre: str, n: int = 1):
+    with _lock_contadores:
+        _contadores[nombre] += n
+
+
+def clave_archivo(ruta: str) -> str:
+    """SHA-256 del contenido: el mismo file_id que asigna guardar_upload."""
+    with open(ruta, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _conexion() -> sqlite3.Connection:
+    """Una conexión por hilo; WAL permite leer mientras otro proceso escribe."""
+    conexion = getattr(_local, "conexion", None)
+    if conexion is None:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        conexion = sqlite3.connect(os.path.join(DIRECTORIO, "indice.sqlite3"), timeout=10, isolation_level=None)
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.execute("""
+            CREATE TABLE IF NOT EXISTS geometrias (
+                clave TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                arreglos TEXT,
+                total_entities INTEGER NOT NULL DEFAULT 0,
+                resumen TEXT,
+                bytes INTEGER NOT NULL DEFAULT 0,
+                accedido REAL NOT NULL
+            )
+        """)
+        conexion.execute("CREATE INDEX IF NOT EXISTS geometrias_accedido ON geometrias (accedido)")
+        _local.conexion = conexion
+    return conexion
+
+
+def _ruta(clave: str) -> str:
+    return os.path.join(DIRECTORIO, f"{clave}.npy")
+
+
+def _valida(clave: str) -> bool:
+    return ACTIVO and bool(_CLAVE.fullmatch(clave or ""))
+
+
+def _fila(clave: str, columnas: str):
+    fila = _conexion().execute(
+        f"SELECT version, accedido, {columnas} FROM geometrias WHERE clave = ?", (clave,)
+    ).fetchone()
+    if fila is None or fila[0] != VERSION:
+        return None
+    if time.time() - fila[1] > _INTERVALO_ACCESO_S:
+        _conexion().execute("UPDATE geometrias SET accedido = ? WHERE clave = ?", (time.time(), clave))
+    return fila[2:]
+
+
+def cargar(clave: str) -> GeometriaDXF | None:
+    """
+    Geometría guardada, sin copiarla: los arreglos son vistas de solo
+    lectura sobre el archivo mapeado en memoria. None si no está.
+    """
+    if not _valida(clave):
+        return None
+    try:
+        fila = _fila(clave, "arreglos, total_entities")
+        if fila is None or fila[0] is None:
+            _contar("misses")
+            return None
+        datos = np.load(_ruta(clave), mmap_mode="r")
+    except (sqlite3.Error, OSError, ValueError):
+        logger.warning("No se pudo leer la geometría guardada", exc_info=True, extra={"datos": {"clave": clave}})
+        _contar("misses")
+        return None
+    arreglos = {}
+    for campo, (dtype, forma, inicio) in json.loads(fila[0]).items():
+        dtype = np.dtype(dtype)
+        fin = inicio + dtype.itemsize * int(np.prod(forma))
+        arreglos[campo] = datos[inicio:fin].view(dtype).reshape(forma)
+    _contar("hits")
+    return GeometriaDXF(**arreglos, total_entities=fila[1])
+
+
+def guardar(clave: str, geo: GeometriaDXF):
+    """Escribe los arreglos de `geo` en un solo .npy (uint8) y los registra en el índice."""
+    if not _valida(clave):
+        return
+    disposicion, total = {}, 0
+    for campo in _CAMPOS:
+        arreglo = getattr(geo, campo)
+        disposicion[campo] = (arreglo.dtype.str, list(arreglo.shape), total)
+        total += -(-arreglo.nbytes // _ALINEACION) * _ALINEACION
+
+    ruta = _ruta(clave)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        salida = np.lib.format.open_memmap(temporal, mode="w+", dtype=np.uint8, shape=(max(total, 1),))
+        for campo in _CAMPOS:
+            arreglo = np.ascontiguousarray(getattr(geo, campo))
+            inicio = disposicion[campo][2]
+            salida[inicio:inicio + arreglo.nbytes] = arreglo.reshape(-1).view(np.uint8)
+        salida.flush()
+        del salida
+        os.replace(temporal, ruta)
+        _conexion().execute(
+            """
+            INSERT INTO geometrias (clave, version, arreglos, total_entities, bytes, accedido)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (clave) DO UPDATE SET
+                version = excluded.version, arreglos = excluded.arreglos,
+                total_entities = excluded.total_entities,
+                resumen = CASE WHEN geometrias.version = excluded.version THEN geometrias.resumen END,
+                bytes = excluded.bytes + CASE WHEN geometrias.version = excluded.version
+                    THEN COALESCE(length(geometrias.resumen), 0) ELSE 0 END,
+                accedido = excluded.accedido
+            """,
+            (clave, VERSION, json.dumps(disposicion), geo.total_entities, os.path.getsize(ruta), time.time()),
+        )
+        _contar("escrituras")
+        _recortar()
+    except (sqlite3.Error, OSError):
+        logger.warning("No se pudo guardar la geometría", exc_info=True, extra={"datos": {"clave": clave}})
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+def cargar_resumen(clave: str) -> dict | None:
+    """Resultado guardado de analizar_dxf (sin vistas previas); None si no está."""
+    if not _valida(clave):
+        return None
+    try:
+        fila = _fila(clave, "resumen")
+    except sqlite3.Error:
+        logger.warning("No se pudo leer el índice de geometrías", exc_info=True)
+        return None
+    if fila is None or fila[0] is None:
+        return None
+    try:
+        return json.loads(fila[0], object_hook=_desde_json)
+    except (ValueError, TypeError):
+        logger.warning("Análisis guardado ilegible", exc_info=True, extra={"datos": {"clave": clave}})
+        return None
+
+
+def _a_json(valor):
+    if isinstance(valor, Huella):
+        return {"__huella__": valor.a_dict()}
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"{type(valor).__name__} no se guarda en el almacén")
+
+
+def _desde_json(datos: dict):
+    if "__huella__" in datos:
+        return Huella.desde_dict(datos["__huella__"])
+    return datos
+
+
+def guardar_resumen(clave: str, resumen: dict):
+    """
+    Guarda el resultado de analizar_dxf como JSON: solo números, textos y la
+    huella (nunca pickle, que ejecutaría código al leer la base).
+    """
+    if not _valida(clave):
+        return
+    try:
+        blob = json.dumps(resumen, default=_a_json)
+    except (TypeError, ValueError):
+        logger.warning("Análisis no serializable", exc_info=True, extra={"datos": {"clave": clave}})
+        return
+    try:
+        _conexion().execute(
+            """
+            INSERT INTO geometrias (clave, version, resumen, bytes, accedido)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (clave) DO UPDATE SET
+                resumen = excluded.resumen,
+                arreglos = CASE WHEN geometrias.version = excluded.version THEN geometrias.arreglos END,
+                bytes = excluded.bytes + CASE WHEN geometrias.version = excluded.version
+                    THEN geometrias.bytes - COALESCE(length(geometrias.resumen), 0) ELSE 0 END,
+                version = excluded.version,
+                accedido = excluded.accedido
+            """,
+            (clave, VERSION, blob, len(blob), time.time()),
+        )
+        _recortar()
+    except sqlite3.Error:
+        logger.warning("No se pudo guardar el análisis", exc_info=True, extra={"datos": {"clave": clave}})
+
+
+def _recortar():
+    """Si el almacén pasa de MAX_BYTES borra las entradas menos usadas."""
+    conexion = _conexion()
+    total = conexion.execute("SELECT COALESCE(SUM(bytes), 0) FROM geometrias").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    sobrante = total - int(MAX_BYTES * FRACCION_OBJETIVO)
+    borradas = []
+    for clave, tam in conexion.execute("SELECT clave, bytes FROM geometrias ORDER BY accedido"):
+        if sobrante <= 0:
+            break
+        borradas.append(clave)
+        sobrante -= tam
+    conexion.executemany("DELETE FROM geometrias WHERE clave = ?", [(c,) for c in borradas])
+    # Un proceso que tenga el archivo mapeado lo sigue leyendo después de borrarlo
+    for clave in borradas:
+        try:
+            os.remove(_ruta(clave))
+        except FileNotFoundError:
+            pass
+    _contar("borrados", len(borradas))
+    logger.info("Geometrías borradas del almacén", extra={"datos": {"borradas": len(borradas)}})
+
+
+def stats() -> dict:
+    """Entradas y bytes del almacén (de todos los procesos) y contadores de este proceso."""
+    if not ACTIVO:
+        return {"activo": False}
+    try:
+        entradas, total = _conexion().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM geometrias"
+        ).fetchone()
+    except sqlite3.Error:
+        entradas, total = 0, 0
+    with _lock_contadores:
+        contadores = dict(_contadores)
+    return {"activo": True, "entradas": entradas, "bytes": total, "max_bytes": MAX_BYTES, **contadores}
@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from app.services import metrics
+
+
+# Trabajos que se procesan a la vez y trabajos que pueden esperar en cola
+JOBS_WORKERS = int(os.getenv("DXF_JOBS_WORKERS", "2"))
+JOBS_MAX_EN_COLA = int(os.getenv("DXF_JOBS_MAX_EN_COLA", "32"))
+# Tiempo que se conserva un trabajo terminado para consultarlo (s)
+JOBS_TTL_S = float(os.getenv("DXF_JOBS_TTL_S", "900"))
+
+# Etapas del procesamiento, en el orden en que corren, con el progreso al
+# empezar cada una: lectura, contornos y orden de corte, silueta para el
+# anidado, vista previa y el precio (con el anidado en las láminas del
+# catálogo). El PDF no es una etapa: se genera recién cuando se pide
+# `pdf_url` (ver download_pdf), así que el trabajo termina sin él.
+ETAPAS = {
+    "en_cola": 0.0,
+    "parse": 0.05,
+    "geometry": 0.3,
+    "nesting": 0.55,
+    "preview": 0.7,
+    "cotizacion": 0.85,
+}
+_ORDEN = {etapa: i for i, etapa in enumerate(ETAPAS)}
+
+TERMINADOS = ("completado", "fallido")
+
+
+class ColaLlena(RuntimeError):
+    """No se aceptan más trabajos hasta que se libere la cola."""
+
+
+@dataclass
+class Trabajo:
+    id: str
+    estado: str = "en_cola"  # en_cola | procesando | completado | fallido
+    etapa: str = "en_cola"
+    progreso: float = 0.0
+    resultado: dict | None = None
+    error: str | None = None
+    creado: float = field(default_factory=time.time)
+    actualizado: float = field(default_factory=time.time)
+    eventos: list = field(default_factory=list)
+    _cambio: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def resumen(self) -> dict:
+        datos = {
+            "job_id": self.id,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "progreso": round(self.progreso, 3),
+        }
+        if self.resultado is not None:
+            datos["resultado"] = self.resultado
+        if self.error is not None:
+            datos["error"] = self.error
+        return datos
+
+    def _publicar(self):
+        self.actualizado = time.time()
+        evento = {k: v for k, v in self.resumen().items() if k != "resultado"}
+        self.eventos.append(evento)
+        # Despertar a los suscriptores y preparar el siguiente aviso
+        cambio, self._cambio = self._cambio, asyncio.Event()
+        cambio.set()
+
+    def avanzar(self, etapa: str):
+        """Marca el inicio de una etapa; las etapas atrasadas se ignoran."""
+        if self.estado in TERMINADOS or _ORDEN[etapa] <= _ORDEN[self.etapa]:
+            return
+        self.estado = "procesando"
+        self.etapa = etapa
+        self.progreso = ETAPAS[etapa]
+        self._publicar()
+
+    def reportero(self):
+        """Callable serializable para avisar el avance desde un proceso del pool."""
+        return partial(reportar, canal_progreso(), self.id)
+
+    async def eventos_sse(self, keepalive: float = 15.0):
+        """Eventos en formato text/event-stream hasta que el trabajo termina."""
+        enviados = 0
+        while True:
+            cambio = self._cambio
+            for evento in self.eventos[enviados:]:
+                tipo = "fin" if evento["estado"] in TERMINADOS else "progreso"
+                yield f"event: {tipo}\ndata: {json.dumps(evento)}\n\n"
+            enviados = len(self.eventos)
+            if self.estado in TERMINADOS:
+                return
+            try:
+                await asyncio.wait_for(cambio.wait(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+
+
+def reportar(canal, trabajo_id: str, etapa: str):
+    """Se ejecuta en el worker: deja el aviso en la cola compartida."""
+    try:
+        canal.put_nowait((trabajo_id, etapa))
+    except Exception:
+        pass  # el avance es informativo, nunca debe romper el trabajo
+
+
+_trabajos: dict[str, Trabajo] = {}
+_cola: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+_loop: asyncio.AbstractEventLoop | None = None
+_manager = None
+_canal = None
+_lector: threading.Thread | None = None
+_lock = threading.Lock()
+_secuencia = itertools.count()
+
+
+def canal_progreso():
+    """
+    Cola compartida con los procesos del pool para el avance de las etapas
+    que corren allí (parse, geometry, nesting, preview). Se crea con el
+    primer uso.
+    """
+    global _manager, _canal, _lector
+    with _lock:
+        if _canal is None:
+            import multiprocessing
+            _manager = multiprocessing.get_context("spawn").Manager()
+            _canal = _manager.Queue()
+            _lector = threading.Thread(target=_leer_canal, args=(_canal, _loop), name="jobs-progreso", daemon=True)
+            _lector.start()
+        return _canal
+
+
+def _leer_canal(canal, loop):
+    while True:
+        try:
+            mensaje = canal.get()
+        except (EOFError, OSError):
+            return
+        if mensaje is None:
+            return
+        trabajo_id, etapa = mensaje
+        loop.call_soon_threadsafe(_avance_remoto, trabajo_id, etapa)
+
+
+def _avance_remoto(trabajo_id: str, etapa: str):
+    trabajo = _trabajos.get(trabajo_id)
+    if trabajo is not None:
+        trabajo.avanzar(etapa)
+
+
+def _purgar():
+    """Olvida los trabajos terminados hace más de JOBS_TTL_S."""
+    limite = time.time() - JOBS_TTL_S
+    for trabajo_id in [t.id for t in _trabajos.values() if t.estado in TERMINADOS and t.actualizado < limite]:
+        del _trabajos[trabajo_id]
+
+
+def obtener(trabajo_id: str) -> Trabajo | None:
+    return _trabajos.get(trabajo_id)
+
+
+def encolar(procesar) -> Trabajo:
+    """
+    Registra un trabajo y lo deja en cola. `procesar(trabajo)` es una
+    corrutina que devuelve el resultado (dict). Lanza ColaLlena si ya hay
+    JOBS_MAX_EN_COLA esperando.
+    """
+    if _cola is None:
+        raise RuntimeError("La cola de trabajos no está iniciada.")
+    _purgar()
+    trabajo = Trabajo(id=f"{next(_secuencia):x}-{secrets.token_hex(8)}")
+    try:
+        _cola.put_nowait((trabajo, procesar))
+    except asyncio.QueueFull:
+        raise ColaLlena("Demasiados trabajos en cola, intenta de nuevo en unos segundos.")
+    _trabajos[trabajo.id] = trabajo
+    trabajo._publicar()
+    return trabajo
+
+
+async def _worker():
+    while True:
+        trabajo, procesar = await _cola.get()
+        try:
+            if _canal is None:
+                # Levantar el canal de avance fuera del event loop
+                await asyncio.to_thread(canal_progreso)
+            trabajo.estado = "procesando"
+            with metrics.medir():
+                trabajo.resultado = await procesar(trabajo)
+            trabajo.estado = "completado"
+            trabajo.progreso = 1.0
+        except asyncio.CancelledError:
+            trabajo.estado, trabajo.error = "fallido", "Servidor detenido."
+            trabajo._publicar()
+            raise
+        except Exception as e:
+            trabajo.estado, trabajo.error = "fallido", str(e) or type(e).__name__
+        finally:
+            _cola.task_done()
+        trabajo._publicar()
+
+
+def stats() -> dict:
+    estados = {}
+    for trabajo in _trabajos.values():
+        estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+    return {
+        "workers": len(_workers),
+        "en_cola": _cola.qsize() if _cola is not None else 0,
+        "max_en_cola": JOBS_MAX_EN_COLA,
+        "trabajos": estados,
+    }
+
+
+async def iniciar():
+    global _cola, _loop
+    _loop = asyncio.get_running_loop()
+    _cola = asyncio.Queue(maxsize=JOBS_MAX_EN_COLA)
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(max(JOBS_WORKERS, 1)))
+
+
+async def detener():
+    global _cola, _manager, _canal
+    for tarea in _workers:
+        tarea.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _cola = None
+    with _lock:
+        manager, canal = _manager, _canal
+        _manager = _canal = None
+    if canal is not None:
+        try:
+            canal.put(None)
+        except Exception:
+            pass
+    if manager is not None:
+        manager.shutdown()
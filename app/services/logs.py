@@ -0,0 +1,64 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+# Nivel del logger "app" (DEBUG, INFO, WARNING...)
+LOG_LEVEL = os.getenv("DXF_LOG_LEVEL", "INFO").upper()
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro; los campos de `extra={"datos": {...}}` van al primer nivel."""
+
+    def format(self, record):
+        linea = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "mensaje": record.getMessage(),
+        }
+        linea.update(getattr(record, "datos", None) or {})
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+
+_listener: QueueListener | None = None
+_handler: QueueHandler | None = None
+
+
+def configurar():
+    """
+    Conecta el logger "app" a una cola: quien loguea solo encola el registro
+    y un hilo aparte lo formatea y escribe a stderr. Se llama al arrancar el
+    servidor y al iniciar cada proceso del pool.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    cola = queue.SimpleQueue()
+    salida = logging.StreamHandler(sys.stderr)
+    salida.setFormatter(FormatoJSON())
+    _listener = QueueListener(cola, salida)
+    _handler = QueueHandler(cola)
+
+    logger = logging.getLogger("app")
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(_handler)
+    logger.propagate = False
+    _listener.start()
+    atexit.register(detener)
+
+
+def detener():
+    """Vacía la cola y desconecta el handler."""
+    global _listener, _handler
+    if _listener is None:
+        return
+    logging.getLogger("app").removeHandler(_handler)
+    _listener.stop()
+    _listener = _handler = None
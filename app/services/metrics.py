@@ -0,0 +1,187 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Límites (s) de los buckets de los histogramas de duración
+BUCKETS_S = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+AYUDA = {
+    "dxf_etapa_segundos": "Duración de cada etapa del procesamiento de un DXF.",
+    "dxf_http_segundos": "Duración de las peticiones HTTP por ruta.",
+    "dxf_entidades_procesadas_total": "Entidades DXF recorridas al extraer la geometría.",
+    "dxf_lecturas_total": "Archivos leídos del almacén de geometrías, con el lector rápido o con ezdxf.",
+    "dxf_preflight_total": "Archivos revisados antes de procesarlos, por ruta elegida.",
+    "dxf_entidades_eliminadas_total": "Entidades duplicadas, solapadas o de largo cero quitadas antes de cotizar.",
+}
+
+
+class Mediciones:
+    """
+    Spans y contadores de una petición (o de una llamada al pool). Registrar
+    es solo un append; los histogramas globales se actualizan al cerrar.
+    """
+    __slots__ = ("tiempos", "contadores")
+
+    def __init__(self):
+        self.tiempos = []     # [(etapa, segundos)]
+        self.contadores = {}  # (nombre, etiquetas) -> valor
+
+    def fusionar(self, tiempos, contadores):
+        self.tiempos.extend(tiempos)
+        for clave, valor in contadores.items():
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+
+_actual: contextvars.ContextVar[Mediciones | None] = contextvars.ContextVar("mediciones", default=None)
+_lock = threading.Lock()
+_histogramas = {}  # (nombre, etiquetas) -> [conteos por bucket..., +Inf, suma]
+_contadores = {}   # (nombre, etiquetas) -> valor
+_colectores = []
+
+
+def _etiquetas(**etiquetas) -> tuple:
+    return tuple(sorted(etiquetas.items()))
+
+
+def observar(nombre: str, segundos: float, **etiquetas):
+    clave = (nombre, _etiquetas(**etiquetas))
+    with _lock:
+        serie = _histogramas.get(clave)
+        if serie is None:
+            serie = _histogramas[clave] = [0] * (len(BUCKETS_S) + 1) + [0.0]
+        serie[bisect.bisect_left(BUCKETS_S, segundos)] += 1
+        serie[-1] += segundos
+
+
+def _volcar(tiempos, contadores):
+    for etapa, segundos in tiempos:
+        observar("dxf_etapa_segundos", segundos, etapa=etapa)
+    with _lock:
+        for clave, valor in contadores.items():
+            _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+@contextmanager
+def span(etapa: str):
+    """
+    Mide una etapa (preflight, store, parse, entities, cleanup, bounds,
+    sequence, nesting, render, pdf, upload).
+    Sirve como `with span(...)` o como decorador.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        mediciones = _actual.get()
+        if mediciones is not None:
+            mediciones.tiempos.append((etapa, segundos))
+        else:
+            observar("dxf_etapa_segundos", segundos, etapa=etapa)
+
+
+def contar(nombre: str, valor: float = 1, **etiquetas):
+    clave = (nombre, _etiquetas(**etiquetas))
+    mediciones = _actual.get()
+    if mediciones is not None:
+        mediciones.contadores[clave] = mediciones.contadores.get(clave, 0) + valor
+    else:
+        _volcar((), {clave: valor})
+
+
+@contextmanager
+def medir():
+    """Abre las mediciones de una petición o trabajo; al salir van a los histogramas."""
+    mediciones = Mediciones()
+    token = _actual.set(mediciones)
+    try:
+        yield mediciones
+    finally:
+        _actual.reset(token)
+        _volcar(mediciones.tiempos, mediciones.contadores)
+
+
+def en_worker(func, *args):
+    """
+    Se ejecuta en el proceso del pool: llama a `func(*args)` y devuelve
+    (resultado, tiempos, contadores) para fusionarlos en el proceso principal.
+    """
+    mediciones = Mediciones()
+    token = _actual.set(mediciones)
+    try:
+        resultado = func(*args)
+    finally:
+        _actual.reset(token)
+    return resultado, mediciones.tiempos, mediciones.contadores
+
+
+def fusionar(tiempos, contadores):
+    """Agrega lo medido en el pool a la petición en curso (o directo a los histogramas)."""
+    mediciones = _actual.get()
+    if mediciones is not None:
+        mediciones.fusionar(tiempos, contadores)
+    else:
+        _volcar(tiempos, contadores)
+
+
+def server_timing(mediciones: Mediciones, total: float | None = None) -> str:
+    """Cabecera Server-Timing: una entrada por etapa (sumando repeticiones), en ms."""
+    etapas = {}
+    for etapa, segundos in mediciones.tiempos:
+        etapas[etapa] = etapas.get(etapa, 0.0) + segundos
+    if total is not None:
+        etapas["total"] = total
+    return ", ".join(f"{etapa};dur={segundos * 1000:.2f}" for etapa, segundos in etapas.items())
+
+
+def registrar_colector(colector):
+    """
+    `colector()` devuelve [(nombre, etiquetas, valor)] leídos al momento de
+    exportar (p. ej. estadísticas de los caches). Los nombres que terminan
+    en _total se exportan como counter, el resto como gauge.
+    """
+    _colectores.append(colector)
+
+
+def _formato_etiquetas(etiquetas, extra=()) -> str:
+    pares = list(etiquetas) + list(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+
+def _cabecera(lineas, nombre, tipo, vistos):
+    if nombre in vistos:
+        return
+    vistos.add(nombre)
+    if nombre in AYUDA:
+        lineas.append(f"# HELP {nombre} {AYUDA[nombre]}")
+    lineas.append(f"# TYPE {nombre} {tipo}")
+
+
+def exportar() -> str:
+    """Todas las métricas en el formato de texto de Prometheus."""
+    with _lock:
+        histogramas = {clave: list(serie) for clave, serie in _histogramas.items()}
+        contadores = dict(_contadores)
+
+    lineas, vistos = [], set()
+    for (nombre, etiquetas), serie in sorted(histogramas.items()):
+        _cabecera(lineas, nombre, "histogram", vistos)
+        acumulado = 0
+        for limite, conteo in zip(BUCKETS_S + ("+Inf",), serie[:-1]):
+            acumulado += conteo
+            lineas.append(f"{nombre}_bucket{_formato_etiquetas(etiquetas, [('le', limite)])} {acumulado}")
+        lineas.append(f"{nombre}_sum{_formato_etiquetas(etiquetas)} {serie[-1]:.6f}")
+        lineas.append(f"{nombre}_count{_formato_etiquetas(etiquetas)} {acumulado}")
+
+    series = [(nombre, etiquetas, valor) for (nombre, etiquetas), valor in contadores.items()]
+    for colector in _colectores:
+        series.extend((nombre, _etiquetas(**etiquetas), valor) for nombre, etiquetas, valor in colector())
+    for nombre, etiquetas, valor in sorted(series, key=lambda s: (s[0], s[1])):
+        _cabecera(lineas, nombre, "counter" if nombre.endswith("_total") else "gauge", vistos)
+        lineas.append(f"{nombre}{_formato_etiquetas(etiquetas)} {valor:g}")
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,393 @@
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+from app.services.metrics import span
+
+
+# Dimensiones de la lámina estándar (mm)
+HOJA_ANCHO = 2440
+HOJA_ALTO = 1220
+
+# Separación entre piezas / ancho de corte (mm)
+KERF_MM = float(os.getenv("DXF_KERF_MM", "0"))
+
+# Materiales que no se pueden girar 90° (veta o dirección de pulido).
+# Un giro de 180° no cambia la dirección, así que no se considera rotación.
+MATERIALES_SIN_ROTACION = frozenset(
+    m.strip() for m in os.getenv("DXF_MATERIALES_SIN_ROTACION", "").split(",") if m.strip()
+)
+
+# rectpack solo se usa como respaldo cuando caben pocas piezas
+LIMITE_RECTPACK = int(os.getenv("DXF_LIMITE_RECTPACK", "200"))
+
+# Tiempo máximo para anidar un pedido completo (s); al agotarse, las
+# láminas restantes se llenan con el método de estantes, que es lineal
+PRESUPUESTO_PEDIDO_S = float(os.getenv("DXF_NESTING_PRESUPUESTO_S", "2.0"))
+
+# Una lámina de un solo tipo de pieza se acepta tal cual si su
+# aprovechamiento llega a este valor; si no, sus piezas se mezclan con otras
+APROVECHAMIENTO_HOJA_COMPLETA = 0.75
+
+_EPS = 1e-9
+
+
+@dataclass(frozen=True)
+class ResultadoNesting:
+    """
+    Resultado del anidado de N piezas idénticas en una lámina.
+    `bloques` son rejillas (x, y, columnas, filas, paso_x, paso_y); el paso
+    incluye el kerf, así que cada pieza ocupa (paso - kerf).
+    """
+    piezas: int
+    ancho: float
+    alto: float
+    hoja_ancho: float
+    hoja_alto: float
+    kerf: float
+    bloques: tuple
+    metodo: str
+
+    @property
+    def aprovechamiento(self) -> float:
+        return self.piezas * self.ancho * self.alto / (self.hoja_ancho * self.hoja_alto)
+
+    def posiciones(self) -> list:
+        """Lista de (x, y, ancho, alto) de cada pieza colocada."""
+        posiciones = []
+        for x, y, columnas, filas, paso_x, paso_y in self.bloques:
+            for j in range(filas):
+                for i in range(columnas):
+                    posiciones.append((x + i * paso_x, y + j * paso_y, paso_x - self.kerf, paso_y - self.kerf))
+        return posiciones
+
+
+def _rejilla(x, y, W, H, a, b):
+    """Rejilla uniforme de piezas a×b (paso con kerf) dentro de W×H."""
+    columnas, filas = int((W + _EPS) // a), int((H + _EPS) // b)
+    if columnas == 0 or filas == 0:
+        return 0, ()
+    return columnas * filas, ((x, y, columnas, filas, a, b),)
+
+
+def _mejor_rejilla(x, y, W, H, orientaciones):
+    mejor = (0, ())
+    for a, b in orientaciones:
+        candidato = _rejilla(x, y, W, H, a, b)
+        if candidato[0] > mejor[0]:
+            mejor = candidato
+    return mejor
+
+
+def _dos_bloques(x, y, W, H, orientaciones):
+    """
+    Mejor combinación de dos rejillas separadas por un corte de guillotina:
+    un bloque con una orientación y el resto con la mejor rejilla. Las
+    posiciones de corte se evalúan en bloque con NumPy.
+    """
+    mejor = _mejor_rejilla(x, y, W, H, orientaciones)
+    for a, b in orientaciones:
+        for vertical in (True, False):
+            largo, otro = (W, H) if vertical else (H, W)
+            paso = a if vertical else b
+            k = np.arange(1, int((largo + _EPS) // paso) + 1)
+            if len(k) == 0:
+                continue
+            por_franja = int((otro + _EPS) // (b if vertical else a))
+            resto = largo - k * paso
+            total = k * por_franja
+            extra = np.zeros(len(k), dtype=np.int64)
+            for a2, b2 in orientaciones:
+                if vertical:
+                    n2 = np.floor((resto + _EPS) / a2) * ((H + _EPS) // b2)
+                else:
+                    n2 = ((W + _EPS) // a2) * np.floor((resto + _EPS) / b2)
+                extra = np.maximum(extra, n2.astype(np.int64))
+            total = total + extra
+            i = int(np.argmax(total))
+            if total[i] <= mejor[0]:
+                continue
+            corte = float(k[i] * paso)
+            if vertical:
+                bloque = _rejilla(x, y, corte, H, a, b)
+                resto_bloque = _mejor_rejilla(x + corte, y, W - corte, H, orientaciones)
+            else:
+                bloque = _rejilla(x, y, W, corte, a, b)
+                resto_bloque = _mejor_rejilla(x, y + corte, W, H - corte, orientaciones)
+            mejor = (bloque[0] + resto_bloque[0], bloque[1] + resto_bloque[1])
+    return mejor
+
+
+def _tres_bloques(W, H, orientaciones, cota):
+    """Un primer corte de guillotina y, en el resto, la mejor combinación de dos bloques."""
+    mejor = _dos_bloques(0.0, 0.0, W, H, orientaciones)
+    for a, b in orientaciones:
+        for vertical in (True, False):
+            paso = a if vertical else b
+            largo = W if vertical else H
+            for k in range(1, int((largo + _EPS) // paso)):
+                if mejor[0] >= cota:
+                    return mejor
+                corte = k * paso
+                if vertical:
+                    bloque = _rejilla(0.0, 0.0, corte, H, a, b)
+                    resto = _dos_bloques(corte, 0.0, W - corte, H, orientaciones)
+                else:
+                    bloque = _rejilla(0.0, 0.0, W, corte, a, b)
+                    resto = _dos_bloques(0.0, corte, W, H - corte, orientaciones)
+                if bloque[0] + resto[0] > mejor[0]:
+                    mejor = (bloque[0] + resto[0], bloque[1] + resto[1])
+    return mejor
+
+
+def _rectpack(ancho, alto, W, H, kerf, rotacion, cantidad):
+    from rectpack import newPacker, float2dec
+
+    packer = newPacker(rotation=rotacion)
+    for rid in range(cantidad):
+        packer.add_rect(float2dec(ancho + kerf, 3), float2dec(alto + kerf, 3), rid)
+    packer.add_bin(float2dec(W + kerf, 3), float2dec(H + kerf, 3))  # Una sola lámina
+    packer.pack()
+    # r = (bin, x, y, w, h, rid): cada pieza como bloque de 1×1
+    return tuple(
+        (float(x), float(y), 1, 1, float(w), float(h))
+        for _, x, y, w, h, _ in packer.rect_list()
+    )
+
+
+@lru_cache(maxsize=4096)
+def anidar_rectangulos(ancho, alto, hoja_ancho=HOJA_ANCHO, hoja_alto=HOJA_ALTO,
+                       kerf=KERF_MM, rotacion=True) -> ResultadoNesting:
+    """
+    Máximo número de piezas idénticas ancho×alto en una lámina, con layouts
+    de guillotina de hasta tres bloques y rotación opcional de 90°.
+    Memoizado por (pieza, lámina, kerf, rotación).
+    """
+    if ancho <= 0 or alto <= 0:
+        raise ValueError("Dimensiones de pieza inválidas para el anidado.")
+
+    # Trabajar con el paso (pieza + kerf) sobre la lámina ampliada en un kerf:
+    # así el kerf solo se cuenta entre piezas y no contra el borde.
+    a, b = ancho + kerf, alto + kerf
+    W, H = hoja_ancho + kerf, hoja_alto + kerf
+    orientaciones = [(a, b)]
+    if rotacion and a != b:
+        orientaciones.append((b, a))
+
+    # Cota superior teórica: máximo número de figuras que caben por área
+    cota = int((W * H + _EPS) // (a * b))
+    piezas, bloques = _tres_bloques(W, H, orientaciones, cota)
+    metodo = "analitico"
+
+    if piezas < cota <= LIMITE_RECTPACK:
+        # Respaldo: una sola pasada de rectpack con la cota como objetivo
+        bloques_rp = _rectpack(ancho, alto, hoja_ancho, hoja_alto, kerf, rotacion, cota)
+        if len(bloques_rp) > piezas:
+            piezas, bloques, metodo = len(bloques_rp), bloques_rp, "rectpack"
+
+    return ResultadoNesting(
+        piezas=piezas,
+        ancho=ancho,
+        alto=alto,
+        hoja_ancho=hoja_ancho,
+        hoja_alto=hoja_alto,
+        kerf=kerf,
+        bloques=bloques,
+        metodo=metodo,
+    )
+
+
+def _maxrects_hoja(pendientes, W, H, kerf, rotacion):
+    """Llena una lámina con MaxRects (rectpack). Retorna colocaciones e índices usados."""
+    from rectpack import MaxRectsBssf, PackingMode, float2dec, newPacker
+
+    packer = newPacker(mode=PackingMode.Offline, pack_algo=MaxRectsBssf, rotation=rotacion)
+    for i, (_, ancho, alto) in enumerate(pendientes):
+        packer.add_rect(float2dec(ancho + kerf, 3), float2dec(alto + kerf, 3), i)
+    packer.add_bin(float2dec(W + kerf, 3), float2dec(H + kerf, 3))
+    packer.pack()
+    colocaciones, usados = [], set()
+    for _, x, y, w, h, i in packer.rect_list():
+        pieza_id, ancho, alto = pendientes[i]
+        rotada = abs(float(w) - (ancho + kerf)) > 1e-6
+        colocaciones.append((pieza_id, float(x), float(y), float(w) - kerf, float(h) - kerf, rotada))
+        usados.add(i)
+    return colocaciones, usados
+
+
+def _estantes_hoja(pendientes, W, H, kerf, rotacion):
+    """
+    Llena una lámina por estantes (filas), de la pieza más alta a la más baja.
+    Es lineal en el número de piezas y se usa cuando se agota el presupuesto.
+    """
+    W, H = W + kerf, H + kerf
+    orden = []
+    for i, (_, ancho, alto) in enumerate(pendientes):
+        a, b = ancho + kerf, alto + kerf
+        # Con rotación, el lado largo va horizontal si cabe: estantes más bajos
+        rotada = rotacion and b > a and b <= W
+        orden.append((b if not rotada else a, a if not rotada else b, rotada, i))
+    orden.sort(key=lambda t: -t[0])
+
+    colocaciones, usados = [], set()
+    x = y = alto_estante = 0.0
+    for alto, ancho, rotada, i in orden:
+        if ancho > W + _EPS or alto > H + _EPS:
+            continue
+        if x + ancho > W + _EPS:
+            # Nuevo estante
+            x, y, alto_estante = 0.0, y + alto_estante, 0.0
+        if y + alto > H + _EPS:
+            continue
+        colocaciones.append((pendientes[i][0], x, y, ancho - kerf, alto - kerf, rotada))
+        usados.add(i)
+        x += ancho
+        alto_estante = max(alto_estante, alto)
+    return colocaciones, usados
+
+
+@span("nesting")
+def anidar_pedido(piezas, hoja_ancho=HOJA_ANCHO, hoja_alto=HOJA_ALTO, kerf=KERF_MM,
+                  rotacion=True, presupuesto_s=PRESUPUESTO_PEDIDO_S) -> dict:
+    """
+    Anida un pedido de varias piezas con cantidades en tantas láminas como
+    hagan falta. `piezas` es una lista de (id, ancho, alto, cantidad).
+
+    1. Las láminas completas de un mismo tipo de pieza salen del anidado
+       analítico (`anidar_rectangulos`), sin empacar pieza por pieza, si
+       ese anidado aprovecha bien la lámina.
+    2. Los sobrantes de todos los tipos se mezclan lámina a lámina con
+       MaxRects mientras quede presupuesto, y con estantes después.
+    """
+    inicio = time.perf_counter()
+    limite = inicio + presupuesto_s
+    hojas, no_caben, pendientes = [], [], []
+
+    for pieza_id, ancho, alto, cantidad in piezas:
+        por_hoja = anidar_rectangulos(float(ancho), float(alto), hoja_ancho, hoja_alto, kerf, rotacion)
+        if por_hoja.piezas == 0:
+            no_caben.append(pieza_id)
+            continue
+        completas, sobrantes = divmod(int(cantidad), por_hoja.piezas)
+        if por_hoja.aprovechamiento < APROVECHAMIENTO_HOJA_COMPLETA:
+            completas, sobrantes = 0, int(cantidad)
+        if completas:
+            colocaciones = [
+                (pieza_id, x, y, w, h, abs(w - ancho) > 1e-6)
+                for x, y, w, h in por_hoja.posiciones()
+            ]
+            hojas.extend([{"colocaciones": colocaciones, "metodo": por_hoja.metodo}] * completas)
+        pendientes.extend([(pieza_id, float(ancho), float(alto))] * sobrantes)
+
+    # Sobrantes: de mayor a menor área
+    pendientes.sort(key=lambda p: -(p[1] * p[2]))
+    while pendientes:
+        if time.perf_counter() < limite and len(pendientes) <= LIMITE_RECTPACK:
+            colocaciones, usados = _maxrects_hoja(pendientes, hoja_ancho, hoja_alto, kerf, rotacion)
+            metodo = "maxrects"
+        else:
+            colocaciones, usados = _estantes_hoja(pendientes, hoja_ancho, hoja_alto, kerf, rotacion)
+            metodo = "estantes"
+        if not usados:
+            break  # No debería pasar: todas las piezas pendientes caben en una lámina vacía
+        hojas.append({"colocaciones": colocaciones, "metodo": metodo})
+        pendientes = [p for i, p in enumerate(pendientes) if i not in usados]
+
+    area_hoja = hoja_ancho * hoja_alto
+    resultado_hojas = []
+    area_total = 0.0
+    for indice, hoja in enumerate(hojas):
+        area = sum(w * h for _, _, _, w, h, _ in hoja["colocaciones"])
+        area_total += area
+        resultado_hojas.append({
+            "indice": indice,
+            "piezas": len(hoja["colocaciones"]),
+            "aprovechamiento": area / area_hoja,
+            "metodo": hoja["metodo"],
+            "colocaciones": [
+                {"id": pieza_id, "x": x, "y": y, "ancho": w, "alto": h, "rotada": rotada}
+                for pieza_id, x, y, w, h, rotada in hoja["colocaciones"]
+            ],
+        })
+
+    return {
+        "hojas": len(resultado_hojas),
+        "hoja": {"ancho": hoja_ancho, "alto": hoja_alto},
+        "kerf": kerf,
+        "aprovechamiento": area_total / (area_hoja * len(resultado_hojas)) if resultado_hojas else 0.0,
+        "no_caben": no_caben,
+        "detalle": resultado_hojas,
+        "tiempo_s": time.perf_counter() - inicio,
+    }
+
+
+def renderizar_nesting(resultado: ResultadoNesting, ruta: str) -> str:
+    """
+    Dibuja el anidado en un PNG. Las piezas van en una sola colección y se
+    usa la API orientada a objetos de matplotlib (sin pyplot).
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import PolyCollection
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    # Dibujar la lámina
+    ax.add_patch(Rectangle((0, 0), resultado.hoja_ancho, resultado.hoja_alto,
+                           edgecolor="black", facecolor="lightgrey", alpha=0.3))
+
+    posiciones = np.array(resultado.posiciones(), dtype=np.float64).reshape(-1, 4)
+    x, y, w, h = posiciones.T
+    esquinas = np.stack([
+        np.column_stack([x, y]),
+        np.column_stack([x + w, y]),
+        np.column_stack([x + w, y + h]),
+        np.column_stack([x, y + h]),
+    ], axis=1)
+    colores = ["blue", "red", "green", "purple", "orange", "cyan", "magenta", "yellow"]
+    ax.add_collection(PolyCollection(
+        esquinas,
+        edgecolors=[colores[i % len(colores)] for i in range(len(esquinas))],
+        facecolors="none",
+        linewidths=1,
+    ))
+
+    ax.set_xlim(0, resultado.hoja_ancho)
+    ax.set_ylim(0, resultado.hoja_alto)
+    ax.set_aspect("equal")
+    ax.set_title(f"Anidado de rectángulos ({resultado.piezas} piezas)")
+    ax.set_xlabel("X")
+    ax.set_ylabel("Y")
+    fig.tight_layout()
+    fig.savefig(ruta, format="png", dpi=150, bbox_inches="tight")
+    return ruta
+
+
+def clave_nesting(resultado: ResultadoNesting) -> str:
+    """Identificador estable del resultado, para cachear su imagen."""
+    datos = repr((resultado.ancho, resultado.alto, resultado.hoja_ancho, resultado.hoja_alto,
+                  resultado.kerf, resultado.piezas, resultado.bloques))
+    return hashlib.sha1(datos.encode()).hexdigest()
+
+
+def imagen_nesting(ancho, alto, rotacion, directorio, kerf=KERF_MM,
+                   hoja_ancho=HOJA_ANCHO, hoja_alto=HOJA_ALTO) -> str | None:
+    """
+    Devuelve la ruta del PNG del anidado, generándolo solo la primera vez.
+    Retorna None si la pieza no cabe en la lámina.
+    """
+    resultado = anidar_rectangulos(float(ancho), float(alto), hoja_ancho, hoja_alto, kerf, rotacion)
+    if not resultado.piezas:
+        return None
+    ruta = os.path.join(directorio, f"{clave_nesting(resultado)}.png")
+    if not os.path.exists(ruta):
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with span("render"):
+            renderizar_nesting(resultado, temporal)
+        os.replace(temporal, ruta)
+    return ruta
@@ -0,0 +1,162 @@
+import mmap
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from app.services.dxf_reader import TIPOS_EZDXF
+from app.services.metrics import contar, span
+
+
+# Límites: por encima de cualquiera el archivo se rechaza sin procesarlo
+MAX_ENTIDADES = int(os.getenv("DXF_MAX_ENTIDADES", "1000000"))
+MAX_COSTO_S = float(os.getenv("DXF_PREFLIGHT_MAX_S", "90"))
+
+# Tamaño máximo de la pieza. No se aplica aquí: $EXTMIN/$EXTMAX del header
+# suelen quedar desactualizados, así que se mide sobre la geometría leída
+# (ver analizar_dxf); la extensión del header solo se informa
+MAX_EXTENSION_MM = float(os.getenv("DXF_MAX_EXTENSION_MM", "50000"))
+
+# Rutas: hasta SINCRONO_S (y SINCRONO_MAX_MB) se cotiza en la petición;
+# hasta COMPLETO_S en un trabajo en segundo plano; más allá, en un trabajo
+# con la geometría simplificada (ver analizar_dxf). /files/upload/ solo
+# pasa a un trabajo si el cliente lo acepta (Prefer: respond-async); si
+# no, cotiza en la petición, simplificada o no según la ruta
+SINCRONO_S = float(os.getenv("DXF_PREFLIGHT_SINCRONO_S", "2"))
+SINCRONO_MAX_BYTES = int(float(os.getenv("DXF_PREFLIGHT_SINCRONO_MB", "10")) * 1024 * 1024)
+COMPLETO_S = float(os.getenv("DXF_PREFLIGHT_COMPLETO_S", "20"))
+
+RUTAS = ("sincrono", "trabajo", "simplificado", "rechazado")
+
+# Costo por línea del archivo, medido sobre el corpus: el lector rápido
+# solo recorre ENTITIES; ezdxf arma el documento completo
+_S_POR_LINEA_RAPIDO = 1.5e-6
+_S_POR_LINEA_EZDXF = 6e-6
+_S_BASE = 0.01
+# Bytes por línea de un DXF típico (para estimar los binarios)
+_BYTES_POR_LINEA = 9
+
+# Un par (código 0, nombre) empieza siempre en una línea de código
+_SECCION = re.compile(rb"^[ \t]*0\r?\nSECTION\r?\n[ \t]*2\r?\n([A-Z]+)\r?$", re.M)
+_FIN = re.compile(rb"^[ \t]*0\r?\nENDSEC\r?$", re.M)
+_OBJETO = re.compile(rb"\n[ \t]*0\r?\n([A-Z_][A-Z0-9_]*)")
+_PRIMER_CODIGO = re.compile(rb"[ \t]*(0|999)\r?\n")
+_EXTENSION = re.compile(rb"\$EXT(MIN|MAX)\r?\n[ \t]*10\r?\n([^\r\n]*)\r?\n[ \t]*20\r?\n([^\r\n]*)\r?\n")
+
+
+@dataclass
+class Escaneo:
+    """Lo que se sabe de un DXF sin armar el documento, y la ruta elegida."""
+    bytes: int
+    binario: bool = False
+    entidades: int = 0
+    tipos: dict = field(default_factory=dict)
+    lineas: int = 0
+    necesita_ezdxf: bool = False
+    extension: tuple | None = None
+    costo_s: float = 0.0
+    ruta: str = "sincrono"
+    motivo: str | None = None
+
+    def resumen(self) -> dict:
+        datos = asdict(self)
+        datos["costo_s"] = round(self.costo_s, 3)
+        return datos
+
+
+def _secciones(mm) -> dict:
+    """{nombre: (inicio, fin)} de cada sección del archivo."""
+    secciones = {}
+    for m in _SECCION.finditer(mm):
+        fin = _FIN.search(mm, m.end())
+        if fin is None:
+            break
+        secciones[m.group(1).decode()] = (m.end(), fin.start())
+    return secciones
+
+
+def _extension(mm, hasta: int) -> tuple | None:
+    """Ancho y alto del dibujo según $EXTMIN/$EXTMAX, si el header los tiene (pueden estar viejos)."""
+    puntos = {}
+    for m in _EXTENSION.finditer(mm, 0, hasta):
+        try:
+            puntos[m.group(1)] = (float(m.group(2)), float(m.group(3)))
+        except ValueError:
+            return None
+    if len(puntos) < 2:
+        return None
+    (x0, y0), (x1, y1) = puntos[b"MIN"], puntos[b"MAX"]
+    # Un dibujo vacío o sin recalcular guarda ±1e20
+    if max(abs(x0), abs(y0), abs(x1), abs(y1)) >= 1e19 or x1 < x0 or y1 < y0:
+        return None
+    return (x1 - x0, y1 - y0)
+
+
+def _contar(mm, inicio: int, fin: int) -> dict:
+    tipos = {}
+    for nombre in _OBJETO.findall(mm, inicio, fin):
+        tipos[nombre] = tipos.get(nombre, 0) + 1
+    return tipos
+
+
+def _ruta(escaneo: Escaneo) -> tuple[str, str | None]:
+    if escaneo.entidades > MAX_ENTIDADES:
+        return "rechazado", f"El archivo tiene {escaneo.entidades} entidades (máximo {MAX_ENTIDADES})."
+    if escaneo.costo_s > MAX_COSTO_S:
+        return "rechazado", "El archivo es demasiado complejo para cotizarlo automáticamente."
+    if escaneo.costo_s <= SINCRONO_S and escaneo.bytes <= SINCRONO_MAX_BYTES:
+        return "sincrono", None
+    if escaneo.costo_s <= COMPLETO_S:
+        return "trabajo", None
+    return "simplificado", None
+
+
+def escanear(ruta: str) -> Escaneo:
+    """
+    Pasada rápida sobre el archivo mapeado en memoria: valida que parezca
+    un DXF, cuenta las entidades por tipo (sin leer sus valores), lee la
+    extensión del header (informativa: no se usa para rechazar) y estima
+    cuánto tardaría el procesamiento completo. Con eso elige la ruta:
+    "sincrono", "trabajo", "simplificado" o "rechazado" (con `motivo`).
+    """
+    with span("preflight"):
+        escaneo = _escanear(ruta)
+    contar("dxf_preflight_total", ruta=escaneo.ruta)
+    return escaneo
+
+
+def _escanear(ruta: str) -> Escaneo:
+    tam = os.path.getsize(ruta)
+    escaneo = Escaneo(bytes=tam)
+    if tam == 0:
+        escaneo.ruta, escaneo.motivo = "rechazado", "El archivo está vacío."
+        return escaneo
+
+    with open(ruta, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if mm[:18] == b"AutoCAD Binary DXF":
+            # No hay líneas que contar: se estima por tamaño y lo lee ezdxf
+            escaneo.binario = escaneo.necesita_ezdxf = True
+            escaneo.lineas = tam // _BYTES_POR_LINEA
+        else:
+            secciones = _secciones(mm)
+            if not _PRIMER_CODIGO.match(mm) or "ENTITIES" not in secciones:
+                escaneo.ruta, escaneo.motivo = "rechazado", "El archivo no es un DXF válido."
+                return escaneo
+            inicio, fin = secciones["ENTITIES"]
+            tipos = _contar(mm, inicio, fin)
+            escaneo.tipos = {nombre.decode(): n for nombre, n in sorted(tipos.items())}
+            escaneo.entidades = sum(tipos.values()) - tipos.get(b"VERTEX", 0) - tipos.get(b"SEQEND", 0)
+            escaneo.lineas = mm[inicio:fin].count(b"\n")
+            escaneo.necesita_ezdxf = any(n in TIPOS_EZDXF for n in tipos)
+            escaneo.extension = _extension(mm, secciones["HEADER"][1]) if "HEADER" in secciones else None
+            if b"INSERT" in tipos and "BLOCKS" in secciones:
+                # Cada INSERT repite un bloque: se estima con el bloque promedio
+                b_inicio, b_fin = secciones["BLOCKS"]
+                bloques = max(_contar(mm, b_inicio, b_fin).get(b"BLOCK", 0), 1)
+                escaneo.lineas += mm[b_inicio:b_fin].count(b"\n") * tipos[b"INSERT"] // bloques
+
+    if escaneo.necesita_ezdxf:
+        # ezdxf lee todo el archivo, no solo las entidades
+        escaneo.costo_s = _S_BASE + max(escaneo.lineas, tam // _BYTES_POR_LINEA) * _S_POR_LINEA_EZDXF
+    else:
+        escaneo.costo_s = _S_BASE + escaneo.lineas * _S_POR_LINEA_RAPIDO
+    escaneo.ruta, escaneo.motivo = _ruta(escaneo)
+    return escaneo
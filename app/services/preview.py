@@ -0,0 +1,189 @@
+import os
+import struct
+import zlib
+import numpy as np
+from app.services.geometry import (
+    GeometriaDXF,
+    segmentos_polilineas,
+    teselar_arcos,
+    teselar_circulos,
+)
+
+
+# Lado mayor de la vista previa en píxeles (0 desactiva la vista previa)
+PREVIEW_PX = int(os.getenv("DXF_PREVIEW_PX", "800"))
+MARGEN_PX = 10
+
+# Mismos colores que usaba la vista previa con matplotlib
+COLORES = {
+    "lineas": (0, 0, 255),      # blue
+    "circulos": (0, 128, 0),    # green
+    "arcos": (255, 165, 0),     # orange
+    "polilineas": (255, 0, 0),  # red
+}
+
+# Máximo de muestras por lote al rasterizar (acota la memoria)
+_MUESTRAS_POR_LOTE = 1_000_000
+
+
+def _polilineas_a_segmentos(polilineas: np.ndarray) -> np.ndarray:
+    """(K, n, 2) -> (K*(n-1), 4)"""
+    if polilineas.size == 0:
+        return np.zeros((0, 4))
+    return np.concatenate([polilineas[:, :-1], polilineas[:, 1:]], axis=-1).reshape(-1, 4)
+
+
+def trazos(geo: GeometriaDXF) -> dict:
+    """Toda la geometría como segmentos rectos (S, 4), agrupada por tipo."""
+    return {
+        "lineas": geo.lineas,
+        "circulos": _polilineas_a_segmentos(teselar_circulos(geo.circulos)),
+        "arcos": _polilineas_a_segmentos(teselar_arcos(geo.arcos)),
+        "polilineas": segmentos_polilineas(geo),
+    }
+
+
+def _limites(segmentos) -> tuple | None:
+    todos = np.concatenate([s.reshape(-1, 2) for s in segmentos if len(s)] or [np.zeros((0, 2))])
+    if len(todos) == 0:
+        return None
+    min_x, min_y = todos.min(axis=0)
+    max_x, max_y = todos.max(axis=0)
+    return float(min_x), float(min_y), float(max_x), float(max_y)
+
+
+def _codificar_png(img: np.ndarray) -> bytes:
+    """PNG RGB de 8 bits sin dependencias (zlib + struct)."""
+    alto, ancho, _ = img.shape
+    # Cada fila empieza con el byte de filtro 0
+    filas = np.hstack([np.zeros((alto, 1), dtype=np.uint8), img.reshape(alto, ancho * 3)])
+
+    def chunk(tipo, datos):
+        return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos) & 0xFFFFFFFF)
+
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", ancho, alto, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(filas.tobytes(), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def rasterizar_segmentos(img, segmentos, color):
+    """
+    Dibuja los segmentos (en píxeles) muestreándolos a ~1 px, por lotes.
+    `img` puede ser RGB (alto, ancho, 3) o una máscara (alto, ancho).
+    """
+    if len(segmentos) == 0:
+        return
+    alto, ancho = img.shape[:2]
+    dx = segmentos[:, 2] - segmentos[:, 0]
+    dy = segmentos[:, 3] - segmentos[:, 1]
+    muestras = np.ceil(np.maximum(np.abs(dx), np.abs(dy))).astype(np.int64) + 1
+    acumulado = np.cumsum(muestras)
+    lote_ini = 0
+    while lote_ini < len(segmentos):
+        limite = (acumulado[lote_ini - 1] if lote_ini else 0) + _MUESTRAS_POR_LOTE
+        lote_fin = max(int(np.searchsorted(acumulado, limite, side="right")), lote_ini + 1)
+        n = muestras[lote_ini:lote_fin]
+        idx = np.repeat(np.arange(lote_ini, lote_fin), n)
+        inicio = np.repeat(np.cumsum(n) - n, n)
+        t = (np.arange(int(n.sum())) - inicio) / np.maximum(n - 1, 1)[idx - lote_ini]
+        xs = np.rint(segmentos[idx, 0] + t * dx[idx]).astype(np.int64)
+        ys = np.rint(segmentos[idx, 1] + t * dy[idx]).astype(np.int64)
+        dentro = (xs >= 0) & (xs < ancho) & (ys >= 0) & (ys < alto)
+        img[ys[dentro], xs[dentro]] = color
+        lote_ini = lote_fin
+
+
+def renderizar_png(geo: GeometriaDXF, px: int = PREVIEW_PX) -> bytes | None:
+    """Rasteriza la geometría directamente con NumPy (sin matplotlib)."""
+    grupos = trazos(geo)
+    limites = _limites(grupos.values())
+    if limites is None:
+        return None
+    min_x, min_y, max_x, max_y = limites
+    escala = (px - 2 * MARGEN_PX) / max(max_x - min_x, max_y - min_y, 1e-9)
+    ancho = int(np.ceil((max_x - min_x) * escala)) + 2 * MARGEN_PX
+    alto = int(np.ceil((max_y - min_y) * escala)) + 2 * MARGEN_PX
+
+    img = np.full((alto, ancho, 3), 255, dtype=np.uint8)
+    for tipo, segmentos in grupos.items():
+        if len(segmentos) == 0:
+            continue
+        # mm -> píxeles, con el eje Y hacia abajo
+        s = np.empty_like(segmentos)
+        s[:, 0::2] = (segmentos[:, 0::2] - min_x) * escala + MARGEN_PX
+        s[:, 1::2] = alto - 1 - ((segmentos[:, 1::2] - min_y) * escala + MARGEN_PX)
+        rasterizar_segmentos(img, s, COLORES[tipo])
+    return _codificar_png(img)
+
+
+def _num(valores) -> list:
+    return ["%.6g" % v for v in valores]
+
+
+def _path_segmentos(segmentos: np.ndarray) -> str:
+    x0, y0, x1, y1 = (_num(c) for c in segmentos.T)
+    return "".join(f"M{a} {b}L{c} {d}" for a, b, c, d in zip(x0, y0, x1, y1))
+
+
+def _path_polilineas(geo: GeometriaDXF) -> str:
+    partes = []
+    v = geo.poly_vertices
+    for i, cerrada in enumerate(geo.poly_cerrada.tolist()):
+        pts = v[geo.poly_offsets[i]:geo.poly_offsets[i + 1]]
+        if len(pts) < 2:
+            continue
+        coords = _num(pts.ravel())
+        partes.append("M" + " ".join(coords[:2]) + "L" + " ".join(coords[2:]) + ("Z" if cerrada else ""))
+    return "".join(partes)
+
+
+def _path_circulos(circulos: np.ndarray) -> str:
+    cx, cy, r, d = (_num(c) for c in (circulos[:, 0] - circulos[:, 2], circulos[:, 1], circulos[:, 2], 2 * circulos[:, 2]))
+    return "".join(f"M{x} {y}a{ri} {ri} 0 1 0 {di} 0a{ri} {ri} 0 1 0 -{di} 0" for x, y, ri, di in zip(cx, cy, r, d))
+
+
+def _path_arcos(arcos: np.ndarray) -> str:
+    a0 = np.radians(arcos[:, 3])
+    barrido = np.mod(np.radians(arcos[:, 4]) - a0, 2 * np.pi)
+    barrido[barrido == 0] = 2 * np.pi
+    a1 = a0 + barrido
+    cx, cy, r = arcos[:, 0], arcos[:, 1], arcos[:, 2]
+    x0, y0 = _num(cx + r * np.cos(a0)), _num(cy + r * np.sin(a0))
+    x1, y1 = _num(cx + r * np.cos(a1)), _num(cy + r * np.sin(a1))
+    grande = (barrido > np.pi).astype(int).tolist()
+    radios = _num(r)
+    # Las coordenadas van en el sistema del DXF (el grupo invierte el eje Y),
+    # así que el sentido antihorario del DXF es sweep-flag = 1
+    return "".join(
+        f"M{a} {b}A{ri} {ri} 0 {g} 1 {c} {d}"
+        for a, b, ri, g, c, d in zip(x0, y0, radios, grande, x1, y1)
+    )
+
+
+def renderizar_svg(geo: GeometriaDXF) -> bytes | None:
+    """SVG compacto: un único <path> por tipo de entidad, en coordenadas del DXF."""
+    limites = _limites(trazos(geo).values())
+    if limites is None:
+        return None
+    min_x, min_y, max_x, max_y = limites
+    ancho, alto = max(max_x - min_x, 1e-9), max(max_y - min_y, 1e-9)
+
+    paths = {
+        "lineas": _path_segmentos(geo.lineas),
+        "circulos": _path_circulos(geo.circulos),
+        "arcos": _path_arcos(geo.arcos),
+        "polilineas": _path_polilineas(geo),
+    }
+    cuerpo = "".join(
+        f'<path stroke="rgb{COLORES[tipo]}" vector-effect="non-scaling-stroke" d="{d}"/>'
+        for tipo, d in paths.items() if d
+    )
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="{min_x:.6g} {-max_y:.6g} {ancho:.6g} {alto:.6g}">'
+        f'<g transform="scale(1,-1)" fill="none" stroke-width="1">'
+        f"{cuerpo}</g></svg>"
+    )
+    return svg.encode()
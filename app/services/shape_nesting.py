@@ -0,0 +1,419 @@
+import base64
+import hashlib
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from app.services.geometry import GeometriaDXF
+from app.services.metrics import span
+from app.services.nesting import HOJA_ALTO, HOJA_ANCHO, KERF_MM, anidar_rectangulos, imagen_nesting
+from app.services.preview import rasterizar_segmentos, trazos
+
+
+# Resolución de la huella: celdas en el lado mayor de la pieza
+CELDAS_HUELLA = int(os.getenv("DXF_HUELLA_CELDAS", "256"))
+
+# Desfases entre filas que se prueban en cada retícula
+DESFASES_RETICULA = 32
+
+# Candidatos de pareja (pieza + pieza girada 180°) que se evalúan completos
+PAREJAS_EVALUADAS = 3
+
+_GRANDE = 1 << 30
+
+
+@dataclass(frozen=True)
+class Huella:
+    """
+    Silueta rasterizada de la pieza: celdas de `resolucion` mm ocupadas por
+    el contorno exterior (los huecos interiores cuentan como ocupados, no se
+    anidan piezas dentro de otras). La máscara va empaquetada en bits.
+    """
+    resolucion: float
+    filas: int
+    columnas: int
+    bits: bytes
+    area: float  # mm², sin el engrosamiento del contorno
+    ancho: float = 0.0  # rectángulo envolvente real (mm)
+    alto: float = 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+    def mascara(self) -> np.ndarray:
+        n = self.filas * self.columnas
+        return np.unpackbits(np.frombuffer(self.bits, dtype=np.uint8), count=n).reshape(self.filas, self.columnas).astype(bool)
+
+    def a_dict(self) -> dict:
+        """Campos serializables en JSON (los bits en base64)."""
+        datos = dict(vars(self))
+        datos["bits"] = base64.b64encode(self.bits).decode("ascii")
+        return datos
+
+    @classmethod
+    def desde_dict(cls, datos: dict) -> "Huella":
+        return cls(**{**datos, "bits": base64.b64decode(datos["bits"])})
+
+
+@dataclass(frozen=True)
+class ResultadoForma:
+    """
+    Retícula de piezas idénticas sobre la lámina. Cada fila avanza `paso_x`
+    celdas, las filas suben `paso_y` y cada una se corre `desfase` celdas
+    respecto de la anterior. `metodo` es "reticula", "pareja" (el motivo
+    son dos piezas, una girada 180°) o "rectangulos" cuando el anidado del
+    rectángulo envolvente coloca más piezas (entonces los pasos van en 0).
+    """
+    piezas: int
+    area_pieza: float
+    hoja_ancho: float
+    hoja_alto: float
+    rotacion: int
+    metodo: str
+    paso_x: int
+    paso_y: int
+    desfase: int
+    resolucion: float
+    pareja: tuple = ()  # corrimiento (columnas, filas) de la pieza girada
+
+    @property
+    def aprovechamiento(self) -> float:
+        return self.piezas * self.area_pieza / (self.hoja_ancho * self.hoja_alto)
+
+
+# ==== Huella ====
+
+def _dilatar(m: np.ndarray, r: int) -> np.ndarray:
+    """Dilatación con un cuadrado de lado 2r+1 (dos pasadas separables)."""
+    if r <= 0:
+        return m
+    alto, ancho = m.shape
+    p = np.pad(m, r)
+    filas = np.zeros((alto + 2 * r, ancho), dtype=bool)
+    for k in range(2 * r + 1):
+        filas |= p[:, k:k + ancho]
+    salida = np.zeros((alto, ancho), dtype=bool)
+    for k in range(2 * r + 1):
+        salida |= filas[k:k + alto]
+    return salida
+
+
+def _erosionar(m: np.ndarray, r: int) -> np.ndarray:
+    return ~_dilatar(~m, r)
+
+
+def _propagar_filas(libre: np.ndarray, fuera: np.ndarray) -> np.ndarray:
+    """Extiende `fuera` a todo tramo horizontal de celdas libres que ya toque."""
+    alto, ancho = libre.shape
+    corte = ~libre
+    corte[:, 0] = True
+    tramo = np.cumsum(corte.ravel()).reshape(alto, ancho)
+    alcanzado = np.zeros(int(tramo[-1, -1]) + 1, dtype=bool)
+    alcanzado[tramo[fuera]] = True
+    return libre & alcanzado[tramo]
+
+
+def _exterior(contorno: np.ndarray) -> np.ndarray:
+    """Celdas alcanzables desde el borde sin cruzar el contorno (relleno por tramos)."""
+    libre = ~contorno
+    fuera = np.zeros_like(libre)
+    fuera[[0, -1], :] = True
+    fuera[:, [0, -1]] = True
+    fuera &= libre
+    while True:
+        nuevo = _propagar_filas(libre, fuera)
+        nuevo = _propagar_filas(libre.T, nuevo.T).T
+        if np.array_equal(nuevo, fuera):
+            return fuera
+        fuera = nuevo
+
+
+def huella_pieza(geo: GeometriaDXF, celdas: int = CELDAS_HUELLA,
+                 area_exterior: float | None = None) -> Huella | None:
+    """
+    Rasteriza toda la geometría y rellena lo que queda dentro del contorno
+    exterior. El contorno se engrosa una celda para cerrar pequeñas
+    aberturas del dibujo; si aun así no encierra nada, la huella es el
+    rectángulo envolvente (el mismo resultado que el anidado por rectángulos).
+
+    `area_exterior` es el área exacta de la silueta si se conoce (ver
+    Contornos.area_exterior); si no, se estima del raster. Nunca supera la
+    del rectángulo envolvente.
+    """
+    segmentos = np.concatenate([s for s in trazos(geo).values() if len(s)] or [np.zeros((0, 4))])
+    if len(segmentos) == 0:
+        return None
+    puntos = segmentos.reshape(-1, 2)
+    min_x, min_y = puntos.min(axis=0)
+    max_x, max_y = puntos.max(axis=0)
+    lado = max(max_x - min_x, max_y - min_y)
+    if lado <= 0:
+        return None
+    resolucion = float(lado / celdas)
+
+    # Dos celdas libres alrededor para que el relleno arranque desde el
+    # borde aun con el contorno engrosado
+    columnas = int(np.ceil((max_x - min_x) / resolucion)) + 5
+    filas = int(np.ceil((max_y - min_y) / resolucion)) + 5
+    s = np.empty_like(segmentos)
+    s[:, 0::2] = (segmentos[:, 0::2] - min_x) / resolucion + 2
+    s[:, 1::2] = (segmentos[:, 1::2] - min_y) / resolucion + 2
+    trazo = np.zeros((filas, columnas), dtype=bool)
+    rasterizar_segmentos(trazo, s, True)
+
+    # Cierre morfológico: engrosar, rellenar y volver a adelgazar
+    contorno = _dilatar(trazo, 1)
+    relleno = _erosionar(~_exterior(contorno), 1) | trazo
+    if relleno.sum() <= 1.5 * contorno.sum():
+        relleno = np.zeros_like(trazo)
+        relleno[2:-2, 2:-2] = True
+    # Recortar al rectángulo ocupado
+    ys = np.flatnonzero(relleno.any(axis=1))
+    xs = np.flatnonzero(relleno.any(axis=0))
+    relleno = relleno[ys[0]:ys[-1] + 1, xs[0]:xs[-1] + 1]
+
+    ancho, alto = float(max_x - min_x), float(max_y - min_y)
+    if area_exterior:
+        area = area_exterior
+    else:
+        # El trazo del contorno ocupa una celda centrada en la línea: la
+        # mitad de las celdas del borde queda fuera de la pieza
+        interior = _erosionar(np.pad(relleno, 1), 1)[1:-1, 1:-1]
+        area = (relleno.sum() - 0.5 * (relleno & ~interior).sum()) * resolucion ** 2
+    return Huella(
+        resolucion=resolucion,
+        filas=relleno.shape[0],
+        columnas=relleno.shape[1],
+        bits=np.packbits(relleno).tobytes(),
+        area=min(float(area), ancho * alto),
+        ancho=ancho,
+        alto=alto,
+    )
+
+
+# ==== Retícula ====
+
+def _perfiles_columnas(m: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Fila más baja y más alta ocupada en cada columna (±_GRANDE si está vacía)."""
+    filas = np.arange(m.shape[0])[:, None]
+    abajo = np.where(m, filas, _GRANDE).min(axis=0)
+    arriba = np.where(m, filas, -_GRANDE).max(axis=0)
+    return abajo, arriba
+
+
+def _separacion(arriba_a: np.ndarray, abajo_b: np.ndarray) -> np.ndarray:
+    """
+    Subida mínima de B, corrido d columnas respecto de A, para quedar por
+    encima de A en todas las columnas comunes. Indexado por d + ancho_b - 1,
+    con d en [-(ancho_b - 1), ancho_a - 1]; sin columnas comunes da un
+    valor muy negativo.
+    """
+    ancho_a = len(arriba_a)
+    relleno = np.full(ancho_a - 1, _GRANDE)
+    q = np.concatenate([relleno, abajo_b, relleno])
+    ventanas = sliding_window_view(q, ancho_a)
+    return ((arriba_a[None, :] - ventanas).max(axis=1) + 1)[::-1]
+
+
+def _paso_vertical(separacion, ancho, alto, paso_x, desfase) -> int:
+    """Menor paso entre filas que no solapa ninguna fila con las de abajo."""
+    def necesario(m):
+        r = (m * desfase) % paso_x
+        t = np.arange(r - paso_x * ((r + ancho - 1) // paso_x), ancho, paso_x)
+        t = t[np.abs(t) < ancho]
+        return int(separacion[t + ancho - 1].max()) if len(t) else 0
+
+    paso_y = max(necesario(1), 1)
+    m = 2
+    while m * paso_y < alto:
+        paso_y = max(paso_y, -(-necesario(m) // m))
+        m += 1
+    return paso_y
+
+
+def _reticula(m: np.ndarray, celdas_x: int, celdas_y: int) -> tuple[int, int, int, int]:
+    """Mejor retícula de copias de `m`: (piezas, paso_x, paso_y, desfase)."""
+    alto, ancho = m.shape
+    if ancho > celdas_x or alto > celdas_y:
+        return 0, 0, 0, 0
+    ocupadas = m.any(axis=1)
+    columnas = np.arange(ancho)
+    izquierda = np.where(m, columnas, _GRANDE).min(axis=1)[ocupadas]
+    derecha = np.where(m, columnas, -_GRANDE).max(axis=1)[ocupadas]
+    paso_x = int((derecha - izquierda).max()) + 1
+    abajo, arriba = _perfiles_columnas(m)
+    separacion = _separacion(arriba, abajo)
+
+    mejor = (0, 0, 0, 0)
+    for desfase in np.unique(np.linspace(0, paso_x - 1, min(paso_x, DESFASES_RETICULA)).astype(int)).tolist():
+        paso_y = _paso_vertical(separacion, ancho, alto, paso_x, desfase)
+        n_filas = (celdas_y - alto) // paso_y + 1
+        inicio = (np.arange(n_filas) * desfase) % paso_x
+        libre = celdas_x - ancho - inicio
+        piezas = int(np.where(libre >= 0, libre // paso_x + 1, 0).sum())
+        if piezas > mejor[0]:
+            mejor = (piezas, paso_x, paso_y, desfase)
+    return mejor
+
+
+def _pareja(m: np.ndarray, d: int, v: int) -> np.ndarray:
+    """Motivo de `m` y `m` girada 180° corrida d columnas y v filas."""
+    alto, ancho = m.shape
+    x0, y0 = -min(0, d), -min(0, v)
+    motivo = np.zeros((max(alto, v + alto) - min(0, v), max(ancho, d + ancho) - min(0, d)), dtype=bool)
+    motivo[y0:y0 + alto, x0:x0 + ancho] |= m
+    motivo[y0 + v:y0 + v + alto, x0 + d:x0 + d + ancho] |= m[::-1, ::-1]
+    return motivo
+
+
+def _parejas(m: np.ndarray):
+    """
+    Motivos de dos piezas: `m` y `m` girada 180° encajada encima, con los
+    corrimientos de menor rectángulo envolvente. Da (motivo, (d, v)).
+    """
+    alto, ancho = m.shape
+    girada = m[::-1, ::-1]
+    _, arriba = _perfiles_columnas(m)
+    abajo, _ = _perfiles_columnas(girada)
+    separacion = _separacion(arriba, abajo)
+    candidatos = []
+    for d in np.unique(np.linspace(-(ancho - 1), ancho - 1, 2 * DESFASES_RETICULA).astype(int)).tolist():
+        v = int(separacion[d + ancho - 1])
+        if v <= -_GRANDE // 2:
+            continue
+        caja = (max(ancho, d + ancho) - min(0, d)) * (max(alto, v + alto) - min(0, v))
+        candidatos.append((caja, d, v))
+    for _, d, v in sorted(candidatos)[:PAREJAS_EVALUADAS]:
+        yield _pareja(m, d, v), (d, v)
+
+
+@lru_cache(maxsize=1024)
+def anidar_forma(huella: Huella, hoja_ancho=HOJA_ANCHO, hoja_alto=HOJA_ALTO,
+                 kerf=KERF_MM, rotacion=True) -> ResultadoForma:
+    """
+    Anida copias de la silueta en retícula: filas de piezas con un desfase
+    entre filas, probando giros de 0° y 90° (si el material lo permite) y
+    parejas con una pieza girada 180°, que es lo que aprovecha las formas
+    triangulares o en L. Cada pieza se engrosa kerf/2 por lado. Nunca
+    coloca menos piezas que el anidado del rectángulo envolvente.
+    """
+    res = huella.resolucion
+    r = int(round(kerf / 2 / res))
+    # Un tramo de n·res mm ocupa n+1 celdas al rasterizarse
+    celdas_x = int(hoja_ancho / res + 1e-9) + 1 + 2 * r
+    celdas_y = int(hoja_alto / res + 1e-9) + 1 + 2 * r
+    base = _dilatar(np.pad(huella.mascara(), r), r)
+
+    # El rectángulo envolvente real: el del raster es hasta una celda mayor
+    rect = anidar_rectangulos(huella.ancho, huella.alto, hoja_ancho, hoja_alto, kerf, rotacion)
+    mejor = ResultadoForma(rect.piezas, huella.area, hoja_ancho, hoja_alto, 0, "rectangulos", 0, 0, 0, res)
+    for giro in ((0, 90) if rotacion else (0,)):
+        m = np.rot90(base) if giro else base
+        opciones = [(m, "reticula", ())] + [(motivo, "pareja", dv) for motivo, dv in _parejas(m)]
+        for motivo, metodo, pareja in opciones:
+            piezas, paso_x, paso_y, desfase = _reticula(motivo, celdas_x, celdas_y)
+            piezas *= 2 if metodo == "pareja" else 1
+            if piezas > mejor.piezas:
+                mejor = ResultadoForma(piezas, huella.area, hoja_ancho, hoja_alto, giro, metodo,
+                                       paso_x, paso_y, desfase, res, pareja)
+    return mejor
+
+
+# ==== Imagen ====
+
+# Celdas máximas por lado al dibujar la lámina (se agrupan si hay más)
+CELDAS_IMAGEN = 1500
+
+
+def mascara_anidado(huella: Huella, resultado: ResultadoForma, kerf=KERF_MM) -> tuple[np.ndarray, int, int]:
+    """
+    Lámina rasterizada con las piezas que coloca `resultado` (de
+    `anidar_forma`), numeradas desde 1 (0 es lámina libre). Las celdas se
+    agrupan de a `escala` para no pasar de CELDAS_IMAGEN por lado.
+    Retorna (etiquetas, escala, r), con r el margen de kerf en celdas.
+    """
+    res = resultado.resolucion
+    r = int(round(kerf / 2 / res))
+    celdas_x = int(resultado.hoja_ancho / res + 1e-9) + 1 + 2 * r
+    celdas_y = int(resultado.hoja_alto / res + 1e-9) + 1 + 2 * r
+    # Los pasos salen de la pieza engrosada; se dibuja la pieza sin engrosar
+    base, dibujo = _dilatar(np.pad(huella.mascara(), r), r), np.pad(huella.mascara(), r)
+    if resultado.rotacion:
+        base, dibujo = np.rot90(base), np.rot90(dibujo)
+    if resultado.metodo == "pareja":
+        base, dibujo = _pareja(base, *resultado.pareja), _pareja(dibujo, *resultado.pareja)
+    alto, ancho = base.shape
+
+    # Origen de cada motivo, fila por fila, como los cuenta _reticula
+    origenes = []
+    for fila in range((celdas_y - alto) // resultado.paso_y + 1):
+        xs = np.arange((fila * resultado.desfase) % resultado.paso_x, celdas_x - ancho + 1, resultado.paso_x)
+        origenes.append(np.column_stack([np.full(len(xs), fila * resultado.paso_y), xs]))
+    origenes = np.concatenate(origenes)
+
+    # Celdas agrupadas: el motivo se reduce una vez y los orígenes se
+    # ajustan a la rejilla reducida (a lo sumo una celda de la imagen)
+    escala = max(1, -(-max(celdas_x, celdas_y) // CELDAS_IMAGEN))
+    etiquetas = np.zeros((-(-celdas_y // escala), -(-celdas_x // escala)), dtype=np.int32)
+    reducido = np.pad(dibujo, ((0, -alto % escala), (0, -ancho % escala)))
+    reducido = reducido.reshape(reducido.shape[0] // escala, escala, -1, escala).any(axis=(1, 3))
+    ys, xs = np.nonzero(reducido)
+    filas = np.minimum(origenes[:, :1] // escala + ys, etiquetas.shape[0] - 1)
+    columnas = np.minimum(origenes[:, 1:] // escala + xs, etiquetas.shape[1] - 1)
+    etiquetas[filas, columnas] = np.arange(1, len(origenes) + 1)[:, None]
+    return etiquetas, escala, r
+
+
+def renderizar_forma(huella: Huella, resultado: ResultadoForma, ruta: str, kerf=KERF_MM) -> str:
+    """Dibuja el anidado por forma en un PNG (mismo estilo que renderizar_nesting)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.colors import ListedColormap
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+
+    etiquetas, escala, r = mascara_anidado(huella, resultado, kerf)
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.add_patch(Rectangle((0, 0), resultado.hoja_ancho, resultado.hoja_alto,
+                           edgecolor="black", facecolor="lightgrey", alpha=0.3))
+
+    colores = ["none", "blue", "red", "green", "purple", "orange", "cyan", "magenta", "yellow"]
+    paso = resultado.resolucion * escala
+    x0 = y0 = -r * resultado.resolucion
+    ax.imshow(np.where(etiquetas > 0, (etiquetas - 1) % (len(colores) - 1) + 1, 0),
+              cmap=ListedColormap(colores), vmin=0, vmax=len(colores) - 1, origin="lower",
+              extent=(x0, x0 + etiquetas.shape[1] * paso, y0, y0 + etiquetas.shape[0] * paso),
+              interpolation="nearest", alpha=0.6)
+
+    ax.set_xlim(0, resultado.hoja_ancho)
+    ax.set_ylim(0, resultado.hoja_alto)
+    ax.set_aspect("equal")
+    ax.set_title(f"Anidado por forma ({resultado.piezas} piezas)")
+    ax.set_xlabel("X")
+    ax.set_ylabel("Y")
+    fig.tight_layout()
+    fig.savefig(ruta, format="png", dpi=150, bbox_inches="tight")
+    return ruta
+
+
+def imagen_forma(huella: Huella, rotacion, directorio, kerf=KERF_MM,
+                 hoja_ancho=HOJA_ANCHO, hoja_alto=HOJA_ALTO) -> str | None:
+    """
+    Ruta del PNG del anidado por forma, generándolo solo la primera vez.
+    Cuando gana el rectángulo envolvente es la imagen de `imagen_nesting`.
+    Retorna None si la pieza no cabe en la lámina.
+    """
+    resultado = anidar_forma(huella, hoja_ancho, hoja_alto, kerf, rotacion)
+    if resultado.metodo == "rectangulos":
+        return imagen_nesting(huella.ancho, huella.alto, rotacion, directorio, kerf, hoja_ancho, hoja_alto)
+    clave = hashlib.sha1(huella.bits + repr((huella.filas, huella.columnas, kerf, resultado)).encode()).hexdigest()
+    ruta = os.path.join(directorio, f"forma-{clave}.png")
+    if not os.path.exists(ruta):
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with span("render"):
+            renderizar_forma(huella, resultado, temporal, kerf)
+        os.replace(temporal, ruta)
+    return ruta
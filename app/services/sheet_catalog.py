@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from app.services.nesting import (
+    HOJA_ALTO, HOJA_ANCHO, KERF_MM, PRESUPUESTO_PEDIDO_S, anidar_pedido, anidar_rectangulos, imagen_nesting,
+)
+from app.services.shape_nesting import anidar_forma, imagen_forma
+
+
+# Catálogo de láminas en JSON: por material, la lista de láminas que se
+# pueden usar; "*" vale para los materiales que no aparecen. Una lista de
+# material reemplaza a la de "*" (los retales van junto con las estándar):
+#   {"*": [{"nombre": "2440x1220", "ancho": 2440, "alto": 1220}, ...],
+#    "HR1/4": [..., {"nombre": "retal-07", "ancho": 900, "alto": 700,
+#                    "factor_precio": 0.6, "retal": true}]}
+CATALOGO_ARCHIVO = os.getenv("DXF_CATALOGO_HOJAS", "")
+
+# Anidados de láminas distintas que se corren a la vez (anidado por forma)
+HILOS_HOJAS = int(os.getenv("DXF_HILOS_HOJAS", "4"))
+
+# Láminas que se anidan por forma como máximo; las que faltan se evalúan
+# con el anidado del rectángulo envolvente. Es un número y no un tiempo:
+# la lámina elegida entra en el precio y no puede depender de la carga
+HOJAS_FORMA = int(os.getenv("DXF_HOJAS_FORMA", "8"))
+
+
+@dataclass(frozen=True)
+class Hoja:
+    """
+    Lámina disponible. `factor_precio` multiplica el valor del m² del
+    material (menor que 1 en retales, que ya están pagados en parte).
+    """
+    nombre: str
+    ancho: float
+    alto: float
+    factor_precio: float = 1.0
+    retal: bool = False
+
+
+@dataclass(frozen=True)
+class Eleccion:
+    """Lámina elegida para una pieza, su desperdicio (%) y cuántas se anidaron."""
+    hoja: Hoja
+    desperdicio: float
+    piezas: int
+    evaluadas: int
+    candidatas: int
+
+
+HOJAS_ESTANDAR = (
+    Hoja(f"{HOJA_ANCHO}x{HOJA_ALTO}", HOJA_ANCHO, HOJA_ALTO),
+    Hoja("3000x1500", 3000, 1500),
+    # La misma lámina con la veta en el otro sentido (importa sin rotación)
+    Hoja(f"{HOJA_ALTO}x{HOJA_ANCHO}", HOJA_ALTO, HOJA_ANCHO),
+)
+
+
+def _leer_catalogo(ruta: str) -> dict:
+    with open(ruta, encoding="utf-8") as f:
+        datos = json.load(f)
+    catalogo = {}
+    for material, hojas in datos.items():
+        catalogo[material] = tuple(Hoja(**h) for h in hojas)
+        if not catalogo[material] or any(h.ancho <= 0 or h.alto <= 0 or h.factor_precio <= 0
+                                         for h in catalogo[material]):
+            raise ValueError(f"Catálogo de láminas inválido para '{material}'.")
+    return catalogo
+
+
+_EPS = 1e-6
+_catalogo = _leer_catalogo(CATALOGO_ARCHIVO) if CATALOGO_ARCHIVO else {}
+_hilos = None
+_lock = threading.Lock()
+
+
+def catalogo(material: str) -> tuple[Hoja, ...]:
+    """Láminas en las que se puede cortar `material`."""
+    return _catalogo.get(material) or _catalogo.get("*") or HOJAS_ESTANDAR
+
+
+def version_catalogo(material: str) -> str:
+    """Identificador corto de las láminas de `material` (para ETags)."""
+    return hashlib.sha1(repr(catalogo(material)).encode()).hexdigest()[:12]
+
+
+def _pool() -> ThreadPoolExecutor:
+    # Hilos y no procesos: esto ya corre dentro de un worker del pool, y el
+    # anidado por forma pasa casi todo el tiempo en NumPy
+    global _hilos
+    with _lock:
+        if _hilos is None:
+            _hilos = ThreadPoolExecutor(max_workers=max(HILOS_HOJAS, 1), thread_name_prefix="hojas")
+        return _hilos
+
+
+def _piezas(hoja: Hoja, ancho, alto, huella, rotacion, kerf) -> int:
+    """Piezas por lámina; los dos anidados están memoizados por (pieza, lámina)."""
+    if huella is not None:
+        return anidar_forma(huella, hoja.ancho, hoja.alto, kerf, rotacion).piezas
+    return anidar_rectangulos(float(ancho), float(alto), hoja.ancho, hoja.alto, kerf, rotacion).piezas
+
+
+def elegir_hoja(material: str, ancho, alto, huella=None, rotacion: bool = True,
+                kerf: float = KERF_MM) -> Eleccion:
+    """
+    Lámina del catálogo con el menor costo de material por pieza según el
+    modelo de cotizar_matriz: factor_precio · (1 + desperdicio). Con
+    `huella` se anida la silueta (ver `anidar_forma`); si no, el rectángulo
+    ancho×alto.
+
+    Las láminas se recorren de la más prometedora a la menos y se descartan
+    sin anidar las que ni llenas hasta el límite de área podrían mejorar la
+    mejor encontrada. Por forma se anidan en tandas de HILOS_HOJAS en
+    paralelo, hasta HOJAS_FORMA láminas; el anidado de rectángulos (y las
+    láminas que pasan de ese número) se evalúa de a una, porque es
+    analítico. Así el tiempo depende de cuántas láminas compiten de verdad,
+    no del tamaño del catálogo, y el resultado solo de la pieza y del
+    catálogo. Si ninguna sirve se usa la primera con 100% de desperdicio.
+    """
+    area = huella.area if huella is not None else float(ancho) * float(alto)
+    if area <= 0:
+        raise ValueError("Dimensiones de pieza inválidas para el anidado.")
+    hojas = catalogo(material)
+
+    def costo(hoja, aprovechamiento):
+        return hoja.factor_precio * (2.0 - aprovechamiento)
+
+    def cota(hoja):
+        # Mejor costo posible: tantas piezas como quepan por área, si el
+        # rectángulo envolvente entra en la lámina derecho o girado
+        entra = ancho <= hoja.ancho + _EPS and alto <= hoja.alto + _EPS
+        if rotacion:
+            entra |= alto <= hoja.ancho + _EPS and ancho <= hoja.alto + _EPS
+        if not entra:
+            return float("inf")
+        area_hoja = hoja.ancho * hoja.alto
+        return costo(hoja, min(area_hoja // area * area / area_hoja, 1.0))
+
+    pendientes = sorted(hojas, key=cota)
+    mejor, mejor_costo, mejor_piezas, evaluadas = None, float("inf"), 0, 0
+    while pendientes:
+        pendientes = [h for h in pendientes if cota(h) < mejor_costo]
+        por_forma = min(max(HILOS_HOJAS, 1), HOJAS_FORMA - evaluadas)
+        if huella is not None and por_forma > 0:
+            tanda, pendientes = pendientes[:por_forma], pendientes[por_forma:]
+            if len(tanda) > 1:
+                piezas = list(_pool().map(lambda h: _piezas(h, ancho, alto, huella, rotacion, kerf), tanda))
+            else:
+                piezas = [_piezas(h, ancho, alto, huella, rotacion, kerf) for h in tanda]
+        else:
+            # El anidado de rectángulos es analítico: no vale la pena repartirlo
+            tanda, pendientes = pendientes[:1], pendientes[1:]
+            piezas = [_piezas(h, ancho, alto, None, rotacion, kerf) for h in tanda]
+        evaluadas += len(tanda)
+        for hoja, n in zip(tanda, piezas):
+            if n and costo(hoja, n * area / (hoja.ancho * hoja.alto)) < mejor_costo:
+                mejor, mejor_piezas = hoja, n
+                mejor_costo = costo(hoja, n * area / (hoja.ancho * hoja.alto))
+
+    if mejor is None:
+        return Eleccion(hojas[0], 100.0, 0, evaluadas, len(hojas))
+    # Redondeado: con la lámina llena el error de punto flotante da -0.0
+    desperdicio = round(max((1 - mejor_piezas * area / (mejor.ancho * mejor.alto)) * 100, 0.0), 2)
+    return Eleccion(mejor, desperdicio, mejor_piezas, evaluadas, len(hojas))
+
+
+def imagen_hoja(material: str, ancho, alto, rotacion: bool, directorio: str, kerf: float = KERF_MM,
+                huella=None) -> str | None:
+    """
+    PNG del anidado en la lámina que elige la cotización: con `huella` el
+    anidado por forma, si no el del rectángulo envolvente (mismos
+    argumentos que `elegir_hoja`, así lámina y piezas coinciden).
+    """
+    eleccion = elegir_hoja(material, ancho, alto, huella, rotacion, kerf)
+    if huella is not None:
+        return imagen_forma(huella, rotacion, directorio, kerf, eleccion.hoja.ancho, eleccion.hoja.alto)
+    return imagen_nesting(ancho, alto, rotacion, directorio, kerf, eleccion.hoja.ancho, eleccion.hoja.alto)
+
+
+def _entra(hoja: Hoja, ancho, alto, rotacion: bool) -> bool:
+    if ancho <= hoja.ancho + _EPS and alto <= hoja.alto + _EPS:
+        return True
+    return rotacion and alto <= hoja.ancho + _EPS and ancho <= hoja.alto + _EPS
+
+
+def hoja_pedido(material: str, piezas, rotacion: bool = True, kerf: float = KERF_MM) -> Hoja:
+    """
+    Lámina para un pedido de varias piezas (id, ancho, alto, cantidad): la
+    que `elegir_hoja` elige para la pieza con más área en el pedido, o la
+    de la siguiente si en esa no entran todas. Con un solo tipo de pieza es
+    la lámina de su cotización.
+    """
+    orden = sorted(piezas, key=lambda p: -float(p[1]) * float(p[2]) * int(p[3]))
+    elegidas = [elegir_hoja(material, ancho, alto, None, rotacion, kerf).hoja for _, ancho, alto, _ in orden]
+    for hoja in elegidas:
+        if all(_entra(hoja, ancho, alto, rotacion) for _, ancho, alto, _ in piezas):
+            return hoja
+    return elegidas[0]
+
+
+def anidar_pedido_catalogo(material: str, piezas, kerf: float = KERF_MM, rotacion: bool = True,
+                           presupuesto_s: float = PRESUPUESTO_PEDIDO_S) -> dict:
+    """`anidar_pedido` en la lámina del catálogo que elige `hoja_pedido`."""
+    hoja = hoja_pedido(material, piezas, rotacion, kerf)
+    result = anidar_pedido(piezas, hoja.ancho, hoja.alto, kerf, rotacion, presupuesto_s)
+    result["hoja"]["nombre"] = hoja.nombre
+    result["hoja"]["retal"] = hoja.retal
+    return result
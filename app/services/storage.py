@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+
+# Tamaño de bloque al leer el upload y tamaño máximo aceptado
+CHUNK_BYTES = 1024 * 1024
+MAX_UPLOAD_BYTES = int(float(os.getenv("DXF_MAX_UPLOAD_MB", "50")) * 1024 * 1024)
+
+# Artefactos en disco (uploads, vistas previas, anidados, PDFs): tamaño
+# máximo total, tiempo máximo sin uso y cada cuánto se limpian
+ARTEFACTOS_MAX_BYTES = int(float(os.getenv("DXF_ARTEFACTOS_MAX_MB", "1024")) * 1024 * 1024)
+ARTEFACTOS_TTL_S = float(os.getenv("DXF_ARTEFACTOS_TTL_H", "72")) * 3600
+LIMPIEZA_INTERVALO_S = float(os.getenv("DXF_LIMPIEZA_INTERVALO_S", "600"))
+# Un archivo usado hace menos de esto nunca se borra (puede estar en proceso)
+EDAD_MINIMA_S = 600
+# Al pasar del máximo se borra hasta quedar en esta fracción
+FRACCION_OBJETIVO = 0.9
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivoDemasiadoGrande(ValueError):
+    """El archivo supera el tamaño máximo permitido."""
+
+
+def _escribir(f, datos: bytes):
+    f.write(datos)
+
+
+async def guardar_upload(file, directorio: str, max_bytes: int = MAX_UPLOAD_BYTES,
+                         extension: str = ".dxf") -> tuple[str, str, int]:
+    """
+    Copia el upload a disco por bloques mientras calcula su SHA-256, sin
+    cargarlo completo en memoria. El archivo queda guardado con su hash como
+    nombre, así que dos uploads con el mismo nombre no se pisan y uno con el
+    mismo contenido reutiliza el archivo existente.
+    Retorna (ruta, sha256, tamaño en bytes).
+    """
+    os.makedirs(directorio, exist_ok=True)
+    sha = hashlib.sha256()
+    tamano = 0
+    temporal = tempfile.NamedTemporaryFile(dir=directorio, suffix=".part", delete=False)
+    try:
+        with temporal:
+            while True:
+                bloque = await file.read(CHUNK_BYTES)
+                if not bloque:
+                    break
+                tamano += len(bloque)
+                if tamano > max_bytes:
+                    raise ArchivoDemasiadoGrande(
+                        f"El archivo supera el máximo de {max_bytes / (1024 * 1024):.1f} MB."
+                    )
+                sha.update(bloque)
+                await asyncio.to_thread(_escribir, temporal, bloque)
+
+        digest = sha.hexdigest()
+        ruta = os.path.join(directorio, f"{digest}{extension}")
+        if os.path.exists(ruta):
+            os.remove(temporal.name)
+            registrar_acceso(ruta)
+        else:
+            os.replace(temporal.name, ruta)
+        return ruta, digest, tamano
+    except BaseException:
+        if os.path.exists(temporal.name):
+            os.remove(temporal.name)
+        raise
+
+
+# ==== Limpieza de artefactos ====
+
+_accesos: set[str] = set()
+_estado = {
+    "archivos": 0,
+    "bytes": 0,
+    "borrados": 0,
+    "bytes_liberados": 0,
+    "ultima_limpieza": None,
+}
+_tarea: asyncio.Task | None = None
+
+
+def registrar_acceso(ruta: str):
+    """
+    Marca un artefacto como usado. La fecha se actualiza en la próxima
+    limpieza, así servir un archivo no hace escrituras en disco.
+    """
+    _accesos.add(ruta)
+
+
+def limpiar_artefactos(directorios, max_bytes: int = ARTEFACTOS_MAX_BYTES,
+                       ttl_s: float = ARTEFACTOS_TTL_S, en_uso=()) -> dict:
+    """
+    Borra los artefactos sin uso hace más de `ttl_s` y, si el total pasa de
+    `max_bytes`, los menos usados hasta bajar a FRACCION_OBJETIVO del máximo.
+    Los temporales (.part, .tmp) abandonados también se borran. El uso es la
+    fecha de modificación, que `registrar_acceso` mantiene al día. Las rutas
+    de `en_uso` (p. ej. uploads con una cotización en memoria) no se borran.
+    """
+    en_uso = {os.path.normpath(ruta) for ruta in en_uso}
+    accesos = list(_accesos)
+    _accesos.difference_update(accesos)
+    for ruta in accesos:
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+
+    archivos = []
+    for directorio in directorios:
+        try:
+            with os.scandir(directorio) as entradas:
+                for entrada in entradas:
+                    if entrada.is_file(follow_symlinks=False):
+                        info = entrada.stat()
+                        archivos.append((info.st_mtime, info.st_size, entrada.path))
+        except FileNotFoundError:
+            continue
+
+    ahora = time.time()
+    total = sum(tam for _, tam, _ in archivos)
+    sobrante = total - int(max_bytes * FRACCION_OBJETIVO) if total > max_bytes else 0
+    borrados = liberados = 0
+    for mtime, tam, ruta in sorted(archivos):
+        edad = ahora - mtime
+        if edad < EDAD_MINIMA_S:
+            break  # ordenados por fecha: el resto es más reciente
+        if edad <= ttl_s and sobrante <= 0 and not ruta.endswith((".part", ".tmp")):
+            continue
+        if os.path.normpath(ruta) in en_uso:
+            continue
+        try:
+            os.remove(ruta)
+        except OSError:
+            continue
+        borrados += 1
+        liberados += tam
+        sobrante -= tam
+
+    _estado.update(
+        archivos=len(archivos) - borrados,
+        bytes=total - liberados,
+        borrados=_estado["borrados"] + borrados,
+        bytes_liberados=_estado["bytes_liberados"] + liberados,
+        ultima_limpieza=ahora,
+    )
+    if borrados:
+        logger.info("Artefactos borrados", extra={"datos": {"borrados": borrados, "bytes": liberados}})
+    return {"borrados": borrados, "bytes_liberados": liberados}
+
+
+async def _limpieza_periodica(directorios, en_uso):
+    while True:
+        try:
+            # En un hilo: recorrer y borrar archivos no debe frenar el event loop
+            await asyncio.to_thread(
+                lambda: limpiar_artefactos(directorios, en_uso=en_uso() if en_uso else ()))
+        except Exception:
+            logger.exception("Falló la limpieza de artefactos")
+        await asyncio.sleep(LIMPIEZA_INTERVALO_S)
+
+
+def stats() -> dict:
+    return {**_estado, "max_bytes": ARTEFACTOS_MAX_BYTES, "ttl_s": ARTEFACTOS_TTL_S}
+
+
+def iniciar_limpieza(directorios, en_uso=None):
+    """`en_uso()`, si se da, devuelve las rutas que no se pueden borrar todavía."""
+    global _tarea
+    _tarea = asyncio.create_task(_limpieza_periodica(tuple(directorios), en_uso))
+
+
+async def detener_limpieza():
+    global _tarea
+    tarea, _tarea = _tarea, None
+    if tarea is not None:
+        tarea.cancel()
+        await asyncio.gather(tarea, return_exceptions=True)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import time
+import numpy as np
+from app.services import logs
+
+
+# DXF_WARMUP=1 precarga las librerías pesadas y los caches al arrancar, en
+# segundo plano (el servidor responde /health mientras tanto)
+WARMUP = os.getenv("DXF_WARMUP", "0") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+def precargar():
+    """
+    Importa ezdxf y fpdf y pasa una pieza mínima por cada etapa (contornos,
+    silueta, anidado, vista previa y PDF) para cargar fuentes y dejar listos
+    los caches y el código de NumPy en el proceso actual.
+    """
+    import ezdxf  # noqa: F401
+    from fpdf import FPDF
+    from app.services.contours import construir_contornos
+    from app.services.geometry import GeometriaDXF
+    from app.services.nesting import HOJA_ALTO, HOJA_ANCHO, anidar_rectangulos
+    from app.services.preview import renderizar_png, renderizar_svg
+    from app.services.shape_nesting import huella_pieza
+
+    # Placa de 100 x 60 con dos agujeros
+    geo = GeometriaDXF(
+        lineas=np.array([[0, 0, 100, 0], [100, 0, 100, 60], [100, 60, 0, 60], [0, 60, 0, 0]], dtype=np.float64),
+        circulos=np.array([[25, 30, 8], [75, 30, 8]], dtype=np.float64),
+        total_entities=6,
+    )
+    construir_contornos(geo)
+    huella_pieza(geo)
+    anidar_rectangulos(100.0, 60.0, HOJA_ANCHO, HOJA_ALTO, 0.0, True)
+    renderizar_png(geo, 64)
+    renderizar_svg(geo)
+
+    # Las fuentes core de FPDF se cargan con el primer set_font
+    pdf = FPDF()
+    pdf.add_page()
+    for estilo in ("B", "I", ""):
+        pdf.set_font("Arial", estilo, 12)
+    pdf.cell(0, 10, "warmup")
+    pdf.output(dest="S")
+
+
+def iniciar_worker():
+    """Initializer de los procesos del pool."""
+    logs.configurar()
+    if WARMUP:
+        inicio = time.perf_counter()
+        try:
+            precargar()
+        except Exception:
+            logger.exception("Falló la precarga del worker")
+            return
+        logger.info("Worker precargado", extra={"datos": {"ms": round((time.perf_counter() - inicio) * 1000)}})
+
+
+def _nada():
+    pass
+
+
+async def calentar_pool():
+    """
+    Arranca los procesos del pool (cada uno corre `iniciar_worker` y se
+    precarga) sin esperar a la primera petición.
+    """
+    from app.services import executor
+
+    inicio = time.perf_counter()
+    # Una tarea por worker: el pool levanta un proceso por cada tarea pendiente
+    tareas = [executor.ejecutar(_nada) for _ in range(max(executor.POOL_WORKERS, 1))]
+    await asyncio.gather(*tareas, return_exceptions=True)
+    logger.info("Pool precalentado", extra={"datos": {
+        "workers": max(executor.POOL_WORKERS, 1),
+        "ms": round((time.perf_counter() - inicio) * 1000),
+    }})
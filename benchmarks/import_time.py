@@ -0,0 +1,92 @@
+"""
+Presupuesto de arranque: cuánto tarda `import app.main` en un intérprete
+nuevo y qué módulos pesados carga. El arranque en frío (p. ej. en Render)
+paga todo esto antes de que /health responda.
+
+    python -m benchmarks.import_time                    # presupuesto por defecto
+    python -m benchmarks.import_time --presupuesto-ms 400 -r 7
+
+Sale con código 1 si la mediana supera el presupuesto o si al importar la
+app se carga alguno de los módulos de PROHIBIDOS (deben importarse solo en
+la etapa que los usa).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Tiempo máximo de `import app.main` (ms, mediana). Unos 330 ms son de
+# fastapi (pydantic y los modelos de OpenAPI) y ~70 ms de numpy, que la app
+# no puede diferir; el presupuesto deja margen sobre eso y salta si vuelve
+# a cargarse algo pesado al arrancar (con ezdxf y fpdf eran ~650 ms más)
+PRESUPUESTO_MS = float(os.getenv("DXF_PRESUPUESTO_IMPORT_MS", "800"))
+
+# Librerías pesadas que no deben cargarse al importar la app
+PROHIBIDOS = ("ezdxf", "fpdf", "matplotlib", "rectpack")
+
+_SONDA = """
+import json, sys, time
+inicio = time.perf_counter()
+import app.main
+ms = (time.perf_counter() - inicio) * 1000
+print(json.dumps({"ms": ms, "modulos": sorted(m for m in sys.modules if "." not in m)}))
+"""
+
+
+def medir() -> dict:
+    """Un import en frío en un proceso aparte."""
+    salida = subprocess.run(
+        [sys.executable, "-c", _SONDA], cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    return json.loads(salida.stdout.strip().splitlines()[-1])
+
+
+def mas_lentos(n: int = 10) -> list[tuple[str, float]]:
+    """Los módulos con más tiempo acumulado según `python -X importtime`."""
+    salida = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=RAIZ, capture_output=True, text=True, check=True,
+    )
+    modulos = []
+    for linea in salida.stderr.splitlines():
+        partes = linea.split("|")
+        if len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nombre = partes[2].strip()
+        if "." not in nombre:
+            modulos.append((nombre, int(partes[1]) / 1000))
+    return sorted(modulos, key=lambda m: -m[1])[:n]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--presupuesto-ms", type=float, default=PRESUPUESTO_MS)
+    parser.add_argument("-r", "--repeticiones", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    medidas = [medir() for _ in range(args.repeticiones)]
+    mediana = statistics.median(m["ms"] for m in medidas)
+    cargados = sorted(set(PROHIBIDOS) & set(medidas[0]["modulos"]))
+
+    print(f"import app.main: {mediana:.0f} ms (mediana de {args.repeticiones}, presupuesto {args.presupuesto_ms:.0f} ms)")
+    print("Más lentos (acumulado):")
+    for nombre, ms in mas_lentos():
+        print(f"  {nombre:24s} {ms:8.1f} ms")
+
+    fallas = []
+    if mediana > args.presupuesto_ms:
+        fallas.append(f"el import tarda {mediana:.0f} ms, más que el presupuesto de {args.presupuesto_ms:.0f} ms")
+    if cargados:
+        fallas.append(f"se cargan al arrancar: {', '.join(cargados)}")
+    for falla in fallas:
+        print(f"FALLA: {falla}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""
+Prueba de carga local de la API, sin red externa: levanta la app (en este
+proceso o con uvicorn y N workers) y le manda una mezcla de peticiones a
+/files/upload/, /files/download_pdf/{filename} y /health con los DXF del
+corpus, con una concurrencia fija durante un tiempo dado.
+
+Reporta throughput, latencias p50/p95/p99 y tasa de error por tipo de
+petición (un upload que responde {"status": "failed"}, como los archivos
+del corpus que no son DXF válidos, cuenta como error), y cada `--intervalo` segundos el CPU y la memoria (RSS) de los
+procesos del servidor (workers de uvicorn y del pool).
+
+    python -m benchmarks.load                                   # en proceso, 30 s, 8 clientes
+    python -m benchmarks.load --workers 2 -c 16 --duracion 60   # uvicorn con 2 workers
+    python -m benchmarks.load --mezcla upload=1,pdf=0,health=0 --unicos
+    python -m benchmarks.load --env DXF_POOL_WORKERS=2 --env DXF_CACHE_MB=0
+
+`--unicos` agrega un comentario distinto a cada DXF subido para que ningún
+cache (memoria, almacén de geometrías, PDF) lo haya visto antes. Las
+variables de `--env` se aplican antes de importar la app (o al proceso de
+uvicorn), así se comparan configuraciones del executor y de los caches.
+Necesita httpx (el mismo que usa el TestClient de FastAPI). El CPU y la
+memoria se leen de /proc, así que solo se reportan en Linux; en proceso
+incluyen también el CPU de los clientes de la prueba.
+"""
+import argparse
+import asyncio
+import contextlib
+import glob
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+RAIZ = os.path.join(DIRECTORIO, "..")
+CORPUS = os.path.join(RAIZ, "app", "static", "*.dxf")
+RESULTADOS = os.path.join(DIRECTORIO, "resultados")
+
+MEZCLA = "upload=6,pdf=3,health=1"
+TIPOS = ("upload", "pdf", "health")
+
+# Segundos máximos para que uvicorn responda /health al arrancar
+ESPERA_ARRANQUE_S = 60
+
+_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGINA = os.sysconf("SC_PAGESIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _mezcla(texto: str) -> dict:
+    pesos = {}
+    for parte in texto.split(","):
+        tipo, _, peso = parte.partition("=")
+        if tipo.strip() not in TIPOS:
+            raise argparse.ArgumentTypeError(f"tipo de petición desconocido: {tipo!r}")
+        pesos[tipo.strip()] = float(peso or 1)
+    if sum(pesos.values()) <= 0:
+        raise argparse.ArgumentTypeError("la mezcla no tiene ninguna petición")
+    return pesos
+
+
+def _percentiles(valores: list) -> dict:
+    if not valores:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    if len(valores) == 1:
+        cortes = valores * 99
+    else:
+        cortes = statistics.quantiles(valores, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cortes[49] * 1000, 2),
+        "p95_ms": round(cortes[94] * 1000, 2),
+        "p99_ms": round(cortes[98] * 1000, 2),
+        "max_ms": round(max(valores) * 1000, 2),
+    }
+
+
+# ==== Procesos del servidor ====
+
+def _hijos() -> dict:
+    """pid -> ppid de todos los procesos visibles en /proc."""
+    padres = {}
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nombre}/stat") as f:
+                # El nombre del proceso va entre paréntesis y puede tener espacios
+                campos = f.read().rsplit(")", 1)[1].split()
+            padres[int(nombre)] = int(campos[1])
+        except (OSError, IndexError, ValueError):
+            continue
+    return padres
+
+
+def _arbol(raiz: int) -> list[int]:
+    """El proceso raíz y todos sus descendientes."""
+    padres = _hijos()
+    arbol, pendientes = [], [raiz]
+    while pendientes:
+        pid = pendientes.pop()
+        arbol.append(pid)
+        pendientes.extend(hijo for hijo, padre in padres.items() if padre == pid)
+    return arbol
+
+
+def _uso(pid: int) -> tuple[float, int] | None:
+    """(segundos de CPU, bytes RSS) de un proceso; None si ya no existe."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            campos = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * _PAGINA
+    except (OSError, IndexError, ValueError):
+        return None
+    # utime y stime son los campos 14 y 15 de stat (11 y 12 tras el nombre)
+    return (int(campos[11]) + int(campos[12])) / _TICKS, rss
+
+
+class Monitor:
+    """Muestrea CPU y RSS del árbol de procesos del servidor cada `intervalo` s."""
+
+    def __init__(self, raiz: int, intervalo: float):
+        self.raiz = raiz
+        self.intervalo = intervalo
+        self.muestras = []
+        self.disponible = os.path.isdir("/proc")
+
+    async def correr(self, registro: list, inicio: float):
+        if not self.disponible:
+            return
+        anterior = {pid: _uso(pid) for pid in _arbol(self.raiz)}
+        t_anterior, visto = time.perf_counter(), 0
+        while True:
+            await asyncio.sleep(self.intervalo)
+            ahora = time.perf_counter()
+            usos = {pid: _uso(pid) for pid in _arbol(self.raiz)}
+            usos = {pid: uso for pid, uso in usos.items() if uso is not None}
+            # Un proceso nuevo (p. ej. un worker del pool) cuenta todo su CPU
+            cpu = sum(uso[0] - (anterior.get(pid) or (0.0, 0))[0] for pid, uso in usos.items())
+            # Lo que se completó en este intervalo
+            nuevos = registro[visto:]
+            visto = len(registro)
+            self.muestras.append({
+                "t_s": round(ahora - inicio, 2),
+                "procesos": len(usos),
+                "cpu_pct": round(cpu / (ahora - t_anterior) * 100, 1),
+                "rss_mb": round(sum(uso[1] for uso in usos.values()) / (1024 * 1024), 1),
+                "rss_max_proceso_mb": round(max((uso[1] for uso in usos.values()), default=0) / (1024 * 1024), 1),
+                "peticiones_s": round(len(nuevos) / (ahora - t_anterior), 1),
+                "p95_ms": _percentiles([r[2] for r in nuevos])["p95_ms"],
+            })
+            anterior, t_anterior = usos, ahora
+
+
+# ==== Servidor ====
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _esperar_health(cliente, proceso) -> None:
+    limite = time.perf_counter() + ESPERA_ARRANQUE_S
+    while time.perf_counter() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"uvicorn terminó al arrancar (código {proceso.returncode})")
+        try:
+            if (await cliente.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"uvicorn no respondió /health en {ESPERA_ARRANQUE_S} s")
+
+
+# ==== Carga ====
+
+class Carga:
+    """Clientes concurrentes que eligen el tipo de petición según la mezcla."""
+
+    def __init__(self, cliente, archivos: list, pesos: dict, unicos: bool, semilla: int):
+        self.cliente = cliente
+        self.archivos = archivos  # [(nombre, bytes)]
+        self.tipos = list(pesos)
+        self.pesos = [pesos[t] for t in self.tipos]
+        self.unicos = unicos
+        self.azar = random.Random(semilla)
+        self.pdfs = []      # URLs de PDF devueltas por los uploads
+        self.registro = []  # (tipo, ok, segundos, status)
+
+    async def _upload(self):
+        nombre, contenido = self.azar.choice(self.archivos)
+        if self.unicos:
+            # 999 es un comentario DXF: cambia el hash sin cambiar la geometría
+            contenido = f"999\n{uuid.uuid4().hex}\n".encode() + contenido
+        r = await self.cliente.post("/files/upload/", files={"file": (nombre, contenido, "application/dxf")})
+        ok = r.status_code == 200
+        if ok:
+            datos = r.json()
+            ok = datos.get("status") != "failed" and "error" not in datos
+            if ok and datos.get("pdf_url"):
+                self.pdfs.append(datos["pdf_url"])
+                del self.pdfs[:-1000]
+        return ok, r.status_code
+
+    async def _pdf(self):
+        if not self.pdfs:
+            # Todavía no hay cotizaciones de las que pedir el PDF
+            return await self._upload()
+        r = await self.cliente.get(self.azar.choice(self.pdfs))
+        return r.status_code == 200 and r.content[:4] == b"%PDF", r.status_code
+
+    async def _health(self):
+        r = await self.cliente.get("/health")
+        return r.status_code == 200, r.status_code
+
+    async def cliente_loop(self, fin: float):
+        peticiones = {"upload": self._upload, "pdf": self._pdf, "health": self._health}
+        while time.perf_counter() < fin:
+            tipo = self.azar.choices(self.tipos, self.pesos)[0]
+            if tipo == "pdf" and not self.pdfs:
+                tipo = "upload"
+            inicio = time.perf_counter()
+            try:
+                ok, status = await peticiones[tipo]()
+            except Exception as e:
+                ok, status = False, type(e).__name__
+            self.registro.append((tipo, ok, time.perf_counter() - inicio, status))
+
+
+def _resumen(registro: list, segundos: float) -> dict:
+    por_tipo = {}
+    for tipo in ("total",) + TIPOS:
+        filas = [r for r in registro if tipo == "total" or r[0] == tipo]
+        if not filas:
+            continue
+        errores = [r for r in filas if not r[1]]
+        estados = {}
+        for r in errores:
+            estados[str(r[3])] = estados.get(str(r[3]), 0) + 1
+        por_tipo[tipo] = {
+            "peticiones": len(filas),
+            "peticiones_s": round(len(filas) / segundos, 2),
+            "errores": len(errores),
+            "tasa_error": round(len(errores) / len(filas), 4),
+            "errores_por_status": estados,
+            # Latencias solo de las peticiones correctas
+            **_percentiles([r[2] for r in filas if r[1]]),
+        }
+    return por_tipo
+
+
+async def correr(args) -> dict:
+    import httpx
+
+    archivos = []
+    for ruta in sorted(glob.glob(args.corpus)):
+        with open(ruta, "rb") as f:
+            archivos.append((os.path.basename(ruta), f.read()))
+    if not archivos:
+        raise SystemExit(f"No hay archivos DXF en {args.corpus}")
+
+    tiempo_espera = httpx.Timeout(args.timeout)
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    proceso = None
+    try:
+        if args.workers:
+            puerto = _puerto_libre()
+            proceso = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(puerto),
+                 "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+                cwd=RAIZ, env=os.environ.copy(),
+            )
+            cliente = httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", timeout=tiempo_espera, limits=limites)
+            raiz, arranque = proceso.pid, contextlib.nullcontext()
+        else:
+            from app.main import app
+
+            cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://carga",
+                                        timeout=tiempo_espera, limits=limites)
+            # ASGITransport no corre el lifespan: se abre a mano (pool, jobs, limpieza)
+            raiz, arranque = os.getpid(), app.router.lifespan_context(app)
+
+        async with cliente, arranque:
+            if proceso is not None:
+                await _esperar_health(cliente, proceso)
+            carga = Carga(cliente, archivos, args.mezcla, args.unicos, args.semilla)
+            monitor = Monitor(raiz, args.intervalo)
+            inicio = time.perf_counter()
+            muestreo = asyncio.create_task(monitor.correr(carga.registro, inicio))
+            fin = inicio + args.duracion
+            await asyncio.gather(*(carga.cliente_loop(fin) for _ in range(args.concurrencia)))
+            segundos = time.perf_counter() - inicio
+            muestreo.cancel()
+            await asyncio.gather(muestreo, return_exceptions=True)
+    finally:
+        if proceso is not None:
+            proceso.terminate()
+            try:
+                proceso.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proceso.kill()
+
+    return {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "modo": f"uvicorn ({args.workers} workers)" if args.workers else "en proceso",
+        "concurrencia": args.concurrencia,
+        "duracion_s": round(segundos, 2),
+        "mezcla": args.mezcla,
+        "unicos": args.unicos,
+        "env": dict(args.env),
+        "archivos": len(archivos),
+        "resultados": _resumen(carga.registro, segundos),
+        "procesos": monitor.muestras,
+    }
+
+
+def _tabla(resultado: dict) -> str:
+    filas = [f"{'tipo':8s} {'pet.':>7s} {'pet/s':>8s} {'error %':>8s} {'p50':>9s} {'p95':>9s} {'p99':>9s} {'max':>9s}"]
+    for tipo, r in resultado["resultados"].items():
+        ms = " ".join(f"{r[k]:9.1f}" if r[k] is not None else f"{'-':>9s}" for k in ("p50_ms", "p95_ms", "p99_ms", "max_ms"))
+        filas.append(f"{tipo:8s} {r['peticiones']:7d} {r['peticiones_s']:8.2f} {r['tasa_error'] * 100:8.2f} {ms}")
+    filas.append("(latencias en ms de las peticiones correctas)")
+    if resultado["procesos"]:
+        filas.append("")
+        filas.append(f"{'t (s)':>7s} {'proc.':>6s} {'CPU %':>7s} {'RSS MB':>8s} {'máx MB':>8s} {'pet/s':>7s} {'p95 ms':>8s}")
+        for m in resultado["procesos"]:
+            p95 = f"{m['p95_ms']:8.1f}" if m["p95_ms"] is not None else f"{'-':>8s}"
+            filas.append(f"{m['t_s']:7.1f} {m['procesos']:6d} {m['cpu_pct']:7.1f} {m['rss_mb']:8.1f} "
+                         f"{m['rss_max_proceso_mb']:8.1f} {m['peticiones_s']:7.1f} {p95}")
+    return "\n".join(filas)
+
+
+def _variable(texto: str) -> tuple[str, str]:
+    nombre, igual, valor = texto.partition("=")
+    if not igual or not nombre:
+        raise argparse.ArgumentTypeError(f"se esperaba NOMBRE=valor: {texto!r}")
+    return nombre, valor
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=0, help="workers de uvicorn (0 = app en este proceso)")
+    parser.add_argument("-c", "--concurrencia", type=int, default=8, help="clientes simultáneos")
+    parser.add_argument("--duracion", type=float, default=30.0, help="segundos de carga")
+    parser.add_argument("--mezcla", type=_mezcla, default=_mezcla(MEZCLA), help=f"pesos por tipo (por defecto {MEZCLA})")
+    parser.add_argument("--corpus", default=CORPUS, help="glob de archivos DXF")
+    parser.add_argument("--unicos", action="store_true", help="cada upload con un hash nuevo (sin caches)")
+    parser.add_argument("--env", type=_variable, action="append", default=[], help="NOMBRE=valor para la app")
+    parser.add_argument("--intervalo", type=float, default=1.0, help="segundos entre muestras de CPU/RSS")
+    parser.add_argument("--timeout", type=float, default=120.0, help="timeout por petición (s)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", default=None, help="archivo JSON de resultados")
+    args = parser.parse_args(argv)
+
+    # Antes de importar la app: la configuración se lee de variables de entorno
+    os.environ.update(dict(args.env))
+    resultado = asyncio.run(correr(args))
+    print(_tabla(resultado))
+
+    destino = args.salida or os.path.join(RESULTADOS, f"carga-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, "w") as f:
+        json.dump(resultado, f, indent=2)
+    print(f"\nResultados: {destino}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
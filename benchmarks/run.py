@@ -0,0 +1,257 @@
+"""
+Benchmark del pipeline sobre el corpus de DXF (por defecto app/static/*.dxf).
+
+Cada archivo pasa por las etapas parse, geometry, lector, limpieza, bounds,
+secuencia, desperdicio, plot, cotizacion y pdf (lector es el lector rápido
+de la sección ENTITIES; parse + geometry, la carga completa con ezdxf). Se mide el tiempo de cada etapa (mediana de varias
+repeticiones), el pico de memoria (una pasada aparte con tracemalloc) y el
+número de entidades. El resultado se guarda en JSON y, si hay un baseline,
+se compara y se marcan las regresiones.
+
+    python -m benchmarks.run                       # corre y compara con benchmarks/baseline.json
+    python -m benchmarks.run --guardar-baseline    # además lo guarda como nuevo baseline
+    python -m benchmarks.run --solo Brida -r 5
+
+Sale con código 1 si hay regresiones.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import ezdxf
+
+from app.routers.files import generate_pdf
+from app.services.dxf_processor import (
+    analizar_dxf,
+    calcular_desperdicio,
+    calculate_area_and_bounds,
+    cotizar_geometria,
+    generate_dxf_plot,
+)
+from app.services import geometry_store
+from app.services.contours import construir_contornos
+from app.services.cut_path import secuenciar
+from app.services.dxf_reader import leer_geometria
+from app.services.geometry import extraer_geometria
+from app.services.geometry_cleanup import limpiar_geometria
+
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(DIRECTORIO, "..", "app", "static", "*.dxf")
+BASELINE = os.path.join(DIRECTORIO, "baseline.json")
+RESULTADOS = os.path.join(DIRECTORIO, "resultados")
+
+# Una etapa es regresión si empeora más que UMBRAL (relativo) y más que el
+# mínimo absoluto, para no marcar ruido en etapas de milisegundos
+UMBRAL = 0.25
+MINIMO_S = 0.005
+MINIMO_MB = 1.0
+
+
+def _etapas(ruta: str, salida: str) -> tuple[list, dict]:
+    """
+    El pipeline como lista de (nombre, función) para medirlas una a una.
+    Las funciones se pasan los datos por `estado`.
+    """
+    estado = {}
+    nombre = os.path.splitext(os.path.basename(ruta))[0]
+
+    def parse():
+        estado["doc"] = ezdxf.readfile(ruta)
+
+    def geometry():
+        estado["geo"] = extraer_geometria(estado["doc"].modelspace())
+
+    def lector():
+        # None si el archivo necesita ezdxf; entonces no hay nada que medir
+        leer_geometria(ruta)
+
+    def limpieza():
+        estado["geo"], _ = limpiar_geometria(estado["geo"])
+
+    def bounds():
+        estado["bounds"] = calculate_area_and_bounds(estado["geo"])
+
+    def secuencia():
+        secuenciar(construir_contornos(estado["geo"]))
+
+    def desperdicio():
+        b = estado["bounds"]
+        if b:
+            calcular_desperdicio(b["bounds"]["max_x"] - b["bounds"]["min_x"],
+                                 b["bounds"]["max_y"] - b["bounds"]["min_y"])
+
+    def plot():
+        generate_dxf_plot(ruta, os.path.join(salida, f"{nombre}.png"), estado["geo"])
+
+    def cotizacion():
+        estado["cotizacion"] = cotizar_geometria(analizar_dxf(ruta), "CR18", 1)
+
+    def pdf():
+        with open(os.path.join(salida, f"{nombre}.png"), "rb") as f:
+            preview_png = f.read()
+        generate_pdf(os.path.join(salida, f"{nombre}.pdf"), estado["cotizacion"], preview_png)
+
+    etapas = [
+        ("parse", parse), ("geometry", geometry), ("lector", lector), ("limpieza", limpieza),
+        ("bounds", bounds),
+        ("secuencia", secuencia), ("desperdicio", desperdicio), ("plot", plot), ("cotizacion", cotizacion),
+        ("pdf", pdf),
+    ]
+    return etapas, estado
+
+
+def _correr(ruta: str, salida: str, memoria: bool) -> tuple[dict, object]:
+    """Una pasada completa: {etapa: segundos o MB pico}, geometría."""
+    medidas = {}
+    etapas, estado = _etapas(ruta, salida)
+    for nombre, funcion in etapas:
+        if memoria:
+            tracemalloc.start()
+            try:
+                funcion()
+                medidas[nombre] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            finally:
+                tracemalloc.stop()
+        else:
+            inicio = time.perf_counter()
+            funcion()
+            medidas[nombre] = time.perf_counter() - inicio
+    return medidas, estado["geo"]
+
+
+def medir_archivo(ruta: str, repeticiones: int, salida: str) -> dict:
+    tiempos = {}
+    geo = None
+    for _ in range(repeticiones):
+        medidas, geo = _correr(ruta, salida, memoria=False)
+        for etapa, segundos in medidas.items():
+            tiempos.setdefault(etapa, []).append(segundos)
+    picos, _ = _correr(ruta, salida, memoria=True)
+
+    etapas = {
+        etapa: {
+            "tiempo_s": statistics.median(valores),
+            "min_s": min(valores),
+            "pico_mb": round(picos.get(etapa, 0.0), 3),
+        }
+        for etapa, valores in tiempos.items()
+    }
+    return {
+        "bytes": os.path.getsize(ruta),
+        "entidades": {
+            "total": geo.total_entities,
+            "lineas": len(geo.lineas),
+            "circulos": len(geo.circulos),
+            "arcos": len(geo.arcos),
+            "polilineas": len(geo.poly_cerrada),
+            "vertices": len(geo.poly_vertices),
+        },
+        "etapas": etapas,
+        "total_s": sum(e["tiempo_s"] for e in etapas.values()),
+    }
+
+
+def comparar(actual: dict, baseline: dict, umbral: float = UMBRAL) -> list[str]:
+    """Regresiones de tiempo y memoria frente al baseline, como texto."""
+    regresiones = []
+    for archivo, datos in actual["archivos"].items():
+        base = baseline.get("archivos", {}).get(archivo)
+        if not base or "etapas" not in datos:
+            continue
+        for etapa, medida in datos["etapas"].items():
+            previa = base.get("etapas", {}).get(etapa)
+            if not previa:
+                continue
+            for clave, minimo, unidad in (("tiempo_s", MINIMO_S, "s"), ("pico_mb", MINIMO_MB, "MB")):
+                antes, ahora = previa.get(clave, 0.0), medida[clave]
+                if ahora > antes * (1 + umbral) and ahora - antes > minimo:
+                    regresiones.append(
+                        f"{archivo} / {etapa}: {clave} {antes:.4g}{unidad} -> {ahora:.4g}{unidad} "
+                        f"(+{(ahora / antes - 1) * 100 if antes else float('inf'):.0f}%)"
+                    )
+    return regresiones
+
+
+def _tabla(resultado: dict) -> str:
+    etapas = ["parse", "geometry", "lector", "limpieza", "bounds", "secuencia", "desperdicio", "plot", "cotizacion", "pdf"]
+    filas = [f"{'archivo':32s} {'entid.':>7s} " + " ".join(f"{e[:10]:>10s}" for e in etapas) + f" {'total':>8s}"]
+    for archivo, datos in resultado["archivos"].items():
+        if "error" in datos:
+            filas.append(f"{archivo[:32]:32s} error: {datos['error']}")
+            continue
+        ms = " ".join(f"{datos['etapas'].get(e, {}).get('tiempo_s', 0) * 1000:10.1f}" for e in etapas)
+        filas.append(f"{archivo[:32]:32s} {datos['entidades']['total']:7d} {ms} {datos['total_s'] * 1000:8.1f}")
+    return "\n".join(filas) + "\n(tiempos en ms, mediana)"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=CORPUS, help="glob de archivos DXF")
+    parser.add_argument("--solo", default=None, help="solo archivos cuyo nombre contenga este texto")
+    parser.add_argument("-r", "--repeticiones", type=int, default=3)
+    parser.add_argument("--salida", default=None, help="archivo JSON de resultados")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--guardar-baseline", action="store_true")
+    parser.add_argument("--umbral", type=float, default=UMBRAL, help="empeoramiento relativo tolerado")
+    args = parser.parse_args(argv)
+
+    # Sin el almacén de geometrías: cada repetición mide la lectura del DXF y
+    # no la carga de lo que guardó la anterior
+    geometry_store.ACTIVO = False
+
+    archivos = sorted(glob.glob(args.corpus))
+    if args.solo:
+        archivos = [a for a in archivos if args.solo in os.path.basename(a)]
+
+    resultado = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticiones": args.repeticiones,
+        "archivos": {},
+    }
+    with tempfile.TemporaryDirectory() as salida:
+        for ruta in archivos:
+            nombre = os.path.basename(ruta)
+            try:
+                resultado["archivos"][nombre] = medir_archivo(ruta, args.repeticiones, salida)
+            except Exception as e:
+                resultado["archivos"][nombre] = {"error": str(e)}
+            print(f"  {nombre}", file=sys.stderr)
+
+    print(_tabla(resultado))
+
+    destino = args.salida or os.path.join(RESULTADOS, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, "w") as f:
+        json.dump(resultado, f, indent=2)
+    print(f"\nResultados: {destino}")
+
+    regresiones = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regresiones = comparar(resultado, json.load(f), args.umbral)
+        if regresiones:
+            print(f"\n{len(regresiones)} regresiones frente a {args.baseline}:")
+            print("\n".join(f"  - {r}" for r in regresiones))
+        else:
+            print(f"\nSin regresiones frente a {args.baseline}")
+
+    if args.guardar_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(resultado, f, indent=2)
+        print(f"Baseline guardado en {args.baseline}")
+
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
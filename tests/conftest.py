@@ -0,0 +1,37 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+
+ESTATICOS = os.path.join(os.path.dirname(__file__), "..", "app", "static")
+
+
+@pytest.fixture
+def app_aislada(tmp_path, monkeypatch):
+    """La app con el pool en el mismo proceso y los artefactos en tmp_path."""
+    from app.main import app
+    from app.routers import files
+    from app.services import executor, geometry_store
+    from app.services.cache import CacheLRU
+    monkeypatch.setattr(executor, "POOL_WORKERS", 0)
+    monkeypatch.setattr(geometry_store, "ACTIVO", False)
+    # Caches vacíos: cada prueba analiza sus archivos desde cero
+    for nombre in ("geometrias", "cotizaciones", "previews"):
+        monkeypatch.setattr(files, nombre, CacheLRU(files.CACHE_BYTES))
+    for nombre in ("UPLOAD_DIR", "PREVIEW_DIR", "PDF_DIR", "NESTING_DIR"):
+        directorio = tmp_path / nombre
+        directorio.mkdir()
+        monkeypatch.setattr(files, nombre, str(directorio))
+    monkeypatch.setattr(files, "ARTEFACTOS", (files.UPLOAD_DIR, files.PREVIEW_DIR, files.NESTING_DIR, files.PDF_DIR))
+    yield app
+    executor.cerrar()
+
+
+@pytest.fixture
+def cliente(app_aislada):
+    with TestClient(app_aislada) as c:
+        yield c
+
+
+def subir(cliente, nombre, ruta="/files/upload/", params=None, **cabeceras):
+    with open(os.path.join(ESTATICOS, nombre), "rb") as f:
+        return cliente.post(ruta, files={"file": (nombre, f)}, params=params, headers=cabeceras)
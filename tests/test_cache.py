@@ -0,0 +1,71 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services.cache import CacheLRU, SingleFlight
+
+
+def test_single_flight_comparte_el_calculo():
+    vuelos = SingleFlight()
+    llamadas = 0
+
+    async def fabrica():
+        nonlocal llamadas
+        llamadas += 1
+        await asyncio.sleep(0.01)
+        return llamadas
+
+    async def principal():
+        return await asyncio.gather(*(vuelos.ejecutar("k", fabrica) for _ in range(10)))
+
+    assert asyncio.run(principal()) == [1] * 10
+    assert vuelos.compartidas == 9
+    assert vuelos.stats()["en_curso"] == 0
+    # Terminado el vuelo, la misma clave vuelve a calcularse
+    assert asyncio.run(vuelos.ejecutar("k", fabrica)) == 2
+
+
+def test_single_flight_propaga_errores_a_todos():
+    vuelos = SingleFlight()
+
+    async def fabrica():
+        await asyncio.sleep(0.01)
+        raise ValueError("archivo inválido")
+
+    async def principal():
+        return await asyncio.gather(*(vuelos.ejecutar("k", fabrica) for _ in range(3)), return_exceptions=True)
+
+    errores = asyncio.run(principal())
+    assert all(isinstance(e, ValueError) for e in errores)
+    assert vuelos.stats()["en_curso"] == 0
+
+
+def test_single_flight_cancelar_un_cliente_no_cancela_a_los_demas():
+    vuelos = SingleFlight()
+
+    async def fabrica():
+        await asyncio.sleep(0.05)
+        return "listo"
+
+    async def principal():
+        primero = asyncio.ensure_future(vuelos.ejecutar("k", fabrica))
+        segundo = asyncio.ensure_future(vuelos.ejecutar("k", fabrica))
+        await asyncio.sleep(0.01)
+        primero.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primero
+        return await segundo
+
+    assert asyncio.run(principal()) == "listo"
+
+
+def test_cache_lru_acotado_por_bytes():
+    cache = CacheLRU(max_bytes=3 * (800 + 112))
+    for k in range(3):
+        cache.put(k, np.zeros(100))
+    cache.get(0)  # 0 pasa a ser el más reciente
+    cache.put(3, np.zeros(100))
+    assert cache.get(1) is None
+    assert cache.get(0) is not None and cache.get(3) is not None
+    assert cache.stats()["evictions"] == 1
+    cache.put("grande", np.zeros(10_000))  # no cabe: no se guarda ni vacía el cache
+    assert cache.get("grande") is None and cache.stats()["entradas"] == 3
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from app.services.contours import construir_contornos
+from app.services.geometry import GeometriaDXF
+
+
+def poligono_lineas(puntos, invertir=()):
+    """Lados de un polígono como líneas sueltas; los de `invertir` van al revés."""
+    lineas = []
+    for k, (a, b) in enumerate(zip(puntos, puntos[1:] + puntos[:1])):
+        lineas.append((*b, *a) if k in invertir else (*a, *b))
+    return lineas
+
+
+def test_encadena_lineas_desordenadas():
+    cuadrado = poligono_lineas([(0, 0), (100, 0), (100, 50), (0, 50)], invertir=(1, 3))
+    geo = GeometriaDXF(lineas=np.array(cuadrado[::-1], dtype=np.float64), total_entities=4)
+    contornos = construir_contornos(geo)
+    assert len(contornos.areas) == 1
+    assert contornos.abiertos == 0
+    assert contornos.areas[0] == pytest.approx(5000)
+    assert contornos.limites_pieza == (0, 0, 100, 50)
+
+
+def test_cierra_dentro_de_la_tolerancia():
+    cuadrado = np.array(poligono_lineas([(0, 0), (10, 0), (10, 10), (0, 10)]), dtype=np.float64)
+    cuadrado[2, :2] += 0.02  # hueco de 0.02 mm entre dos lados
+    contornos = construir_contornos(GeometriaDXF(lineas=cuadrado, total_entities=4), tol=0.05)
+    assert len(contornos.areas) == 1 and contornos.abiertos == 0
+    contornos = construir_contornos(GeometriaDXF(lineas=cuadrado, total_entities=4), tol=0.01)
+    assert len(contornos.areas) == 0 and contornos.abiertos == 1
+
+
+def test_lineas_y_arcos_forman_un_hueco():
+    # Exterior 100x100 y una ranura de 20x10 con extremos redondeados (r=5)
+    exterior = poligono_lineas([(0, 0), (100, 0), (100, 100), (0, 100)])
+    ranura = [(40, 45, 60, 45), (60, 55, 40, 55)]
+    arcos = [(60, 50, 5, 270, 90), (40, 50, 5, 90, 270)]
+    geo = GeometriaDXF(lineas=np.array(exterior + ranura, dtype=np.float64),
+                       arcos=np.array(arcos, dtype=np.float64), total_entities=8)
+    contornos = construir_contornos(geo)
+    assert contornos.exteriores == 1 and contornos.huecos == 1
+    ranura_area = 20 * 10 + np.pi * 25
+    assert contornos.area_neta == pytest.approx(10000 - ranura_area)
+    assert contornos.area_exterior == pytest.approx(10000)
+    assert contornos.perforaciones == 2
+
+
+def test_isla_dentro_de_un_hueco():
+    circulos = np.array([(50, 50, 40), (50, 50, 20), (50, 50, 5)], dtype=np.float64)
+    contornos = construir_contornos(GeometriaDXF(circulos=circulos, total_entities=3))
+    assert contornos.profundidad.tolist() == [0, 1, 2]
+    assert contornos.padre.tolist() == [-1, 0, 1]
+    assert contornos.area_neta == pytest.approx(np.pi * (40 ** 2 - 20 ** 2 + 5 ** 2))
+
+
+def test_rejilla_de_perforaciones():
+    xs, ys = np.meshgrid(np.arange(30) * 10 + 10, np.arange(30) * 10 + 10)
+    circulos = np.column_stack([xs.ravel(), ys.ravel(), np.full(xs.size, 3.0)])
+    lineas = np.array(poligono_lineas([(0, 0), (310, 0), (310, 310), (0, 310)]), dtype=np.float64)
+    contornos = construir_contornos(GeometriaDXF(lineas=lineas, circulos=circulos, total_entities=904))
+    exterior = int(np.flatnonzero(contornos.profundidad == 0)[0])
+    assert contornos.exteriores == 1 and contornos.huecos == 900
+    assert (contornos.padre[contornos.profundidad == 1] == exterior).all()
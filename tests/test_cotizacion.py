@@ -0,0 +1,54 @@
+import pytest
+from app.services.dxf_processor import (
+    calcular_descuento,
+    calcular_utilidad,
+    cotizar_geometria,
+    cotizar_lote,
+)
+from conftest import subir
+
+MATERIALES = ["CR18", "CR14", "HR12"]
+CANTIDADES = [1, 2, 10, 99, 100, 500]
+
+# Una pieza chica (utilidad decreciente) y una grande (costo bruto por
+# encima de COSTO_UTILIDAD_MINIMA, utilidad fija)
+GEOMETRIAS = [
+    {"ancho": 150.0, "alto": 80.0, "total_perimeter": 640.0, "longitud_lineas": 0.0,
+     "total_entities": 6, "perforaciones": 2, "recorrido_vacio_mm": 120.0},
+    {"ancho": 2000.0, "alto": 1000.0, "total_perimeter": 60000.0, "longitud_lineas": 1500.0,
+     "total_entities": 400, "perforaciones": 80, "recorrido_vacio_mm": 9000.0},
+]
+
+
+@pytest.mark.parametrize("geometria", GEOMETRIAS)
+def test_matriz_igual_al_calculo_escalar(geometria):
+    lote = cotizar_lote(geometria, MATERIALES, CANTIDADES)
+    for i, material in enumerate(MATERIALES):
+        costo_bruto = lote["costo_bruto"][i]
+        precio_total = costo_bruto * calcular_utilidad(costo_bruto) * 1.19
+        for j, cantidad in enumerate(CANTIDADES):
+            descuento = calcular_descuento(cantidad)
+            assert lote["descuento_porcentaje"][j] == descuento
+            precio_final = precio_total - precio_total * descuento / 100
+            assert lote["precio_final"][i][j] == pytest.approx(precio_final)
+            assert lote["precio_unitario_con_descuento"][i][j] == pytest.approx(precio_final / cantidad)
+            # Cada celda es la cotización individual
+            celda = cotizar_geometria(geometria, material, cantidad)
+            assert celda["precio_final"] == pytest.approx(lote["precio_final"][i][j])
+            assert celda["costo_bruto"] == pytest.approx(costo_bruto)
+
+
+def test_lote_por_http(cliente):
+    r = subir(cliente, "Brida.dxf", ruta="/files/quote/batch",
+              params={"materiales": "CR18,HR12", "cantidades": "1,100"})
+    assert r.status_code == 200
+    lote = r.json()
+    assert lote["materiales"] == ["CR18", "HR12"] and lote["cantidades"] == [1, 100]
+    assert len(lote["precio_final"]) == 2 and all(len(fila) == 2 for fila in lote["precio_final"])
+    individual = subir(cliente, "Brida.dxf", params={"material": "HR12", "cantidad": 100}).json()
+    assert individual["precio_final"] == pytest.approx(lote["precio_final"][1][1])
+
+    r = subir(cliente, "Brida.dxf", ruta="/files/quote/batch", params={"materiales": "XX"})
+    assert r.status_code == 422
+    r = subir(cliente, "Brida.dxf", ruta="/files/quote/batch", params={"cantidades": "1,a"})
+    assert r.status_code == 422
@@ -0,0 +1,41 @@
+import numpy as np
+from app.services.contours import construir_contornos
+from app.services.cut_path import secuenciar
+from app.services.geometry import GeometriaDXF
+
+
+def placa_perforada(n=400, seed=0) -> GeometriaDXF:
+    rng = np.random.default_rng(seed)
+    centros = rng.uniform(10, 990, (n, 2))
+    lineas = np.array([(0, 0, 1000, 0), (1000, 0, 1000, 1000), (1000, 1000, 0, 1000), (0, 1000, 0, 0)], float)
+    return GeometriaDXF(lineas=lineas, circulos=np.column_stack([centros, np.full(n, 2.0)]), total_entities=n + 4)
+
+
+def test_secuencia_determinista():
+    contornos = construir_contornos(placa_perforada())
+    a, b = secuenciar(contornos), secuenciar(contornos)
+    assert np.array_equal(a.orden, b.orden)
+    assert a.recorrido_vacio == b.recorrido_vacio
+    assert a.recorrido_vacio <= a.recorrido_inicial
+
+
+def test_huecos_antes_que_el_exterior():
+    contornos = construir_contornos(placa_perforada())
+    secuencia = secuenciar(contornos)
+    exterior = int(np.flatnonzero(contornos.profundidad == 0)[0])
+    assert sorted(secuencia.orden.tolist()) == list(range(len(contornos.areas)))
+    assert secuencia.orden[-1] == exterior
+
+
+def test_sin_pasadas_queda_el_vecino_mas_cercano():
+    secuencia = secuenciar(construir_contornos(placa_perforada()), pasadas=0)
+    assert secuencia.recorrido_vacio == secuencia.recorrido_inicial
+
+
+def test_tope_de_tiempo_devuelve_la_mejor_secuencia(monkeypatch):
+    from app.services import cut_path
+    contornos = construir_contornos(placa_perforada())
+    monkeypatch.setattr(cut_path, "LIMITE_2OPT_S", 0.0)
+    secuencia = secuenciar(contornos)
+    assert sorted(secuencia.orden.tolist()) == list(range(len(contornos.areas)))
+    assert secuencia.recorrido_vacio <= secuencia.recorrido_inicial
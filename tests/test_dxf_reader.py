@@ -0,0 +1,26 @@
+import glob
+import os
+import dataclasses
+import numpy as np
+import pytest
+from app.services.dxf_reader import leer_geometria
+from app.services.geometry import GeometriaDXF, extraer_geometria
+
+ezdxf = pytest.importorskip("ezdxf")
+
+CORPUS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "app", "static", "*.dxf")))
+
+
+@pytest.mark.parametrize("ruta", CORPUS, ids=os.path.basename)
+def test_lector_rapido_igual_a_ezdxf(ruta):
+    rapida = leer_geometria(ruta)
+    if rapida is None:
+        pytest.skip("el lector rápido delega este archivo en ezdxf")
+    esperada = extraer_geometria(ezdxf.readfile(ruta).modelspace())
+
+    assert rapida.total_entities == esperada.total_entities
+    for campo in dataclasses.fields(GeometriaDXF):
+        a, b = getattr(rapida, campo.name), getattr(esperada, campo.name)
+        if isinstance(a, np.ndarray):
+            assert a.shape == b.shape, campo.name
+            np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-9, err_msg=campo.name)
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+import pytest
+from app.services import executor
+from app.services.executor import PoolSaturado, TiempoAgotado, ejecutar
+from conftest import subir
+
+
+@pytest.fixture
+def pool_en_hilo(monkeypatch):
+    executor.cerrar()
+    monkeypatch.setattr(executor, "POOL_WORKERS", 0)
+    monkeypatch.setattr(executor, "POOL_MAX_PENDIENTES", 0)
+    yield
+    executor.cerrar()
+
+
+def test_ejecuta_en_un_proceso_del_pool(monkeypatch):
+    executor.cerrar()
+    monkeypatch.setattr(executor, "POOL_WORKERS", 1)
+    try:
+        assert asyncio.run(ejecutar(max, 3, 7)) == 7
+        assert isinstance(executor.get_executor(), executor.ProcessPoolExecutor)
+    finally:
+        executor.cerrar()
+
+
+def test_pool_saturado(pool_en_hilo):
+    liberar = threading.Event()
+
+    async def prueba():
+        ocupado = asyncio.create_task(ejecutar(liberar.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolSaturado):
+            await ejecutar(max, 1, 2)
+        liberar.set()
+        assert await ocupado is True
+        # Con el trabajo terminado vuelve a aceptar
+        return await ejecutar(max, 1, 2)
+
+    assert asyncio.run(prueba()) == 2
+    assert executor.en_vuelo() == 0
+
+
+def test_tiempo_agotado_libera_el_cupo_al_terminar(pool_en_hilo):
+    with pytest.raises(TiempoAgotado):
+        asyncio.run(ejecutar(time.sleep, 0.3, timeout=0.05))
+    # El cupo sigue ocupado mientras el trabajo corre de verdad
+    assert executor.en_vuelo() == 1
+    time.sleep(0.5)
+    assert executor.en_vuelo() == 0
+
+
+def test_upload_responde_503_y_504(cliente, monkeypatch):
+    from app.routers import files
+
+    def falla(error):
+        async def ejecutar_falso(*args, **kwargs):
+            raise error
+        return ejecutar_falso
+
+    monkeypatch.setattr(files, "ejecutar", falla(PoolSaturado("Servidor ocupado")))
+    r = subir(cliente, "Brida.dxf")
+    assert r.status_code == 503 and r.headers["Retry-After"] == "5"
+
+    monkeypatch.setattr(files, "ejecutar", falla(TiempoAgotado("Tardó demasiado")))
+    r = subir(cliente, "Brida.dxf")
+    assert r.status_code == 504 and r.json()["error"] == "Tardó demasiado"
@@ -0,0 +1,63 @@
+import os
+from conftest import subir
+
+
+def test_anidado_solo_cuando_se_pide(cliente, tmp_path):
+    r = subir(cliente, "Brida.dxf")
+    assert r.status_code == 200
+    # Cotizar no dibuja el anidado
+    assert os.listdir(tmp_path / "NESTING_DIR") == []
+
+    url = r.json()["nesting_png_url"]
+    imagen = cliente.get(url)
+    assert imagen.status_code == 200 and imagen.headers["content-type"] == "image/png"
+    assert imagen.content.startswith(b"\x89PNG")
+    assert len(os.listdir(tmp_path / "NESTING_DIR")) == 1
+    assert "immutable" in imagen.headers["Cache-Control"]
+
+    # El cliente que ya la tiene recibe 304 sin que se vuelva a anidar
+    etag = imagen.headers["ETag"]
+    assert cliente.get(url, headers={"If-None-Match": etag}).status_code == 304
+    # Otro modo es otra imagen
+    otra = cliente.get(url.replace("modo_nesting=rect", "modo_nesting=forma"))
+    assert otra.status_code == 200 and otra.headers["ETag"] != etag
+
+
+def test_anidado_errores(cliente):
+    file_id = subir(cliente, "Brida.dxf").json()["file_id"]
+    assert cliente.get(f"/files/nesting/{file_id}.png?modo_nesting=otro").status_code == 422
+    assert cliente.get(f"/files/nesting/{'0' * 64}.png").status_code == 404
+
+
+def test_pdf_se_genera_al_pedirlo_y_una_sola_vez(cliente, tmp_path, monkeypatch):
+    from app.routers import files
+    generados, original = [], files.generate_pdf
+
+    def generate_pdf(ruta, *args):
+        generados.append(ruta)
+        return original(ruta, *args)
+
+    monkeypatch.setattr(files, "generate_pdf", generate_pdf)
+
+    r = subir(cliente, "Brida.dxf")
+    assert os.listdir(tmp_path / "PDF_DIR") == []
+
+    url = r.json()["pdf_url"]
+    pdf = cliente.get(url)
+    assert pdf.status_code == 200 and pdf.headers["content-type"] == "application/pdf"
+    assert pdf.content.startswith(b"%PDF")
+    assert pdf.headers["Cache-Control"] == "private, no-cache"
+    etag = pdf.headers["ETag"]
+    assert os.listdir(tmp_path / "PDF_DIR") == [f"{etag.strip(chr(34))}.pdf"]
+
+    # Revalidar da 304 y volver a descargar sirve el mismo archivo
+    assert cliente.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert cliente.get(url).content == pdf.content
+    assert len(generados) == 1
+
+    # Otra cantidad es otra cotización: otro PDF con otro ETag
+    otro = cliente.get(url.replace("cantidad=1", "cantidad=5"))
+    assert otro.status_code == 200 and otro.headers["ETag"] != etag
+    assert len(generados) == 2 and len(os.listdir(tmp_path / "PDF_DIR")) == 2
+
+    assert cliente.get(f"/files/download_pdf/x?file_id={'0' * 64}").status_code == 404
@@ -0,0 +1,111 @@
+import math
+import numpy as np
+import pytest
+from app.services import dxf_processor, geometry_store
+from app.services.dxf_reader import leer_geometria
+from app.services.geometry import areas_polilineas, extraer_geometria, longitudes_polilineas, perimetro_total
+
+ezdxf = pytest.importorskip("ezdxf")
+
+
+def dibujo():
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (30, 40))
+    msp.add_circle((50, 50), 10)
+    msp.add_arc((0, 0), 5, 0, 90)
+    msp.add_lwpolyline([(0, 0), (10, 0), (10, 10), (0, 10)], close=True)
+    return doc
+
+
+def test_columnas_por_tipo():
+    geo = extraer_geometria(dibujo().modelspace())
+    assert geo.total_entities == 4
+    np.testing.assert_allclose(geo.lineas, [[0, 0, 30, 40]])
+    np.testing.assert_allclose(geo.circulos, [[50, 50, 10]])
+    np.testing.assert_allclose(geo.arcos, [[0, 0, 5, 0, 90]])
+    assert geo.poly_offsets.tolist() == [0, 4] and geo.poly_cerrada.tolist() == [True]
+    # Las magnitudes salen de las columnas, sin recorrer entidades
+    assert longitudes_polilineas(geo).tolist() == [40]
+    assert areas_polilineas(geo).tolist() == [100]
+    assert perimetro_total(geo) == pytest.approx(50 + 2 * math.pi * 10 + math.pi * 5 / 2 + 40)
+
+
+def test_lector_rapido_delega_lo_que_no_entiende(tmp_path, monkeypatch):
+    monkeypatch.setattr(geometry_store, "ACTIVO", False)
+    simple, con_curva = tmp_path / "simple.dxf", tmp_path / "curva.dxf"
+    doc = dibujo()
+    doc.saveas(simple)
+    doc.modelspace().add_spline([(0, 0), (10, 10), (20, 0), (30, 10)])
+    doc.saveas(con_curva)
+
+    assert leer_geometria(str(simple)) is not None
+    assert leer_geometria(str(con_curva)) is None
+    # Archivos que no son DXF de texto también van a ezdxf
+    vacio = tmp_path / "vacio.dxf"
+    vacio.write_bytes(b"")
+    assert leer_geometria(str(vacio)) is None
+    binario = tmp_path / "binario.dxf"
+    binario.write_bytes(b"AutoCAD Binary DXF\r\n\x1a\x00")
+    assert leer_geometria(str(binario)) is None
+
+    # cargar_geometria cae a ezdxf y obtiene la curva igual
+    geo = dxf_processor.cargar_geometria(str(con_curva))
+    assert geo.total_entities == 5 and geo.poly_curva.sum() == 1
+
+
+def test_entidades_del_paperspace_no_cuentan(tmp_path):
+    doc = dibujo()
+    doc.paperspace().add_line((0, 0), (500, 500))
+    ruta = tmp_path / "papel.dxf"
+    doc.saveas(ruta)
+    geo = leer_geometria(str(ruta))
+    assert geo is not None and len(geo.lineas) == 1
+
+
+def test_bulges_y_elipses_se_aplanan_con_tolerancia():
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    # Dos medias vueltas con bulge 1: un círculo de radio 5
+    msp.add_lwpolyline([(0, 0, 1), (10, 0, 1)], format="xyb", close=True)
+    msp.add_ellipse((100, 0), major_axis=(20, 0), ratio=0.5)
+    geo = extraer_geometria(msp, tol=0.01)
+
+    assert geo.poly_cerrada.tolist() == [True, True]
+    assert geo.poly_curva.tolist() == [False, True]
+    circulo, elipse = longitudes_polilineas(geo)
+    assert circulo == pytest.approx(2 * math.pi * 5, rel=1e-3)
+    assert elipse == pytest.approx(96.884, rel=1e-3)  # Ramanujan, a=20 b=10
+    # Vértices sobre la curva y cuerdas a menos de `tol`: el área que se
+    # pierde no pasa de tol × perímetro
+    radios = np.hypot(*(geo.poly_vertices[:geo.poly_offsets[1]] - (5, 0)).T)
+    assert np.abs(radios - 5).max() < 1e-9
+    perdida = np.array([math.pi * 25, math.pi * 200]) - areas_polilineas(geo)
+    assert (perdida > 0).all() and (perdida < 0.01 * np.array([circulo, elipse])).all()
+
+
+def test_inserts_transforman_el_bloque():
+    doc = ezdxf.new()
+    bloque = doc.blocks.new("PIEZA")
+    bloque.add_line((0, 0), (10, 0))
+    bloque.add_circle((0, 0), 2)
+    bloque.add_arc((0, 0), 3, 0, 90)
+    msp = doc.modelspace()
+    msp.add_blockref("PIEZA", (100, 0), dxfattribs={"xscale": 2, "yscale": 2, "rotation": 90})
+    msp.add_blockref("PIEZA", (0, 100), dxfattribs={"xscale": -1})
+    msp.add_blockref("PIEZA", (0, 0), dxfattribs={"column_count": 2, "row_count": 3,
+                                                  "column_spacing": 50, "row_spacing": 50})
+    msp.add_blockref("PIEZA", (500, 500), dxfattribs={"xscale": 1, "yscale": 3})
+    geo = extraer_geometria(msp)
+
+    # 1 + 1 + 6 copias con escala uniforme, 1 deformada
+    assert len(geo.lineas) == 9 and len(geo.circulos) == 8 and len(geo.arcos) == 8
+    np.testing.assert_allclose(geo.lineas[0], [100, 0, 100, 20], atol=1e-9)
+    np.testing.assert_allclose(geo.circulos[0], [100, 0, 4])
+    # El espejo invierte el arco: va de 90° a 180°
+    assert np.mod(geo.arcos[1, 3:], 360) == pytest.approx([90, 180])
+    assert sorted(map(tuple, geo.circulos[2:, :2])) == [(x, y) for x in (0, 50) for y in (0, 50, 100)]
+    # Con escala distinta en x e y, círculo y arco pasan a polilíneas curvas
+    assert geo.poly_curva.tolist() == [True, True] and geo.poly_cerrada.tolist() == [True, False]
+    esperado = (10 + 2 * math.pi * 2 + math.pi * 3 / 2) * (2 + 1 + 6) + 10
+    assert perimetro_total(geo) - longitudes_polilineas(geo).sum() == pytest.approx(esperado)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+from app.services.geometry import GeometriaDXF, perimetro_total
+from app.services.geometry_cleanup import limpiar_geometria
+
+CUADRADO = [(0, 0, 100, 0), (100, 0, 100, 100), (100, 100, 0, 100), (0, 100, 0, 0)]
+
+
+def geometria(lineas=(), circulos=(), arcos=(), polilineas=()):
+    vertices = [v for p, _ in polilineas for v in p]
+    conteos = [len(p) for p, _ in polilineas]
+    offsets = np.zeros(len(conteos) + 1, dtype=np.int64)
+    np.cumsum(conteos, out=offsets[1:])
+    return GeometriaDXF(
+        lineas=np.array(lineas, dtype=np.float64).reshape(-1, 4),
+        circulos=np.array(circulos, dtype=np.float64).reshape(-1, 3),
+        arcos=np.array(arcos, dtype=np.float64).reshape(-1, 5),
+        poly_vertices=np.array(vertices, dtype=np.float64).reshape(-1, 2),
+        poly_offsets=offsets,
+        poly_cerrada=np.array([c for _, c in polilineas], dtype=bool),
+        poly_lw=np.ones(len(polilineas), dtype=bool),
+        poly_curva=np.zeros(len(polilineas), dtype=bool),
+        total_entities=len(lineas) + len(circulos) + len(arcos) + len(polilineas),
+    )
+
+
+def test_geometria_limpia_no_cambia():
+    geo = geometria(CUADRADO, circulos=[(50, 50, 10)])
+    limpia, reporte = limpiar_geometria(geo)
+    assert limpia is geo
+    assert reporte["entidades_eliminadas"] == 0
+
+
+def test_quita_duplicados_y_degenerados():
+    sucias = CUADRADO + [
+        (0, 0, 100, 0),            # duplicada
+        (100, 100, 100, 0),        # duplicada al revés
+        (30, 30, 30, 30.001),      # largo cero
+    ]
+    geo = geometria(sucias, circulos=[(50, 50, 10), (50, 50.004, 10.002)],
+                    arcos=[(20, 20, 5, 0, 90), (20, 20, 5, 0, 90)])
+    limpia, reporte = limpiar_geometria(geo, tol=0.01)
+
+    assert reporte["degeneradas"] == 1
+    assert len(limpia.lineas) == 4 and len(limpia.circulos) == 1 and len(limpia.arcos) == 1
+    # Círculos y arcos repetidos se quitan; las líneas repetidas se funden
+    assert reporte["duplicadas"] == 2 and reporte["solapes_fusionados"] == 2
+    assert reporte["entidades_eliminadas"] == 5
+    esperado = 400 + 2 * np.pi * 10 + np.pi * 5 / 2
+    assert perimetro_total(limpia) == pytest.approx(esperado)
+    assert reporte["longitud_eliminada_mm"] == pytest.approx(perimetro_total(geo) - esperado, abs=1e-3)
+
+
+def test_fusiona_solapes_colineales():
+    geo = geometria(CUADRADO + [(20, 0, 60, 0), (50, 0, 130, 0)])
+    limpia, reporte = limpiar_geometria(geo)
+    # Las dos añadidas se absorben en el lado de abajo (que se parte en 100)
+    assert reporte["solapes_fusionados"] == 2
+    assert reporte["longitud_eliminada_mm"] == pytest.approx(90)
+    # Sobre y=0 queda cortado una sola vez el tramo 0..130
+    sobre_eje = limpia.lineas[(limpia.lineas[:, 1] == 0) & (limpia.lineas[:, 3] == 0)]
+    assert np.hypot(sobre_eje[:, 2] - sobre_eje[:, 0], 0).sum() == pytest.approx(130)
+
+
+def test_conserva_lineas_que_se_tocan_en_un_extremo():
+    # Dos tramos consecutivos con otra línea llegando a la unión: no es un solape
+    geo = geometria([(0, 0, 50, 0), (50, 0, 100, 0), (50, 0, 50, 40)])
+    limpia, reporte = limpiar_geometria(geo)
+    assert reporte["entidades_eliminadas"] == 0
+    assert len(limpia.lineas) == 3
+
+
+def test_fusiona_aunque_el_tramo_se_parta_en_un_nodo():
+    # 0..50 está cortado dos veces; la unión 0..100 se parte en 50 por la
+    # vertical y quedan tantas líneas como había
+    geo = geometria([(0, 0, 100, 0), (0, 0, 50, 0), (50, 0, 50, 40)])
+    limpia, reporte = limpiar_geometria(geo)
+    assert limpia is not geo
+    assert reporte["solapes_fusionados"] == 1 and reporte["entidades_eliminadas"] == 1
+    assert reporte["longitud_eliminada_mm"] == pytest.approx(50)
+    assert perimetro_total(limpia) == pytest.approx(140)
+
+
+def test_conteo_no_negativo_si_la_fusion_agrega_tramos():
+    # 20..50 solapa a 0..100, que se parte en 20 y en 50: salen más líneas
+    # de las que entraron, pero se fusionó un solape
+    geo = geometria([(0, 0, 100, 0), (20, 0, 50, 0), (20, 0, 20, 40), (50, 0, 50, 40)])
+    limpia, reporte = limpiar_geometria(geo)
+    assert len(limpia.lineas) == 5
+    assert reporte["solapes_fusionados"] == 1 and reporte["entidades_eliminadas"] == 1
+    assert reporte["longitud_eliminada_mm"] == pytest.approx(30)
+
+
+def test_polilineas_repetidas_y_vertices_repetidos():
+    p = [(0, 0), (10, 0), (10, 10), (0, 10)]
+    geo = geometria(polilineas=[(p, True), (p[1:] + p[:1], True), ([(0, 0), (0, 0), (5, 5)], False)])
+    limpia, reporte = limpiar_geometria(geo)
+    assert reporte["duplicadas"] == 1
+    assert reporte["vertices_repetidos"] == 1
+    assert np.diff(limpia.poly_offsets).tolist() == [4, 2]
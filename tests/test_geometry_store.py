@@ -0,0 +1,48 @@
+import os
+import threading
+import pytest
+from app.services import dxf_processor, geometry_store
+
+ESTATICOS = os.path.join(os.path.dirname(__file__), "..", "app", "static")
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(geometry_store, "ACTIVO", True)
+    monkeypatch.setattr(geometry_store, "DIRECTORIO", str(tmp_path))
+    # Una conexión nueva para el directorio de la prueba
+    monkeypatch.setattr(geometry_store, "_local", threading.local())
+    return tmp_path
+
+
+def test_resumen_se_guarda_como_json(almacen):
+    ruta = os.path.join(ESTATICOS, "Brida.dxf")
+    clave = geometry_store.clave_archivo(ruta)
+    resumen = dxf_processor.analizar_dxf(ruta)
+    geometry_store.guardar_resumen(clave, resumen)
+
+    assert geometry_store.cargar_resumen(clave) == resumen
+    guardado = geometry_store._conexion().execute(
+        "SELECT resumen FROM geometrias WHERE clave = ?", (clave,)).fetchone()[0]
+    assert isinstance(guardado, str) and guardado.startswith("{")
+
+
+def test_resumen_ilegible_no_se_carga(almacen):
+    clave = "0" * 64
+    geometry_store.guardar_resumen(clave, {"ancho": 1.0})
+    geometry_store._conexion().execute("UPDATE geometrias SET resumen = ? WHERE clave = ?",
+                                       (b"\x80\x05no es json", clave))
+    assert geometry_store.cargar_resumen(clave) is None
+
+
+def test_geometria_y_contadores(almacen):
+    ruta = os.path.join(ESTATICOS, "Brida.dxf")
+    clave = geometry_store.clave_archivo(ruta)
+    antes = geometry_store.stats()
+    assert geometry_store.cargar(clave) is None
+    geo = dxf_processor.cargar_geometria(ruta)
+    cargada = geometry_store.cargar(clave)
+    assert cargada is not None and (cargada.lineas == geo.lineas).all()
+    despues = geometry_store.stats()
+    assert despues["misses"] - antes["misses"] >= 1 and despues["hits"] - antes["hits"] == 1
+    assert despues["escrituras"] - antes["escrituras"] == 1
@@ -0,0 +1,12 @@
+import statistics
+from benchmarks.import_time import PRESUPUESTO_MS, PROHIBIDOS, medir
+
+
+def test_import_no_carga_librerias_pesadas():
+    cargados = set(PROHIBIDOS) & set(medir()["modulos"])
+    assert not cargados
+
+
+def test_import_dentro_del_presupuesto():
+    mediana = statistics.median(medir()["ms"] for _ in range(3))
+    assert mediana <= PRESUPUESTO_MS
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import pytest
+from app.services import jobs
+from conftest import subir
+
+
+async def _con_cola(prueba):
+    await jobs.iniciar()
+    try:
+        return await prueba()
+    finally:
+        await jobs.detener()
+
+
+async def _esperar(trabajo):
+    while trabajo.estado not in jobs.TERMINADOS:
+        await asyncio.sleep(0.01)
+
+
+def test_trabajo_avanza_en_orden_y_termina():
+    async def procesar(trabajo):
+        for etapa in ("parse", "geometry", "nesting", "parse", "preview"):
+            trabajo.avanzar(etapa)  # la etapa atrasada se ignora
+        return {"precio": 1}
+
+    async def prueba():
+        trabajo = jobs.encolar(procesar)
+        await _esperar(trabajo)
+        return trabajo
+
+    trabajo = asyncio.run(_con_cola(prueba))
+    assert trabajo.estado == "completado" and trabajo.resultado == {"precio": 1}
+    etapas = [e["etapa"] for e in trabajo.eventos]
+    assert etapas == ["en_cola", "parse", "geometry", "nesting", "preview", "preview"]
+    progresos = [e["progreso"] for e in trabajo.eventos]
+    assert progresos == sorted(progresos) and progresos[-1] == 1.0
+    assert list(jobs.ETAPAS) == ["en_cola", "parse", "geometry", "nesting", "preview", "cotizacion"]
+
+
+def test_trabajo_fallido_guarda_el_error():
+    async def procesar(trabajo):
+        raise ValueError("archivo roto")
+
+    async def prueba():
+        trabajo = jobs.encolar(procesar)
+        await _esperar(trabajo)
+        return trabajo
+
+    trabajo = asyncio.run(_con_cola(prueba))
+    assert trabajo.estado == "fallido" and trabajo.error == "archivo roto"
+
+
+def test_cola_llena(monkeypatch):
+    monkeypatch.setattr(jobs, "JOBS_WORKERS", 1)
+    monkeypatch.setattr(jobs, "JOBS_MAX_EN_COLA", 1)
+
+    async def prueba():
+        liberar = asyncio.Event()
+
+        async def procesar(trabajo):
+            await liberar.wait()
+            return {}
+
+        primero = jobs.encolar(procesar)
+        await asyncio.sleep(0.01)  # el worker toma el primero
+        jobs.encolar(procesar)     # el segundo espera en la cola
+        with pytest.raises(jobs.ColaLlena):
+            jobs.encolar(procesar)
+        liberar.set()
+        await _esperar(primero)
+
+    asyncio.run(_con_cola(prueba))
+
+
+def test_cola_llena_responde_503(cliente, monkeypatch):
+    def llena(procesar):
+        raise jobs.ColaLlena("Demasiados trabajos en cola")
+
+    monkeypatch.setattr(jobs, "encolar", llena)
+    r = subir(cliente, "Brida.dxf", ruta="/files/jobs")
+    assert r.status_code == 503 and r.headers["Retry-After"] == "5"
+
+
+def test_sse_del_trabajo(cliente):
+    r = subir(cliente, "Brida.dxf", ruta="/files/jobs")
+    assert r.status_code == 202
+    aceptado = r.json()
+
+    eventos = []
+    with cliente.stream("GET", aceptado["events_url"]) as sse:
+        assert sse.headers["content-type"].startswith("text/event-stream")
+        for bloque in sse.iter_text():
+            for mensaje in bloque.split("\n\n"):
+                lineas = dict(l.split(": ", 1) for l in mensaje.splitlines() if not l.startswith(":"))
+                if lineas:
+                    eventos.append((lineas["event"], json.loads(lineas["data"])))
+    tipos = [tipo for tipo, _ in eventos]
+    assert tipos[-1] == "fin" and set(tipos[:-1]) == {"progreso"}
+    assert eventos[-1][1]["estado"] == "completado"
+    etapas = [datos["etapa"] for _, datos in eventos]
+    orden = [e for e in jobs.ETAPAS if e in etapas]
+    assert sorted(set(etapas), key=orden.index) == orden
+
+    estado = cliente.get(aceptado["status_url"]).json()
+    assert estado["estado"] == "completado" and estado["resultado"]["precio_final"] > 0
+    assert cliente.get("/files/jobs/no-existe").status_code == 404
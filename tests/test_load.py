@@ -0,0 +1,49 @@
+import argparse
+import json
+import os
+import pytest
+from benchmarks import load
+from conftest import ESTATICOS
+
+
+def test_mezcla():
+    assert load._mezcla("upload=2,health") == {"upload": 2.0, "health": 1.0}
+    with pytest.raises(argparse.ArgumentTypeError):
+        load._mezcla("upload=1,borrar=1")
+    with pytest.raises(argparse.ArgumentTypeError):
+        load._mezcla("upload=0")
+
+
+def test_percentiles():
+    p = load._percentiles([k / 1000 for k in range(1, 101)])
+    assert p == {"p50_ms": 50.5, "p95_ms": 95.05, "p99_ms": 99.01, "max_ms": 100.0}
+    assert load._percentiles([0.02]) == {"p50_ms": 20.0, "p95_ms": 20.0, "p99_ms": 20.0, "max_ms": 20.0}
+    assert load._percentiles([])["p95_ms"] is None
+
+
+def test_resumen_separa_errores_de_latencias():
+    registro = [("upload", True, 0.1, 200), ("upload", False, 9.0, 503), ("upload", False, 9.0, 503),
+                ("health", True, 0.01, 200)]
+    resumen = load._resumen(registro, segundos=2.0)
+    assert resumen["total"]["peticiones"] == 4 and resumen["total"]["peticiones_s"] == 2.0
+    assert resumen["upload"]["tasa_error"] == pytest.approx(2 / 3, abs=1e-4)
+    assert resumen["upload"]["errores_por_status"] == {"503": 2}
+    # Las peticiones fallidas no entran en las latencias
+    assert resumen["upload"]["max_ms"] == 100.0
+    assert "pdf" not in resumen
+
+
+def test_carga_corta_en_proceso(app_aislada, tmp_path):
+    salida = tmp_path / "carga.json"
+    argv = ["-c", "2", "--duracion", "1.5", "--intervalo", "0.5", "--mezcla", "upload=1,pdf=1,health=1",
+            "--corpus", os.path.join(ESTATICOS, "Brida.dxf"), "--salida", str(salida)]
+    assert load.main(argv) == 0
+
+    resultado = json.loads(salida.read_text())
+    r = resultado["resultados"]
+    assert resultado["modo"] == "en proceso" and resultado["archivos"] == 1
+    assert r["total"]["peticiones"] == sum(r[t]["peticiones"] for t in load.TIPOS if t in r)
+    assert r["total"]["errores"] == 0
+    assert r["upload"]["p50_ms"] > 0 and r["pdf"]["peticiones"] > 0
+    if os.path.isdir("/proc"):
+        assert resultado["procesos"] and resultado["procesos"][0]["rss_mb"] > 0
@@ -0,0 +1,58 @@
+import re
+from app.services import metrics
+from conftest import subir
+
+
+def test_spans_de_una_peticion_van_a_la_cabecera_y_al_histograma():
+    with metrics.medir() as mediciones:
+        with metrics.span("prueba_a"):
+            pass
+        with metrics.span("prueba_a"):
+            pass
+        metrics.contar("prueba_eventos_total", 2, tipo="x")
+        # Lo medido en un worker del pool se suma a la petición en curso
+        _, tiempos, contadores = metrics.en_worker(lambda: metrics.contar("prueba_eventos_total", tipo="x"))
+        metrics.fusionar(tiempos, contadores)
+
+    # Las repeticiones de una etapa se suman en una sola entrada
+    cabecera = metrics.server_timing(mediciones, total=0.5)
+    assert re.fullmatch(r"prueba_a;dur=\d+\.\d{2}, total;dur=500\.00", cabecera)
+    assert [e for e, _ in mediciones.tiempos] == ["prueba_a", "prueba_a"]
+
+    texto = metrics.exportar()
+    assert 'dxf_etapa_segundos_count{etapa="prueba_a"} 2' in texto
+    assert 'dxf_etapa_segundos_bucket{etapa="prueba_a",le="+Inf"} 2' in texto
+    assert "# TYPE prueba_eventos_total counter" in texto
+    assert 'prueba_eventos_total{tipo="x"} 3' in texto
+
+
+def test_buckets_acumulados():
+    metrics.observar("prueba_segundos", 0.003)
+    metrics.observar("prueba_segundos", 0.2)
+    texto = metrics.exportar()
+    assert 'prueba_segundos_bucket{le="0.0025"} 0' in texto
+    assert 'prueba_segundos_bucket{le="0.005"} 1' in texto
+    assert 'prueba_segundos_bucket{le="0.25"} 2' in texto
+    assert "prueba_segundos_sum 0.203000" in texto
+
+
+def conteo_upload(texto) -> int:
+    m = re.search(r'dxf_http_segundos_count\{metodo="POST",ruta="/files/upload/"\} (\d+)', texto)
+    return int(m.group(1)) if m else 0
+
+
+def test_server_timing_y_metrics_por_http(cliente):
+    antes = conteo_upload(cliente.get("/metrics").text)
+    r = subir(cliente, "Brida.dxf")
+    assert r.status_code == 200
+    etapas = dict(p.split(";dur=") for p in r.headers["Server-Timing"].split(", "))
+    assert {"parse", "total"} <= etapas.keys()
+    assert all(float(ms) >= 0 for ms in etapas.values())
+
+    texto = cliente.get("/metrics").text
+    assert conteo_upload(texto) == antes + 1
+    assert re.search(r'dxf_etapa_segundos_count\{etapa="parse"\} [1-9]', texto)
+    # Los colectores se leen al exportar: el cache de cotizaciones (nuevo en
+    # cada prueba) registró el fallo de esta subida
+    assert "# TYPE dxf_cache_bytes gauge" in texto
+    assert 'dxf_cache_misses_total{cache="cotizaciones"} 1' in texto
@@ -0,0 +1,98 @@
+import itertools
+import pytest
+from collections import Counter
+from app.services.nesting import HOJA_ALTO, HOJA_ANCHO, anidar_pedido, anidar_rectangulos
+
+
+def validar(resultado):
+    """Piezas dentro de la lámina, sin solaparse y separadas al menos un kerf."""
+    posiciones = resultado.posiciones()
+    assert len(posiciones) == resultado.piezas
+    k = resultado.kerf
+    for x, y, w, h in posiciones:
+        assert sorted((w, h)) == pytest.approx(sorted((resultado.ancho, resultado.alto)))
+        assert x >= -1e-6 and y >= -1e-6
+        assert x + w <= resultado.hoja_ancho + 1e-6 and y + h <= resultado.hoja_alto + 1e-6
+    for (x1, y1, w1, h1), (x2, y2, w2, h2) in itertools.combinations(posiciones, 2):
+        separadas = (x1 + w1 + k <= x2 + 1e-6 or x2 + w2 + k <= x1 + 1e-6
+                     or y1 + h1 + k <= y2 + 1e-6 or y2 + h2 + k <= y1 + 1e-6)
+        assert separadas
+
+
+def test_llena_la_lamina_exacta():
+    resultado = anidar_rectangulos(1220.0, 610.0, kerf=0.0)
+    assert resultado.piezas == 4 and resultado.aprovechamiento == pytest.approx(1.0)
+    validar(resultado)
+
+
+def test_kerf_solo_entre_piezas():
+    # Con 2 mm de kerf ya no entran 2×2; girada entran 3 en una fila
+    resultado = anidar_rectangulos(1220.0, 610.0, kerf=2.0)
+    assert resultado.piezas == 3
+    validar(resultado)
+    # Contra el borde no se descuenta: 2 piezas de 1219 con kerf 2 entran en 2440
+    assert anidar_rectangulos(1219.0, 1220.0, kerf=2.0, rotacion=False).piezas == 2
+
+
+def test_rotacion():
+    assert anidar_rectangulos(100.0, 1300.0, rotacion=False).piezas == 0
+    girada = anidar_rectangulos(100.0, 1300.0, rotacion=True)
+    assert girada.piezas == 12
+    validar(girada)
+
+
+@pytest.mark.parametrize("ancho,alto", [(700, 500), (430, 170), (333, 251), (95.5, 61.2), (1500, 900)])
+def test_mejor_que_una_rejilla(ancho, alto):
+    resultado = anidar_rectangulos(float(ancho), float(alto), kerf=1.0)
+    validar(resultado)
+    a, b = ancho + 1.0, alto + 1.0
+    W, H = HOJA_ANCHO + 1.0, HOJA_ALTO + 1.0
+    rejilla = max((W // a) * (H // b), (W // b) * (H // a))
+    assert rejilla <= resultado.piezas <= (W * H) // (a * b)
+
+
+def test_combina_orientaciones():
+    # 700×500: en rejilla entran 6; con un bloque girado al costado, 7
+    resultado = anidar_rectangulos(700.0, 500.0, kerf=0.0)
+    assert resultado.piezas == 7
+    assert len(resultado.bloques) >= 2
+    validar(resultado)
+
+
+def test_dimensiones_invalidas():
+    with pytest.raises(ValueError):
+        anidar_rectangulos(0.0, 10.0)
+
+
+def validar_pedido(resultado, piezas):
+    """Cada lámina del pedido sin piezas fuera ni solapadas, y las cantidades completas."""
+    k, hoja = resultado["kerf"], resultado["hoja"]
+    colocadas = Counter()
+    for detalle in resultado["detalle"]:
+        cajas = [(c["x"], c["y"], c["ancho"], c["alto"]) for c in detalle["colocaciones"]]
+        colocadas.update(c["id"] for c in detalle["colocaciones"])
+        for x, y, w, h in cajas:
+            assert x >= -1e-6 and y >= -1e-6
+            assert x + w <= hoja["ancho"] + 1e-6 and y + h <= hoja["alto"] + 1e-6
+        for (x1, y1, w1, h1), (x2, y2, w2, h2) in itertools.combinations(cajas, 2):
+            assert (x1 + w1 + k <= x2 + 1e-6 or x2 + w2 + k <= x1 + 1e-6
+                    or y1 + h1 + k <= y2 + 1e-6 or y2 + h2 + k <= y1 + 1e-6)
+    esperadas = {i: c for i, _, _, c in piezas if i not in resultado["no_caben"]}
+    assert colocadas == esperadas
+
+
+def test_pedido_mezcla_piezas_en_varias_laminas():
+    piezas = [("a", 610.0, 300.0, 25), ("b", 400.0, 250.0, 7), ("c", 90.0, 60.0, 40), ("d", 3000.0, 50.0, 2)]
+    resultado = anidar_pedido(piezas, kerf=2.0)
+    assert resultado["no_caben"] == ["d"]
+    assert resultado["hojas"] == len(resultado["detalle"]) >= 2
+    assert 0.0 < resultado["aprovechamiento"] <= 1.0
+    validar_pedido(resultado, piezas)
+
+
+def test_pedido_sin_presupuesto_usa_estantes():
+    piezas = [("a", 333.0, 251.0, 9), ("b", 120.0, 80.0, 15)]
+    resultado = anidar_pedido(piezas, kerf=1.0, presupuesto_s=0.0)
+    metodos = {d["metodo"] for d in resultado["detalle"]}
+    assert "estantes" in metodos and "maxrects" not in metodos
+    validar_pedido(resultado, piezas)
@@ -0,0 +1,98 @@
+import os
+import pytest
+from app.services import preflight
+from app.services.preflight import escanear
+from conftest import subir
+
+ESTATICOS = os.path.join(os.path.dirname(__file__), "..", "app", "static")
+
+
+def dxf_lineas(ruta, n, ext=None):
+    """DXF ASCII mínimo con n líneas; `ext` escribe $EXTMIN/$EXTMAX en el header."""
+    partes = ["0", "SECTION", "2", "HEADER"]
+    if ext:
+        partes += ["9", "$EXTMIN", "10", "0.0", "20", "0.0", "30", "0.0",
+                   "9", "$EXTMAX", "10", str(ext[0]), "20", str(ext[1]), "30", "0.0"]
+    partes += ["0", "ENDSEC", "0", "SECTION", "2", "ENTITIES"]
+    for k in range(n):
+        partes += ["0", "LINE", "8", "0", "10", str(k), "20", "0", "30", "0", "11", str(k), "21", "10", "31", "0"]
+    partes += ["0", "ENDSEC", "0", "EOF"]
+    ruta.write_text("\n".join(partes) + "\n")
+    return str(ruta)
+
+
+def test_cuenta_entidades_y_elige_sincrono(tmp_path):
+    escaneo = escanear(dxf_lineas(tmp_path / "a.dxf", 50))
+    assert escaneo.entidades == 50 and escaneo.tipos == {"LINE": 50}
+    assert not escaneo.necesita_ezdxf
+    assert escaneo.ruta == "sincrono" and escaneo.motivo is None
+
+
+def test_rutas_por_costo(tmp_path, monkeypatch):
+    ruta = dxf_lineas(tmp_path / "a.dxf", 2000)
+    monkeypatch.setattr(preflight, "SINCRONO_S", 0.0)
+    assert escanear(ruta).ruta == "trabajo"
+    monkeypatch.setattr(preflight, "COMPLETO_S", 0.0)
+    assert escanear(ruta).ruta == "simplificado"
+    monkeypatch.setattr(preflight, "MAX_COSTO_S", 0.0)
+    assert escanear(ruta).ruta == "rechazado"
+
+
+def test_rechaza_demasiadas_entidades(tmp_path, monkeypatch):
+    monkeypatch.setattr(preflight, "MAX_ENTIDADES", 10)
+    escaneo = escanear(dxf_lineas(tmp_path / "a.dxf", 11))
+    assert escaneo.ruta == "rechazado" and "11 entidades" in escaneo.motivo
+
+
+def test_rechaza_lo_que_no_es_dxf(tmp_path):
+    vacio = tmp_path / "vacio.dxf"
+    vacio.write_bytes(b"")
+    assert escanear(str(vacio)).ruta == "rechazado"
+    assert escanear(os.path.join(ESTATICOS, "Brida (1).dxf")).ruta == "rechazado"
+
+
+def test_la_extension_del_header_no_rechaza(tmp_path, monkeypatch):
+    # Header viejo: dice 200 m para unas líneas de 10 mm
+    escaneo = escanear(dxf_lineas(tmp_path / "a.dxf", 5, ext=(200000, 150000)))
+    assert escaneo.extension == (200000, 150000)
+    assert escaneo.ruta == "sincrono"
+    # MC.dxf: el header dice 20722×15610 mm para una pieza de 1.2×2.4 m
+    monkeypatch.setattr(preflight, "MAX_EXTENSION_MM", 3000)
+    assert escanear(os.path.join(ESTATICOS, "MC.dxf")).ruta == "sincrono"
+
+
+def test_el_limite_de_tamano_se_mide_en_la_geometria(monkeypatch):
+    from app.services import dxf_processor, geometry_store
+    monkeypatch.setattr(geometry_store, "ACTIVO", False)
+    resumen = dxf_processor.analizar_dxf(os.path.join(ESTATICOS, "MC.dxf"))
+    assert max(resumen["ancho"], resumen["alto"]) < 3000
+    monkeypatch.setattr(dxf_processor, "MAX_EXTENSION_MM", 1000)
+    with pytest.raises(ValueError, match="mide más de"):
+        dxf_processor.analizar_dxf(os.path.join(ESTATICOS, "MC.dxf"))
+
+
+def test_upload_es_sincrono_salvo_que_se_pida_asincrono(cliente, monkeypatch):
+    monkeypatch.setattr(preflight, "SINCRONO_S", 0.0)
+    r = subir(cliente, "Brida.dxf")
+    assert r.status_code == 200 and r.json()["status"] == "success"
+    assert r.json()["preflight"]["ruta"] == "trabajo"
+
+    monkeypatch.setattr(preflight, "COMPLETO_S", 0.0)
+    r = subir(cliente, "Brida V2.dxf", prefer="respond-async")
+    assert r.status_code == 202
+    assert r.headers["Preference-Applied"] == "respond-async"
+    assert r.json()["preflight"]["ruta"] == "simplificado" and r.json()["status_url"]
+
+
+def test_upload_rechaza_con_422(cliente):
+    r = subir(cliente, "Brida (1).dxf")
+    assert r.status_code == 422 and r.json()["preflight"]["ruta"] == "rechazado"
+
+
+def test_upload_demasiado_grande_responde_422(cliente, monkeypatch):
+    from app.services import dxf_processor
+    monkeypatch.setattr(dxf_processor, "MAX_EXTENSION_MM", 1000)
+    r = subir(cliente, "MC.dxf")
+    assert r.status_code == 422
+    assert "mide más de" in r.json()["error"]
+    assert r.json()["preflight"]["ruta"] == "sincrono"
@@ -0,0 +1,71 @@
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+import numpy as np
+from app.services.geometry import GeometriaDXF
+from app.services.preview import COLORES, MARGEN_PX, renderizar_png, renderizar_svg
+from conftest import subir
+
+
+def leer_png(datos: bytes) -> np.ndarray:
+    """Decodifica el PNG RGB sin filtros que escribe el renderizador."""
+    assert datos[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, idat = 8, b""
+    while pos < len(datos):
+        largo, tipo = struct.unpack(">I4s", datos[pos:pos + 8])
+        cuerpo = datos[pos + 8:pos + 8 + largo]
+        if tipo == b"IHDR":
+            ancho, alto = struct.unpack(">II", cuerpo[:8])
+        elif tipo == b"IDAT":
+            idat += cuerpo
+        pos += 12 + largo
+    filas = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(alto, ancho * 3 + 1)
+    assert not filas[:, 0].any()
+    return filas[:, 1:].reshape(alto, ancho, 3)
+
+
+def placa() -> GeometriaDXF:
+    return GeometriaDXF(
+        lineas=np.array([[0, 0, 200, 0], [200, 0, 200, 100], [200, 100, 0, 100], [0, 100, 0, 0]], dtype=np.float64),
+        circulos=np.array([[100, 50, 20]], dtype=np.float64),
+        arcos=np.array([[40, 50, 10, 0, 180]], dtype=np.float64),
+        total_entities=6,
+    )
+
+
+def test_png_a_escala_con_colores_por_tipo():
+    img = leer_png(renderizar_png(placa(), 220))
+    # Lado mayor = px, proporción de la pieza y margen blanco
+    assert img.shape[1] == 220 and img.shape[0] == 100 + 2 * MARGEN_PX
+    assert (img[:MARGEN_PX - 1] == 255).all()
+    colores = {tuple(c) for c in img.reshape(-1, 3)}
+    assert {COLORES["lineas"], COLORES["circulos"], COLORES["arcos"], (255, 255, 255)} <= colores
+    # Borde inferior de la placa sobre la última fila con margen (eje Y hacia abajo)
+    assert tuple(img[img.shape[0] - 1 - MARGEN_PX, 110]) == COLORES["lineas"]
+
+
+def test_svg_en_coordenadas_del_dxf():
+    raiz = ET.fromstring(renderizar_svg(placa()))
+    assert raiz.get("viewBox") == "0 -100 200 100"
+    paths = raiz.findall(".//{http://www.w3.org/2000/svg}path")
+    assert len(paths) == 3
+    assert {p.get("stroke") for p in paths} == {f"rgb{COLORES[t]}" for t in ("lineas", "circulos", "arcos")}
+
+
+def test_sin_geometria_no_hay_vista_previa():
+    assert renderizar_png(GeometriaDXF()) is None
+    assert renderizar_svg(GeometriaDXF()) is None
+
+
+def test_vista_previa_por_http(cliente):
+    r = subir(cliente, "Brida.dxf").json()
+    png = cliente.get(r["preview_png_url"])
+    assert png.status_code == 200 and png.headers["content-type"] == "image/png"
+    leer_png(png.content)
+    svg = cliente.get(r["preview_svg_url"])
+    assert svg.headers["content-type"].startswith("image/svg+xml")
+    ET.fromstring(svg.content)
+
+    assert cliente.get(r["preview_png_url"], headers={"If-None-Match": png.headers["ETag"]}).status_code == 304
+    assert cliente.get(f"/files/preview/{r['file_id']}.gif").status_code == 404
+    assert cliente.get(f"/files/preview/{'0' * 64}.png").status_code == 404
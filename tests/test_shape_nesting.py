@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from app.services.contours import construir_contornos
+from app.services.geometry import GeometriaDXF
+from app.services.nesting import anidar_rectangulos
+from app.services.shape_nesting import anidar_forma, huella_pieza
+
+
+def rectangulo(ancho, alto) -> GeometriaDXF:
+    esquinas = [(0, 0), (ancho, 0), (ancho, alto), (0, alto)]
+    lineas = [(*a, *b) for a, b in zip(esquinas, esquinas[1:] + esquinas[:1])]
+    return GeometriaDXF(lineas=np.array(lineas, dtype=np.float64), total_entities=4)
+
+
+@pytest.mark.parametrize("ancho, alto", [(250, 150), (97.3, 41.7), (31.0, 12.5)])
+@pytest.mark.parametrize("exacta", [True, False])
+def test_rectangulo_forma_no_peor_que_rect(ancho, alto, exacta):
+    geo = rectangulo(ancho, alto)
+    area = construir_contornos(geo).area_exterior if exacta else None
+    huella = huella_pieza(geo, area_exterior=area)
+
+    assert huella.area <= ancho * alto + 1e-6
+    assert huella.area == pytest.approx(ancho * alto, rel=0.02)
+    for hoja in [(2440, 1220), (3000, 1500), (1000, 500)]:
+        for rotacion in (True, False):
+            forma = anidar_forma(huella, *hoja, rotacion=rotacion)
+            rect = anidar_rectangulos(ancho, alto, *hoja, rotacion=rotacion)
+            assert forma.piezas >= rect.piezas
@@ -0,0 +1,86 @@
+import math
+import numpy as np
+import pytest
+from app.services import sheet_catalog
+from app.services.geometry import GeometriaDXF
+from app.services.shape_nesting import anidar_forma, huella_pieza, mascara_anidado
+from app.services.sheet_catalog import Hoja, elegir_hoja
+
+
+def pieza_en_l() -> GeometriaDXF:
+    puntos = [(0, 0), (120, 0), (120, 30), (30, 30), (30, 90), (0, 90)]
+    lineas = [(*a, *b) for a, b in zip(puntos, puntos[1:] + puntos[:1])]
+    return GeometriaDXF(lineas=np.array(lineas, dtype=np.float64), total_entities=len(lineas))
+
+
+def test_desperdicio_nunca_negativo():
+    # Cuatro piezas llenan la lámina exacta: el desperdicio es 0.0, no -0.0
+    eleccion = elegir_hoja("CR18", 1220, 610, kerf=0.0)
+    assert eleccion.piezas == 4
+    assert eleccion.desperdicio == 0.0 and math.copysign(1, eleccion.desperdicio) == 1
+    eleccion = elegir_hoja("CR18", 97.3, 41.7)
+    assert eleccion.desperdicio == round(eleccion.desperdicio, 2)
+
+
+def test_eleccion_por_forma_igual_a_evaluarlas_todas(monkeypatch):
+    hojas = tuple(Hoja(f"{a}x{b}", a, b, f) for a, b, f in
+                  [(2440, 1220, 1.0), (3000, 1500, 1.0), (1000, 700, 0.8), (800, 800, 0.7), (1500, 600, 0.9)])
+    monkeypatch.setattr(sheet_catalog, "catalogo", lambda material: hojas)
+    huella = huella_pieza(pieza_en_l())
+
+    def costo(hoja):
+        piezas = anidar_forma(huella, hoja.ancho, hoja.alto).piezas
+        return hoja.factor_precio * (2 - piezas * huella.area / (hoja.ancho * hoja.alto))
+
+    eleccion = elegir_hoja("CR18", huella.ancho, huella.alto, huella)
+    assert eleccion.hoja == min(hojas, key=costo)
+    assert eleccion == elegir_hoja("CR18", huella.ancho, huella.alto, huella)
+
+
+def test_sin_anidado_por_forma_usa_rectangulos(monkeypatch):
+    monkeypatch.setattr(sheet_catalog, "HOJAS_FORMA", 0)
+    huella = huella_pieza(pieza_en_l())
+    por_rect = elegir_hoja("CR18", huella.ancho, huella.alto)
+    assert elegir_hoja("CR18", huella.ancho, huella.alto, huella).hoja == por_rect.hoja
+
+
+def test_imagen_de_forma_coloca_las_piezas_cotizadas():
+    huella = huella_pieza(pieza_en_l())
+    resultado = anidar_forma(huella, 1000, 700)
+    assert resultado.metodo != "rectangulos"
+    etiquetas, _, _ = mascara_anidado(huella, resultado)
+    por_motivo = 2 if resultado.metodo == "pareja" else 1
+    assert int(etiquetas.max()) * por_motivo == resultado.piezas
+
+
+RETAL = Hoja("retal-01", 1000, 700, factor_precio=0.5, retal=True)
+
+
+def test_retal_abarata_lo_que_depende_del_material(monkeypatch):
+    from app.services.dxf_processor import cotizar_matriz
+    geometria = {"ancho": 300.0, "alto": 200.0, "total_perimeter": 1000.0, "longitud_lineas": 0.0,
+                 "perforaciones": 1, "recorrido_vacio_mm": 0.0}
+    completa = cotizar_matriz(geometria, ["CR18"], [1])
+    monkeypatch.setattr(sheet_catalog, "catalogo", lambda material: (RETAL,))
+    retal = cotizar_matriz(geometria, ["CR18"], [1])
+    assert retal["hojas"][0].hoja == RETAL
+    for clave in ("costo_material", "transporte_mat", "almacenaje_mat"):
+        assert retal[clave][0] == pytest.approx(completa[clave][0] * 0.5)
+
+
+def test_pedido_se_anida_en_la_lamina_del_catalogo(cliente, monkeypatch):
+    from conftest import subir
+    monkeypatch.setattr(sheet_catalog, "catalogo", lambda material: (RETAL,))
+    file_id = subir(cliente, "Brida.dxf").json()["file_id"]
+    r = cliente.post("/files/nesting/pedido", json={"material": "CR18", "piezas": [{"file_id": file_id, "cantidad": 3}]})
+    assert r.status_code == 200
+    assert r.json()["hoja"] == {"ancho": 1000, "alto": 700, "nombre": "retal-01", "retal": True}
+
+
+def test_hoja_pedido_sirve_para_todas_las_piezas(monkeypatch):
+    chica, grande = Hoja("chica", 500, 500, 0.5, True), Hoja("grande", 2000, 1000)
+    monkeypatch.setattr(sheet_catalog, "catalogo", lambda material: (chica, grande))
+    # La pieza con más área entra en la chica, la otra no: se usa la grande
+    piezas = [("a", 100, 100, 50), ("b", 900, 400, 1)]
+    assert sheet_catalog.hoja_pedido("CR18", piezas) == grande
+    assert sheet_catalog.hoja_pedido("CR18", piezas[:1]) == chica
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import os
+import time
+import pytest
+from app.services import storage
+from conftest import subir
+
+
+def crear(directorio, nombre, edad_s, tam=10):
+    ruta = os.path.join(directorio, nombre)
+    with open(ruta, "wb") as f:
+        f.write(b"x" * tam)
+    fecha = time.time() - edad_s
+    os.utime(ruta, (fecha, fecha))
+    return ruta
+
+
+def test_borra_por_ttl_salvo_lo_que_esta_en_uso(tmp_path):
+    viejo = crear(tmp_path, "a.dxf", 10_000)
+    cotizado = crear(tmp_path, "b.dxf", 10_000)
+    reciente = crear(tmp_path, "c.dxf", 700)
+    temporal = crear(tmp_path, "d.part", 700)
+
+    resultado = storage.limpiar_artefactos([str(tmp_path)], ttl_s=3600, en_uso={cotizado})
+
+    assert resultado["borrados"] == 2
+    assert not os.path.exists(viejo) and not os.path.exists(temporal)
+    assert os.path.exists(cotizado) and os.path.exists(reciente)
+
+
+def test_registrar_acceso_renueva_la_fecha(tmp_path):
+    ruta = crear(tmp_path, "a.dxf", 10_000)
+    storage.registrar_acceso(ruta)
+    storage.limpiar_artefactos([str(tmp_path)], ttl_s=3600)
+    assert os.path.exists(ruta)
+
+
+def test_por_tamano_borra_los_menos_usados(tmp_path):
+    rutas = [crear(tmp_path, f"{k}.png", 5_000 - k * 100, tam=100) for k in range(10)]
+    storage.limpiar_artefactos([str(tmp_path)], max_bytes=500, ttl_s=1e9)
+    quedan = [os.path.exists(r) for r in rutas]
+    assert quedan == [False] * 6 + [True] * 4
+
+
+class UploadFalso:
+    """Lo mínimo de UploadFile que usa guardar_upload: read() por bloques."""
+
+    def __init__(self, datos: bytes):
+        self.datos, self.leidos = datos, []
+
+    async def read(self, n: int) -> bytes:
+        bloque, self.datos = self.datos[:n], self.datos[n:]
+        self.leidos.append(len(bloque))
+        return bloque
+
+
+def test_guardar_upload_por_bloques_con_nombre_por_contenido(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "CHUNK_BYTES", 1000)
+    datos = os.urandom(4500)
+    falso = UploadFalso(datos)
+    ruta, sha, tam = asyncio.run(storage.guardar_upload(falso, str(tmp_path)))
+    assert sha == hashlib.sha256(datos).hexdigest() and tam == 4500
+    assert ruta == os.path.join(str(tmp_path), f"{sha}.dxf")
+    assert max(falso.leidos) == 1000
+    with open(ruta, "rb") as f:
+        assert f.read() == datos
+    # El mismo contenido otra vez reutiliza el archivo
+    assert asyncio.run(storage.guardar_upload(UploadFalso(datos), str(tmp_path)))[0] == ruta
+    assert os.listdir(tmp_path) == [os.path.basename(ruta)]
+
+
+def test_guardar_upload_corta_al_pasar_el_maximo(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "CHUNK_BYTES", 1000)
+    falso = UploadFalso(b"x" * 10_000)
+    with pytest.raises(storage.ArchivoDemasiadoGrande):
+        asyncio.run(storage.guardar_upload(falso, str(tmp_path), max_bytes=2500))
+    # No se leyó el resto ni queda el temporal
+    assert sum(falso.leidos) == 3000
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_demasiado_grande_responde_413(cliente, monkeypatch):
+    from app.routers import files
+    monkeypatch.setattr(files, "MAX_UPLOAD_BYTES", 100)
+    monkeypatch.setattr(files, "CHUNK_MARGEN", 0)
+    r = subir(cliente, "Brida.dxf")
+    assert r.status_code == 413
+
+
+@pytest.fixture
+def limpiezas(monkeypatch):
+    llamadas = []
+    monkeypatch.setattr(storage, "LIMPIEZA_INTERVALO_S", 0.02)
+    monkeypatch.setattr(storage, "limpiar_artefactos",
+                        lambda directorios, en_uso=(): llamadas.append((directorios, set(en_uso))))
+    return llamadas
+
+
+def test_la_app_limpia_periodicamente_sin_tocar_lo_cotizado(limpiezas, cliente):
+    from app.routers import files
+    assert storage._tarea is not None and not storage._tarea.done()
+    file_id = subir(cliente, "Brida.dxf").json()["file_id"]
+    ruta = os.path.join(files.UPLOAD_DIR, f"{file_id}.dxf")
+    limite = time.time() + 5
+    while not any(ruta in en_uso for _, en_uso in limpiezas) and time.time() < limite:
+        time.sleep(0.02)
+    directorios, en_uso = limpiezas[-1]
+    assert directorios == files.ARTEFACTOS and ruta in en_uso